@@ -1,11 +1,22 @@
 import os
 from dotenv import load_dotenv
 import json
-from openai import AsyncOpenAI
 import time
 import asyncio
 import random
 import logging
+from lookup_cache import LookupCache, prompt_key
+from single_flight import SingleFlight
+from response_poller import ResponsePoller
+from rate_limiter import AdaptiveRateLimiter
+from openai_client import HTTPClientSettings, PoolMetrics, create_openai_client
+from phone_numbers import has_valid_number
+from prompt_builder import prompt_fields
+from failures import BAD_JSON, MODEL_FAILURE, OTHER, TIMEOUT, CircuitBreaker, LookupFailure, as_lookup_failure
+from lookup_tiers import DEFAULT_LOOKUP_TIERS, PageFetcher, TierStats, parse_tiers, search_context_size
+from hedging import HedgePolicy
+from scheduler import FairScheduler
+from metrics import RESPONSES, RETRIES, add_stages, collect_stages, record_stage, timed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -13,17 +24,161 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-client_openai = AsyncOpenAI(api_key= os.getenv("OPENAI_API_KEY"))
+# Pool size, keepalive, HTTP/2 and timeouts come from OPENAI_HTTP_* (see openai_client.py)
+pool_metrics = PoolMetrics()
+client_openai = create_openai_client(HTTPClientSettings.from_env(), pool_metrics, api_key=os.getenv("OPENAI_API_KEY"))
+
+# Persistent cache of previous lookups, keyed on the normalized prompt
+lookup_cache = LookupCache.from_env()
+
+# Identical prompts in flight at the same time share one OpenAI call
+single_flight = SingleFlight()
+
+# One poller tracks every pending background response instead of a polling loop per call
+response_poller = ResponsePoller.from_env(client_openai)
+
+# Pauses every OpenAI call while most recent calls fail with server errors, timeouts or failed responses
+circuit_breaker = CircuitBreaker.from_env()
+
+# A background response still unfinished this many seconds after it was sent is cancelled (also on
+# OpenAI's side) and the lookup fails with a timeout, to be retried later like any other failure
+LOOKUP_TIMEOUT_SECONDS = float(os.getenv("LOOKUP_TIMEOUT_SECONDS", 180))
+
+# LOOKUP_TIMEOUT_SECONDS bounds one call; this bounds a whole lookup of a row (every tier, in-place
+# retry and phone retry). Past it the lookup is cancelled and fails with a timeout. 0 disables it.
+ROW_DEADLINE_SECONDS = float(os.getenv("ROW_DEADLINE_SECONDS", 600))
+
+# Responses pending longer than the p95 of recent ones get a duplicate request; the first to finish wins
+hedge_policy = HedgePolicy.from_env()
+
+# Failed calls are retried in place only if the wait is at most this many seconds; longer waits
+# become deferred row retries (ROW_RETRY_*)
+INLINE_RETRY_MAX_DELAY = float(os.getenv("INLINE_RETRY_MAX_DELAY", 5))
+
+# Cheap-first lookup: the row's own web page, then low-context search, then high (see lookup_tiers.py)
+LOOKUP_TIERS = parse_tiers(os.getenv("LOOKUP_TIERS", DEFAULT_LOOKUP_TIERS))
+page_fetcher = PageFetcher.from_env()
+
+# Shared by every job in the process: RPM/TPM buckets plus an adaptive concurrency window
+rate_limiter = AdaptiveRateLimiter.from_env()
+
+# Shares the rate limiter's concurrency window between jobs by priority weight (see scheduler.py)
+api_scheduler = FairScheduler.from_env(lambda: rate_limiter.concurrency)
+
+SYSTEM_PROMPT = "You are a web search agent. You will be given a business name or  business address or business web page and you have to return contact numbers of the business by searching web. You have to provide 100% accurate information. (If you find multiple contact numbers, list them all)"
+
+BUSINESS_INFO_FORMAT = {
+    "type": "json_schema",
+    "name": "business_info",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "business_name": {
+                "type": "string",
+                "description": "The name of the business."
+            },
+            "business_address": {
+                "type": "string",
+                "description": "The address where the business is located."
+            },
+            "contact_numbers": {
+                "type": "array",
+                "description": "A list of contact numbers for the business.",
+                "items": {
+                    "type": "string",
+                    "description": "A single contact number for the business."
+                }
+            },
+            "search_resources": {
+                "type": "string",
+                "description": "Resources available for searching related business information."
+            }
+        },
+        "required": [
+            "business_name",
+            "business_address",
+            "contact_numbers",
+            "search_resources"
+        ],
+        "additionalProperties": False
+    }
+}
+
+# Everything except the user prompt is identical for every call, so the request body is built once
+SEARCH_REQUEST_TEMPLATE = {
+    "model": "gpt-4.1-mini",
+    "text": {"format": BUSINESS_INFO_FORMAT},
+    "reasoning": {},
+    "tools": [
+        {
+            "type": "web_search_preview",
+            "search_context_size": "high",
+            "user_location": {"type": "approximate", "country": "US"}
+        }
+    ],
+    "tool_choice": "required",
+    "temperature": 1,
+    "max_output_tokens": 2048,
+    "top_p": 1,
+    "store": True,
+    "background": True,
+}
+_SYSTEM_MESSAGE = {"role": "system", "content": [{"type": "input_text", "text": SYSTEM_PROMPT}]}
+
+def search_request_template(context_size):
+    """SEARCH_REQUEST_TEMPLATE with a different web search context size."""
+    tools = [{**tool, "search_context_size": context_size} for tool in SEARCH_REQUEST_TEMPLATE["tools"]]
+    return {**SEARCH_REQUEST_TEMPLATE, "tools": tools}
+
+# Request template per search tier in LOOKUP_TIERS (search_low, search_medium, search_high)
+SEARCH_TIER_TEMPLATES = {
+    tier: search_request_template(search_context_size(tier)) for tier in LOOKUP_TIERS if search_context_size(tier)
+}
+
+# Foreground variants for callers waiting on a single answer (the /lookup API): the create call returns
+# the finished response, skipping the background queue and the poll interval
+FOREGROUND_REQUEST_TEMPLATE = {**SEARCH_REQUEST_TEMPLATE, "background": False}
+FOREGROUND_TIER_TEMPLATES = {tier: {**template, "background": False} for tier, template in SEARCH_TIER_TEMPLATES.items()}
+
+# Extra searches for a row whose answer had no valid NANP/E.164 number (0 disables the retry)
+PHONE_RETRY_ATTEMPTS = int(os.getenv("PHONE_RETRY_ATTEMPTS", 1))
+PHONE_RETRY_HINT = (
+    "\n\nA previous search returned no valid phone number for this business. Check the business's own"
+    " website, its Google Business Profile and directory listings, and return complete 10-digit numbers"
+    " including the area code."
+)
+
+def build_search_request(prompt, template=SEARCH_REQUEST_TEMPLATE):
+    """Request body for one lookup: the shared template plus the user prompt (template objects are reused, not copied)."""
+    body = dict(template)
+    body["input"] = [_SYSTEM_MESSAGE, {"role": "user", "content": [{"type": "input_text", "text": prompt}]}]
+    return body
+
+def _error_headers(error):
+    """Response headers attached to an OpenAI API error, if any."""
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or getattr(error, "headers", None) or {}
+
+def estimate_tokens(prompt):
+    """Rough TPM cost of one call, charged up front (input estimate + max output tokens)."""
+    return len(prompt) // 4 + 200 + 2048
 
 # Retry decorator with exponential backoff for async functions
 def async_retry_with_exponential_backoff(
     initial_delay: float = 1,
     exponential_base: float = 2,
     jitter: bool = True,
-    max_retries: int = 5,
-    retry_status_codes: tuple = (429, 500, 502),
+    max_retries: int = 2,
+    retry_status_codes: tuple = (429, 500, 502, 503, 504),
+    max_inline_delay: float = INLINE_RETRY_MAX_DELAY,
 ):
-    """Retry an async function with exponential backoff."""
+    """
+    Retry an async function with exponential backoff, but only for short delays.
+
+    Anything that would need a longer wait is raised as a classified LookupFailure instead,
+    so the caller can defer the whole row rather than keep a worker sleeping.
+    """
     def decorator(func):
         async def wrapper(*args, **kwargs):
             num_retries = 0
@@ -35,139 +190,284 @@ def async_retry_with_exponential_backoff(
                 except Exception as e:
                     # Check if it's a status code error we should retry
                     status_code = getattr(e, "status_code", None)
-                    if status_code in retry_status_codes and num_retries < max_retries:
+                    retry_after = _error_headers(e).get("retry-after")
+                    if retry_after and retry_after.isdigit():
+                        # Use the retry-after header value if available
+                        delay = float(retry_after)
+                    else:
+                        # Calculate backoff with jitter
+                        delay = exponential_base ** (num_retries + 1) * initial_delay
+                        if jitter:
+                            delay *= (1 + random.random())
+                    if status_code in retry_status_codes and num_retries < max_retries and delay <= max_inline_delay:
                         num_retries += 1
-                        retry_after = getattr(e, "headers", {}).get("retry-after")
-                        
-                        if retry_after and retry_after.isdigit():
-                            # Use the retry-after header value if available
-                            delay = float(retry_after)
-                        else:
-                            # Calculate backoff with jitter
-                            delay = exponential_base ** num_retries * initial_delay
-                            if jitter:
-                                delay *= (1 + random.random())
-                        
+                        RETRIES.inc(status_code=status_code)
                         logger.warning(
                             f"Rate limit or server error ({status_code}) hit. Retrying in {delay:.2f} seconds. "
                             f"Retry {num_retries}/{max_retries}"
                         )
                         await asyncio.sleep(delay)
                     else:
-                        # Either not a retryable error or max retries exceeded
+                        # Not retryable here: hand a classified failure to the caller's retry queue
                         logger.error(f"API request failed: {str(e)}")
-                        raise
+                        raise as_lookup_failure(e, delay if retry_after else None) from e
         return wrapper
     return decorator
 
-async def llm_contact_search(business_info):
-    structured_result = await openai_completion_with_backoff(business_info)
-    json_result = json.loads(structured_result)
+async def llm_contact_search(business_info, tier_stats=None, foreground=False):
+    """
+    Contact details for a prompt: the cache first, then each of LOOKUP_TIERS until one finds a
+    valid phone number. Attempts, hits, latency and cost per tier are added to `tier_stats`.
+    `foreground=True` waits on each model call's HTTP request instead of creating a background
+    response and polling it (lower latency for a single lookup, but the connection is held open).
+
+    Concurrent lookups of a prompt share one search, but only between callers of the same
+    scheduler priority: an interactive lookup never waits on a call scheduled at a bulk job's
+    weight. Every caller gets the shared search's tier attempts and stage timings in its own
+    `tier_stats` and row trace; its tokens and cost are counted once, for the caller that started it.
+    """
+    start = time.perf_counter()
+    cached_result = await lookup_cache.aget(business_info)
+    if tier_stats is not None:
+        tier_stats.record("cache", cached_result is not None, time.perf_counter() - start)
+    if cached_result is not None:
+        return cached_result
+
+    started_here = False
+
+    def start_search():
+        nonlocal started_here
+        started_here = True
+        return _shared_search(business_info, foreground)
+
+    key = f"{api_scheduler.current_priority()}:{prompt_key(business_info)}"
+    result, error, counters, stages = await single_flight.do(key, start_search)
+    if tier_stats is not None:
+        tier_stats.merge(counters, usage=started_here)
+    add_stages(stages)
+    if error is not None:
+        raise error
+    return result
+
+async def _shared_search(business_info, foreground=False):
+    """A search with its own tier counters and stage timings, so every caller sharing it can add them to its own."""
+    tier_stats = TierStats()
+    with collect_stages() as stages:
+        try:
+            return await _search_and_cache(business_info, tier_stats, foreground), None, tier_stats.counters, stages
+        except Exception as e:
+            return None, e, tier_stats.counters, stages
+
+def _parse_result(structured_result):
+    """Structured output of a lookup as a dict; malformed output is a retryable failure."""
+    try:
+        with timed("parse"):
+            result = json.loads(structured_result)
+    except ValueError as e:
+        raise LookupFailure(BAD_JSON, f"Malformed structured output: {e}") from e
+    if not isinstance(result, dict):
+        raise LookupFailure(BAD_JSON, "Structured output is not a JSON object")
+    return result
+
+async def _search_and_cache(business_info, tier_stats=None, foreground=False):
+    """Run the lookup tiers for a prompt within ROW_DEADLINE_SECONDS and cache the answer."""
+    try:
+        json_result = await asyncio.wait_for(_search_tiers(business_info, tier_stats, foreground),
+                                             ROW_DEADLINE_SECONDS or None)
+    except asyncio.TimeoutError:
+        raise LookupFailure(TIMEOUT, f"Lookup not finished after {ROW_DEADLINE_SECONDS:.0f}s "
+                                     "across tiers and retries; cancelled") from None
+    await lookup_cache.aset(business_info, json_result)
     return json_result
-    
-@async_retry_with_exponential_backoff()
-async def openai_completion_with_backoff(prompt):
-    response = await client_openai.responses.create(
-        model="gpt-4.1-mini",
-        input=[
-            {
-            "role": "system",
-            "content": [
-                {
-                "type": "input_text",
-                "text": "You are a web search agent. You will be given a business name or  business address or business web page and you have to return contact numbers of the business by searching web. You have to provide 100% accurate information. (If you find multiple contact numbers, list them all)"
-                }
-            ]
-            },
-            {
-            "role": "user",
-            "content": [
-                {
-                "type": "input_text",
-                "text": prompt
-                }
-            ]
-            }
-        ],
-        text={
-            "format": {
-            "type": "json_schema",
-            "name": "business_info",
-            "strict": True,
-            "schema": {
-                "type": "object",
-                "properties": {
-                "business_name": {
-                    "type": "string",
-                    "description": "The name of the business."
-                },
-                "business_address": {
-                    "type": "string",
-                    "description": "The address where the business is located."
-                },
-                "contact_numbers": {
-                    "type": "array",
-                    "description": "A list of contact numbers for the business.",
-                    "items": {
-                    "type": "string",
-                    "description": "A single contact number for the business."
-                    }
-                },
-                "search_resources": {
-                    "type": "string",
-                    "description": "Resources available for searching related business information."
-                }
-                },
-                "required": [
-                "business_name",
-                "business_address",
-                "contact_numbers",
-                "search_resources"
-                ],
-                "additionalProperties": False
-            }
-            }
-        },
-        reasoning={},
-        tools=[
-            {
-            "type": "web_search_preview",
-            "search_context_size": "high",
-            "user_location": {
-                "type": "approximate",
-                # "city": null,
-                "country": "US",
-                # "region": null,
-                # "timezone": null
-            }
-            }
-        ],
-        tool_choice="required",
-        temperature=1,
-        max_output_tokens=2048,
-        top_p=1,
-        store=True,
-        background=True,
-        )
-    
-    print(f"Initial status: {response.status}")
-    
-    while response.status in {"queued", "in_progress"}:
-        await asyncio.sleep(2)
-        response = await client_openai.responses.retrieve(response.id)
-        
-    if response.status == "completed":
-        return response.output[1].content[0].text
+
+async def _search_tiers(business_info, tier_stats=None, foreground=False):
+    tier_stats = tier_stats if tier_stats is not None else TierStats()
+    templates = FOREGROUND_TIER_TEMPLATES if foreground else SEARCH_TIER_TEMPLATES
+    json_result = None
+    tiers = [tier for tier in LOOKUP_TIERS if tier == "web_page" or tier in SEARCH_TIER_TEMPLATES]
+    for i, tier in enumerate(tiers):
+        start = time.perf_counter()
+        usage = {}
+        try:
+            if tier == "web_page":
+                with timed("page_fetch"):
+                    result = await page_fetcher.lookup(prompt_fields(business_info))
+                if result is None:
+                    continue  # no web page to look at; not counted as an attempt
+            else:
+                result = _parse_result(await openai_completion_with_backoff(business_info, templates[tier], usage))
+        except Exception as e:
+            # A cheap tier failing just means escalating; the last tier's error is the row's error
+            # (so a row isn't cached with a cheaper tier's empty answer while the provider is down)
+            if i == len(tiers) - 1:
+                raise
+            logger.warning(f"Lookup tier {tier} failed, escalating: {e}")
+            tier_stats.record(tier, False, time.perf_counter() - start, usage)
+            continue
+        found = has_valid_number(result.get("contact_numbers", []))
+        tier_stats.record(tier, found, time.perf_counter() - start, usage)
+        # A search answer without numbers still beats a page that had none
+        if json_result is None or found or tier != "web_page":
+            json_result = result
+        if found:
+            break
     else:
-        error_msg = f"Request failed with status: {response.status}"
-        if hasattr(response, 'error'):
-            error_msg += f" - Error: {response.error}"
-        # raise Exception(error_msg)
-        print(error_msg)
-        return {"business_name": "", "business_address": "", "contact_numbers": [], "search_resources": ""}
+        # A targeted retry for lookups that came back without a single valid phone number
+        for _ in range(PHONE_RETRY_ATTEMPTS):
+            if json_result is not None and has_valid_number(json_result.get("contact_numbers", [])):
+                break
+            start = time.perf_counter()
+            usage = {}
+            json_result = _parse_result(await openai_completion_with_backoff(
+                business_info + PHONE_RETRY_HINT, FOREGROUND_REQUEST_TEMPLATE if foreground else SEARCH_REQUEST_TEMPLATE,
+                usage))
+            tier_stats.record("retry", has_valid_number(json_result.get("contact_numbers", [])),
+                              time.perf_counter() - start, usage)
+    if json_result is None:
+        raise LookupFailure(OTHER, f"No lookup tier could run (LOOKUP_TIERS={','.join(LOOKUP_TIERS)})")
+    return json_result
     
+@async_retry_with_exponential_backoff()
+async def openai_completion_with_backoff(prompt, template=SEARCH_REQUEST_TEMPLATE, usage=None):
+    """Structured output text of one web-search response; token and search-call counts go into `usage`."""
+    estimated_tokens = estimate_tokens(prompt)
+    waiting = time.perf_counter()
+    async with circuit_breaker.guard(), api_scheduler.slot(), rate_limiter.slot(estimated_tokens):
+        # Time spent held back by the circuit breaker, the job scheduler and the rate limiter's buckets
+        record_stage("slot_wait", time.perf_counter() - waiting)
+        try:
+            response = await asyncio.wait_for(_hedged_response(prompt, template, estimated_tokens),
+                                              LOOKUP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            RESPONSES.inc(status="timeout")
+            raise LookupFailure(TIMEOUT, f"No response after {LOOKUP_TIMEOUT_SECONDS:.0f}s; cancelled") from None
+        RESPONSES.inc(status=response.status)
+        response_usage = getattr(response, "usage", None)
+        rate_limiter.record_usage(estimated_tokens, getattr(response_usage, "total_tokens", None))
+        if usage is not None:
+            usage.update(
+                input_tokens=getattr(response_usage, "input_tokens", 0) or 0,
+                output_tokens=getattr(response_usage, "output_tokens", 0) or 0,
+                search_calls=sum(1 for item in response.output or [] if item.type == "web_search_call"),
+            )
+
+        if response.status != "completed":
+            # Failed, incomplete or cancelled background responses count against the circuit breaker
+            error_msg = f"Request failed with status: {response.status}"
+            if getattr(response, "error", None):
+                error_msg += f" - Error: {response.error}"
+            elif getattr(response, "incomplete_details", None):
+                error_msg += f" - {response.incomplete_details}"
+            raise LookupFailure(MODEL_FAILURE, error_msg)
+
+    # The structured output is the last message (web search calls come first)
+    messages = [item for item in response.output if item.type == "message"]
+    if not messages:
+        raise LookupFailure(MODEL_FAILURE, "Response has no message output")
+    return messages[-1].content[0].text
+
+async def _hedged_response(prompt, template, estimated_tokens):
+    """
+    Final state of a response for `prompt`. If it is still pending after the hedge delay, an
+    identical request is sent as well and the first one to complete is returned; whatever is
+    still running when this returns (or is cancelled) is cancelled remotely before it returns.
+    """
+    kind = template["tools"][0]["search_context_size"] + ("" if template["background"] else "/foreground")
+    start = time.monotonic()
+    hedge_policy.start_call()
+    primary = asyncio.ensure_future(_background_response(prompt, template))
+    started = [primary]
+    try:
+        delay = hedge_policy.hedge_delay(kind)
+        if delay is not None:
+            await asyncio.wait(started, timeout=delay)
+            if not primary.done() and hedge_policy.try_hedge():
+                logger.info(f"Response pending for {delay:.1f}s (p95), sending a hedged request")
+                started.append(asyncio.ensure_future(_extra_response(prompt, template, estimated_tokens)))
+        pending, outcome = set(started), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status == "completed":
+                    hedge_policy.record(kind, time.monotonic() - start)
+                    if task is not primary:
+                        hedge_policy.hedge_won()
+                    return task.result()
+                if outcome is None or task is primary:
+                    outcome = task
+        # Neither request completed: report the primary's failure
+        return outcome.result()
+    finally:
+        for task in started:
+            task.cancel()
+        # Wait for the losers to unwind, so their responses are cancelled remotely and their errors retrieved
+        await asyncio.gather(*started, return_exceptions=True)
+
+async def _extra_response(prompt, template, estimated_tokens):
+    """A hedged request; it needs a scheduler and rate limiter slot of its own."""
+    async with api_scheduler.slot(), rate_limiter.slot(estimated_tokens):
+        return await _background_response(prompt, template)
+
+async def _background_response(prompt, template):
+    """
+    Create a background response and wait for its final state; cancelling the wait cancels the
+    response. A foreground template's create call already returns the final state.
+    """
+    # Shielded: cancelling the wait must not abandon a create call OpenAI may already be running
+    create = asyncio.ensure_future(_create_response(prompt, template))
+    try:
+        with timed("create" if template["background"] else "foreground"):
+            raw_response = await asyncio.shield(create)
+    except asyncio.CancelledError:
+        if template["background"]:
+            # Cancel the response as soon as it exists
+            create.add_done_callback(_cancel_created)
+        else:
+            create.cancel()
+        raise
+    except Exception as e:
+        if getattr(e, "status_code", None) == 429:
+            rate_limiter.on_rate_limited(_error_headers(e))
+        raise
+    rate_limiter.on_success(raw_response.headers)
+    response = raw_response.parse()
+    logger.debug(f"Created response {response.id} ({response.status})")
+    if not template["background"]:
+        return response
+
+    try:
+        return await response_poller.wait(response)
+    except asyncio.CancelledError:
+        # Timed out, lost to a hedge or the job was cancelled: stop paying for the response
+        cancel_response(response.id)
+        raise
 
+# Remote cancellations still running; they are not awaited by the cancelled caller
+_cancellations = set()
 
+def _cancel_created(create: asyncio.Future) -> None:
+    """Done callback of a create call whose caller was cancelled: cancel the response it created."""
+    if create.cancelled() or create.exception() is not None:
+        return
+    cancel_response(create.result().parse().id)
 
+def cancel_response(response_id):
+    """Cancel a background response on OpenAI's side without waiting for the call to finish."""
+    async def _cancel():
+        try:
+            await client_openai.responses.cancel(response_id)
+        except Exception as e:
+            logger.warning(f"Could not cancel response {response_id}: {e}")
 
+    task = asyncio.ensure_future(_cancel())
+    _cancellations.add(task)
+    task.add_done_callback(_cancellations.discard)
 
+async def _create_response(prompt, template=SEARCH_REQUEST_TEMPLATE):
+    """Create the web-search response; returns the raw response so headers are available."""
+    # Passing the prebuilt body as extra_body skips the SDK's per-call typed-dict transform
+    if template["background"]:
+        return await client_openai.responses.with_raw_response.create(extra_body=build_search_request(prompt, template))
+    # A foreground response arrives when the search is done, which can take longer than the client's read timeout
+    return await client_openai.responses.with_raw_response.create(extra_body=build_search_request(prompt, template),
+                                                                  timeout=LOOKUP_TIMEOUT_SECONDS)
@@ -1,69 +1,407 @@
-from WebSearchLLM import llm_contact_search
+"""
+Headless batch runner: looks up every row of a CSV file and writes the results to another CSV,
+without the web server (e.g. nightly runs from cron):
+
+    python app.py --input data.csv --output output.csv
+    python app.py --input big.csv --output out_0.csv --shard 0/4      # one of 4 processes or machines
+    python app.py merge out_0.csv out_1.csv out_2.csv out_3.csv --output output.csv
+
+The input is read --chunk-rows rows at a time and a few chunks are looked up at once, so memory
+stays flat for multi-million-row files. Results are appended to the output in input order, and
+after every chunk a checkpoint (<output>.checkpoint.json) records how far the output got: a run
+that is killed or crashes resumes after its last written chunk when started again with the same
+arguments. In batch mode, chunks are collected into Batch API jobs of up to BATCH_MAX_REQUESTS
+prompts, and requests that fail for a retryable reason go out again in follow-up batches.
+
+With --shard i/N a process only looks up the rows whose duplicate-detection key falls into shard i,
+so all copies of a business land on the same shard. Shard outputs carry a row_index column, and
+`merge` interleaves the finished shards back into input order. Progress goes to stderr as one
+JSON object per line; --verbose also logs every prompt and result.
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import heapq
+import itertools
 import asyncio
+import argparse
+import logging
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-# llm_contact_search function returns a dictionary: {"business_name": "Balloons Boutique SA", "business_address": "10828 Gulfdale St Suite B, San Antonio, TX 78216", "contact_numbers": ["210-617-7200","210-347-2236"],"search_resources": "(balloonsboutiquesa.shop, balloonsboutiquesa.com)"} 
-from typing import Dict, List
 import pandas as pd
 
-df = pd.read_csv('data.csv')
-
-OUTPUT_CSV         = "output.csv"   # where we store the LLM results
-CONCURRENCY_LIMIT  = 1000           # how many parallel calls to allow
-                                     # (tune to avoid API throttling)
-
-# columns are Business_Name, Address, web_page, other_info
-
-async def process_row(row: pd.Series) -> None:
-    prompt_parts = []
-
-    if pd.notna(row.get("Business_Name")):
-        prompt_parts.append(f"Business Name: {row['Business_Name']}")
-    if pd.notna(row.get("Address")):
-        prompt_parts.append(f"Address: {row['Address']}")
-    if pd.notna(row.get("web_page")):
-        prompt_parts.append(f"web_page: {row['web_page']}")
-    if pd.notna(row.get("other_info")):
-        prompt_parts.append(f"other_info: {row['other_info']}")
-
-    prompt = ", ".join(prompt_parts)
-    print("Prompt ->", prompt)
-
-    # --- call the LLM and await the result -----------------------------------
-    result = await llm_contact_search(prompt)
-    print("LLM result ->", result)
-    return {
-        "business_name":    result.get("business_name", ""),
-        "business_address": result.get("business_address", ""),
-        "contact_numbers":  ", ".join(result.get("contact_numbers", [])),  # store list as csv-friendly string
-        "search_resources": result.get("search_resources", ""),
+from contact_rows import ERROR_PREFIX, OUTPUT_COLUMNS, format_result, error_result
+from phone_numbers import normalize_phone_numbers, unverified_phone_numbers
+from preprocess import dedup_keys
+from prompt_builder import build_prompts, canonical_columns
+from lookup_tiers import TierStats
+from failures import RetryPolicy
+
+logger = logging.getLogger("app")
+
+INPUT_CSV          = "data.csv"     # default input
+OUTPUT_CSV         = "output.csv"   # default output (results in input order)
+PROCESSING_MODE    = os.getenv("PROCESSING_MODE", "realtime")
+                                     # "realtime": one background response per row
+                                     # "batch":    OpenAI Batch API, cheaper but can take up to 24h
+CHUNK_ROWS         = 2000           # input rows per chunk (one checkpoint per chunk)
+CHUNKS_IN_FLIGHT   = 4              # chunks looked up at once, so slow rows at the end of a chunk
+                                     # don't leave the rate limiter's window idle
+BATCHES_IN_FLIGHT  = 10             # batch mode: batches of up to BATCH_MAX_REQUESTS prompts
+                                     # waiting on the Batch API at once
+PROGRESS_SECONDS   = 30             # how often a progress line is logged
+
+# Options that override the environment variables read when WebSearchLLM is imported
+RATE_OPTIONS = {
+    "concurrency": "OPENAI_MAX_CONCURRENCY",
+    "initial_concurrency": "OPENAI_INITIAL_CONCURRENCY",
+    "rpm": "OPENAI_RPM_LIMIT",
+    "tpm": "OPENAI_TPM_LIMIT",
+}
+
+tier_stats = TierStats()             # attempts / hit rate / latency / cost per lookup tier (LOOKUP_TIERS)
+retry_policy = RetryPolicy.from_env()  # rounds and backoff for rows that failed (ROW_RETRY_*)
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """"i/N" -> (i, N), for --shard."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N (e.g. 0/4), got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{count - 1}, got {value!r}")
+    return index, count
+
+
+def checkpoint_path(output: str) -> str:
+    return f"{output}.checkpoint.json"
+
+
+def _emit(event: str, **fields) -> None:
+    """One structured progress line on stderr (stdout stays free for the caller)."""
+    print(json.dumps({"event": event, **fields}), file=sys.stderr, flush=True)
+
+
+class Checkpoint:
+    """
+    How far a run got: chunks written and the output size after the last one. The output is
+    truncated back to that size on resume, so a chunk half-written by a killed run is redone.
+    """
+
+    def __init__(self, path: str, settings: Dict, chunks_done: int = 0, output_bytes: int = 0,
+                 rows_done: int = 0, failed_rows: int = 0, complete: bool = False):
+        self.path = path
+        self.settings = settings
+        self.chunks_done = chunks_done
+        self.output_bytes = output_bytes
+        self.rows_done = rows_done
+        self.failed_rows = failed_rows
+        self.complete = complete
+
+    @classmethod
+    def load(cls, path: str, settings: Dict) -> Optional["Checkpoint"]:
+        """The checkpoint to resume from, or None to start over (no checkpoint, finished run, changed input)."""
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        saved = data.pop("settings")
+        if data["complete"] or saved["input_fingerprint"] != settings["input_fingerprint"]:
+            return None
+        if saved != settings:
+            changed = ", ".join(key for key in settings if saved.get(key) != settings[key])
+            raise SystemExit(f"{path} was written with different settings ({changed}); "
+                             f"run with the same arguments to resume, or pass --restart")
+        return cls(path, saved, **data)
+
+    def save(self) -> None:
+        data = {"settings": self.settings, "chunks_done": self.chunks_done, "output_bytes": self.output_bytes,
+                "rows_done": self.rows_done, "failed_rows": self.failed_rows, "complete": self.complete}
+        # Written to a temporary file and renamed, so a crash never leaves a torn checkpoint
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+async def process_row(prompt: str) -> Dict:
+    from WebSearchLLM import llm_contact_search
+
+    logger.info(f"Prompt -> {prompt}")
+    result = await llm_contact_search(prompt, tier_stats)
+    logger.info(f"LLM result -> {result}")
+    return format_result(result)
+
+
+async def lookup_prompts(prompts: List[str], mode: str) -> List[Dict]:
+    """Output row per prompt; rows still failing after the retry rounds come back as error rows."""
+    if mode == "batch":
+        from batch_runner import batch_contact_search
+
+        # Retryable failures go out again in follow-up batches, up to ROW_RETRY_ATTEMPTS rounds
+        return [error_result(result) if isinstance(result, Exception) else format_result(result)
+                for result in await batch_contact_search(prompts, retry_policy=retry_policy)]
+
+    # In-flight OpenAI calls are bounded by the adaptive rate limiter in WebSearchLLM
+    results = await asyncio.gather(*[process_row(prompt) for prompt in prompts], return_exceptions=True)
+    # Rows that failed for a retryable reason get another round after a backoff
+    for retries in range(retry_policy.max_attempts):
+        pending = [i for i, result in enumerate(results)
+                   if isinstance(result, Exception) and retry_policy.should_retry(result, retries)]
+        if not pending:
+            break
+        delay = max(retry_policy.delay(results[i], retries) for i in pending)
+        logger.info(f"Retrying {len(pending)} failed rows in {delay:.0f}s")
+        await asyncio.sleep(delay)
+        retried = await asyncio.gather(*[process_row(prompts[i]) for i in pending], return_exceptions=True)
+        for i, result in zip(pending, retried):
+            results[i] = result
+    return [error_result(result) if isinstance(result, Exception) else result for result in results]
+
+
+async def lookup_chunks(chunks: List[Tuple[pd.DataFrame, pd.Series]], mode: str) -> List[pd.DataFrame]:
+    """Output rows of each chunk (indexed by input row), looking up each business in a chunk once."""
+    firsts = [~keys.duplicated() for _, keys in chunks]
+    prompts = [prompt for (chunk, _), first in zip(chunks, firsts) for prompt in build_prompts(chunk[first])]
+    results = iter(await lookup_prompts(prompts, mode) if prompts else [])
+    outputs = []
+    for (chunk, keys), first in zip(chunks, firsts):
+        by_key = {key: next(results) for key in keys[first]}
+        out = pd.DataFrame([by_key[key] for key in keys], columns=OUTPUT_COLUMNS, index=chunk.index)
+        # Validated E.164 numbers only; rows left empty had no valid number even after a retry. What
+        # didn't validate (extensions, vanity numbers, unknown area codes) is kept as given
+        out["unverified_numbers"] = unverified_phone_numbers(out["contact_numbers"])
+        out["contact_numbers"] = normalize_phone_numbers(out["contact_numbers"])
+        outputs.append(out)
+    return outputs
+
+
+def group_chunks(chunks: Iterable[Tuple[pd.DataFrame, pd.Series]], max_prompts: int):
+    """Consecutive chunks grouped until a group has `max_prompts` prompts (batch mode: one batch per group)."""
+    group, prompts = [], 0
+    for chunk, keys in chunks:
+        group.append((chunk, keys))
+        prompts += int((~keys.duplicated()).sum())
+        if prompts >= max_prompts:
+            yield group
+            group, prompts = [], 0
+    if group:
+        yield group
+
+
+def read_chunks(path: str, chunk_rows: int, shard: Tuple[int, int]) -> Iterator[Tuple[pd.DataFrame, pd.Series]]:
+    """(rows, dedup keys) of each input chunk that belong to `shard`; the index is the input row number."""
+    index, count = shard
+    with pd.read_csv(path, dtype=str, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunk = canonical_columns(chunk)
+            keys = dedup_keys(chunk)
+            if count > 1:
+                mine = (keys % count == index).to_numpy()
+                chunk, keys = chunk[mine], keys[mine]
+            yield chunk, keys
+
+
+async def run(args) -> None:
+    shard_index, shard_count = args.shard
+    stat = os.stat(args.input)
+    settings = {
+        "input": os.path.abspath(args.input),
+        "input_fingerprint": [stat.st_size, stat.st_mtime_ns],
+        "shard": f"{shard_index}/{shard_count}",
+        "chunk_rows": args.chunk_rows,
+        "mode": args.mode,
     }
+    path = args.checkpoint or checkpoint_path(args.output)
+    checkpoint = None if args.restart else Checkpoint.load(path, settings)
+    if checkpoint is None:
+        checkpoint = Checkpoint(path, settings)
+    elif not os.path.exists(args.output) or os.path.getsize(args.output) < checkpoint.output_bytes:
+        raise SystemExit(f"{args.output} is shorter than {path} records; pass --restart to start over")
+    resumed_from = checkpoint.chunks_done
+
+    # Sharded outputs keep the input row number so that `merge` can restore the input order
+    with_row_index = shard_count > 1
+    mode = "r+" if checkpoint.chunks_done else "w"
+    with open(args.output, mode, newline="", encoding="utf-8") as output:
+        output.truncate(checkpoint.output_bytes)
+        output.seek(checkpoint.output_bytes)
+
+        started = time.monotonic()
+        rows_this_run = 0
+
+        def progress(event: str) -> None:
+            from WebSearchLLM import rate_limiter
 
-async def main() -> None:
+            elapsed = time.monotonic() - started
+            _emit(event, shard=settings["shard"], chunks_done=checkpoint.chunks_done,
+                  rows_done=checkpoint.rows_done, failed_rows=checkpoint.failed_rows,
+                  rows_per_sec=round(rows_this_run / elapsed, 1) if elapsed else 0.0,
+                  elapsed_seconds=round(elapsed, 1), concurrency=int(rate_limiter.concurrency),
+                  in_flight=rate_limiter.in_flight)
+
+        def write(out: pd.DataFrame) -> None:
+            nonlocal rows_this_run
+            out.to_csv(output, header=checkpoint.output_bytes == 0, index=with_row_index, index_label="row_index")
+            output.flush()
+            os.fsync(output.fileno())
+            checkpoint.chunks_done += 1
+            checkpoint.output_bytes = output.tell()
+            checkpoint.rows_done += len(out)
+            checkpoint.failed_rows += int(out["search_resources"].str.startswith(ERROR_PREFIX).sum())
+            checkpoint.save()
+            rows_this_run += len(out)
+
+        async def report() -> None:
+            while True:
+                await asyncio.sleep(args.progress_seconds)
+                progress("progress")
+
+        _emit("start", input=args.input, output=args.output, shard=settings["shard"], mode=args.mode,
+              resumed_from_chunk=resumed_from)
+        reporter = asyncio.create_task(report()) if args.progress_seconds > 0 else None
+        chunks = itertools.islice(read_chunks(args.input, args.chunk_rows, args.shard), resumed_from, None)
+        if args.mode == "batch":
+            from batch_runner import BatchRunner
+
+            # Chunks are collected into batches of up to BATCH_MAX_REQUESTS prompts, several waiting at once
+            groups, limit = group_chunks(chunks, BatchRunner.from_env().max_requests), args.batches_in_flight
+        else:
+            groups, limit = ([chunk] for chunk in chunks), args.chunks_in_flight
+        try:
+            # Groups of chunks are looked up `limit` at a time, but chunks are written strictly in order
+            in_flight = deque()
+            for group in groups:
+                in_flight.append(asyncio.create_task(lookup_chunks(group, args.mode)))
+                if len(in_flight) >= limit:
+                    for out in await in_flight.popleft():
+                        write(out)
+            while in_flight:
+                for out in await in_flight.popleft():
+                    write(out)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            from WebSearchLLM import page_fetcher
+
+            await page_fetcher.aclose()
+
+        if checkpoint.output_bytes == 0:
+            # No rows for this shard: still write the header, so every shard output can be merged
+            pd.DataFrame(columns=(["row_index"] if with_row_index else []) + OUTPUT_COLUMNS).to_csv(output, index=False)
+            checkpoint.output_bytes = output.tell()
+    checkpoint.complete = True
+    checkpoint.save()
+    progress("done")
+    _emit("tiers", tiers=tier_stats.summary())
+
+
+def merge_outputs(paths: List[str], output: str, force: bool = False) -> int:
     """
-    Orchestrates concurrent processing of all rows and writes the CSV.
+    Interleave finished shard outputs (each sorted by row_index) into one CSV in input order,
+    streaming: only one row per shard is held in memory. Returns the number of rows written.
     """
-    semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
+    shards = set()
+    for path in paths:
+        state = None
+        if os.path.exists(checkpoint_path(path)):
+            with open(checkpoint_path(path), encoding="utf-8") as f:
+                state = json.load(f)
+        if state is None or not state["complete"]:
+            if not force:
+                raise SystemExit(f"{path} is not a finished shard output (see {checkpoint_path(path)}); "
+                                 f"pass --force to merge it anyway")
+            continue
+        shards.add(state["settings"]["shard"])
+    counts = {int(shard.split("/")[1]) for shard in shards}
+    if not force and (len(counts) != 1 or len(shards) != len(paths) or len(shards) != counts.pop()):
+        raise SystemExit(f"expected every shard 0..N-1 of one run exactly once, got {sorted(shards)}; "
+                         f"pass --force to merge anyway")
+
+    files = [open(path, newline="", encoding="utf-8") for path in paths]
+    try:
+        readers = [csv.reader(f) for f in files]
+        for path, reader in zip(paths, readers):
+            header = next(reader, None)
+            if header != ["row_index"] + OUTPUT_COLUMNS:
+                raise SystemExit(f"{path} is not a shard output (header {header})")
+        rows = heapq.merge(*[((int(row[0]), row[1:]) for row in reader) for reader in readers],
+                           key=lambda item: item[0])
+        written = 0
+        with open(output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(OUTPUT_COLUMNS)
+            for _, row in rows:
+                writer.writerow(row)
+                written += 1
+    finally:
+        for f in files:
+            f.close()
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+
+    run_parser = commands.add_parser("run", help="look up the rows of a CSV file (the default command)")
+    run_parser.add_argument("--input", "-i", default=INPUT_CSV, help="input CSV")
+    run_parser.add_argument("--output", "-o", default=OUTPUT_CSV, help="output CSV")
+    run_parser.add_argument("--shard", type=parse_shard, default=(0, 1), metavar="i/N",
+                            help="only look up shard i of N (outputs then carry row_index for merge)")
+    run_parser.add_argument("--mode", choices=["realtime", "batch"], default=PROCESSING_MODE)
+    run_parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="input rows per chunk and checkpoint")
+    run_parser.add_argument("--chunks-in-flight", type=int, default=CHUNKS_IN_FLIGHT,
+                            help="chunks looked up at the same time")
+    run_parser.add_argument("--batches-in-flight", type=int, default=BATCHES_IN_FLIGHT,
+                            help="batch mode: batches (of up to BATCH_MAX_REQUESTS prompts) waiting at the same time")
+    run_parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: <output>.checkpoint.json)")
+    run_parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and start over")
+    run_parser.add_argument("--concurrency", type=int, help="max in-flight OpenAI calls (OPENAI_MAX_CONCURRENCY)")
+    run_parser.add_argument("--initial-concurrency", type=int,
+                            help="starting concurrency window (OPENAI_INITIAL_CONCURRENCY)")
+    run_parser.add_argument("--rpm", type=float, help="requests per minute limit (OPENAI_RPM_LIMIT)")
+    run_parser.add_argument("--tpm", type=float, help="tokens per minute limit (OPENAI_TPM_LIMIT)")
+    run_parser.add_argument("--progress-seconds", type=float, default=PROGRESS_SECONDS,
+                            help="seconds between progress lines on stderr (0: only start and end)")
+    run_parser.add_argument("--verbose", "-v", action="store_true", help="log every prompt and result")
+
+    merge_parser = commands.add_parser("merge", help="merge finished shard outputs into one CSV in input order")
+    merge_parser.add_argument("shards", nargs="+", help="shard output CSVs")
+    merge_parser.add_argument("--output", "-o", default=OUTPUT_CSV, help="merged CSV")
+    merge_parser.add_argument("--force", action="store_true", help="merge unfinished or incomplete sets of shards")
 
-    async def _worker(row: pd.Series) -> Dict:
-        # Limit the number of in-flight requests with the semaphore
-        async with semaphore:
-            return await process_row(row)
+    # `python app.py [options]` is `python app.py run [options]`
+    if not argv or argv[0] not in ("run", "merge", "-h", "--help"):
+        argv = ["run", *argv]
+    args = parser.parse_args(argv)
 
-    tasks = [_worker(row) for _, row in df.iterrows()]
-    results = await asyncio.gather(*tasks, return_exceptions=False)
+    if args.command == "merge":
+        written = merge_outputs(args.shards, args.output, args.force)
+        _emit("merged", output=args.output, shards=len(args.shards), rows=written)
+        return
 
-    out_df = pd.DataFrame(results, columns=[
-        "business_name",
-        "business_address",
-        "contact_numbers",
-        "search_resources",
-    ])
-    out_df.to_csv(OUTPUT_CSV, index=False)
-    print(f"\nSaved {len(out_df)} rows to {OUTPUT_CSV}")
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Read when WebSearchLLM is first imported (the rate limiter is created at import time)
+    for option, variable in RATE_OPTIONS.items():
+        if getattr(args, option) is not None:
+            os.environ[variable] = str(getattr(args, option))
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        # Everything up to the last checkpoint is kept; the same command resumes from there
+        sys.exit(130)
 
 
-# ---------------------------------------------------------------------------  
-# Entry-point  
-# ---------------------------------------------------------------------------  
+# ---------------------------------------------------------------------------
+# Entry-point
+# ---------------------------------------------------------------------------
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
@@ -1,29 +1,68 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 import pandas as pd
 import asyncio
 import uuid
 import os
 import sys
-from typing import Dict, List
-import tempfile
+import socket
+import logging
+from typing import Dict, List, Optional, Set
+import copy
 import json
-from datetime import datetime
+import time
+import aiofiles
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
 
 # Add parent directory to path to import WebSearchLLM
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Import with error handling
 try:
-    from WebSearchLLM import llm_contact_search
-    print("✅ Successfully imported WebSearchLLM")
+    from WebSearchLLM import llm_contact_search, lookup_cache, single_flight, rate_limiter, pool_metrics
+    from job_store import JobStore, ACTIVE_STATUSES
+    from batch_runner import BatchRunner, BatchLookupError, TERMINAL_BATCH_STATUSES
+    from preprocess import dedup_keys
+    from phone_numbers import extract_phone_numbers, unverified_entries
+    from output_formats import (OUTPUT_FORMATS, STREAMING_FORMATS, csv_pages, format_available, ndjson_pages,
+                                output_path, write_output)
+    from lookup_tiers import TierStats, summarize_tiers
+    from failures import CLIENT, RATE_LIMIT, TIMEOUT, DeferredQueue, FailureReport, RetryPolicy, classify_failure, summarize_failures
+    from metrics import FAILED_ATTEMPTS, LOOP_LAG, ROWS, TraceWriter, record_stage, registry, row_trace, trace_path
+    from WebSearchLLM import circuit_breaker, hedge_policy, response_poller, api_scheduler, page_fetcher
+    from scheduler import BULK, INTERACTIVE, PRIORITIES
+    from contact_rows import OUTPUT_COLUMNS, ERROR_PREFIX, format_result, error_result, normalize_contact_numbers
+    from prompt_builder import build_prompt, build_prompts, canonical_columns, has_required_columns
+    logger.info("Successfully imported WebSearchLLM")
 except ImportError as e:
-    print(f"❌ Failed to import WebSearchLLM: {e}")
-    print("Make sure WebSearchLLM.py is in the parent directory")
+    logger.error(f"Failed to import WebSearchLLM: {e}. Make sure WebSearchLLM.py is in the parent directory")
     sys.exit(1)
 
-app = FastAPI(title="ARM Skip Trace", description="Web application for business contact skip tracing")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Apply job retention and start watching for interrupted jobs to resume. On shutdown, stop
+    watching and close the page fetcher's HTTP client.
+    """
+    _evict_old_jobs()
+    maintenance = [asyncio.create_task(_watch_worker_jobs()), asyncio.create_task(_monitor_loop_lag())]
+    if RESUME_JOBS_ON_STARTUP:
+        maintenance.append(asyncio.create_task(_resume_stale_jobs()))
+    running_jobs.update(maintenance)
+    try:
+        yield
+    finally:
+        for task in maintenance:
+            task.cancel()
+            running_jobs.discard(task)
+        await page_fetcher.aclose()
+
+app = FastAPI(title="ARM Skip Trace", description="Web application for business contact skip tracing",
+              lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -37,10 +76,8 @@ app.add_middleware(
 # Create directories if they don't exist
 os.makedirs("temp", exist_ok=True)
 
-# Mount static files - fix the path
+# Serve the frontend's static files
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")
-# app.mount("/static", StaticFiles(directory=frontend_path), name="static")
-# Serve individual static files
 @app.get("/style.css")
 async def get_css():
     """Serve the CSS file."""
@@ -60,90 +97,755 @@ async def get_js():
         raise HTTPException(status_code=404, detail="JavaScript file not found")
 
 
-# In-memory storage for job status (in production, use Redis or database)
-job_status = {}
-results_storage = {}
+# Durable job/result storage shared by every worker process (JOB_STORE=sqlite|memory)
+job_store = JobStore.from_env()
+
+# Identifies this process as the owner of the jobs it is running
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Streaming ingestion settings: the upload is copied to disk in UPLOAD_CHUNK_BYTES pieces,
+# parsed INGEST_CHUNK_ROWS rows at a time and fed through a bounded queue to WORKER_COUNT workers
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+INGEST_CHUNK_ROWS = 5000
+WORKER_COUNT = 1000
+QUEUE_SIZE = 2 * WORKER_COUNT
+
+# Completed rows are written to the job store in batches every RESULT_FLUSH_INTERVAL seconds;
+# the same write doubles as the owner's heartbeat
+RESULT_FLUSH_INTERVAL = 0.5
+# Rows/sec and ETA are computed over this many seconds of recent progress
+THROUGHPUT_WINDOW = 30
+# An active job whose owner has not written for this long is considered abandoned and is resumed
+STALE_JOB_SECONDS = 20
+RESUME_JOBS_ON_STARTUP = os.getenv("RESUME_JOBS_ON_STARTUP", "1").lower() not in ("0", "false", "no")
+
+# JOB_EXECUTION=workers hands realtime jobs to worker.py processes through the job store's chunk
+# queue instead of running the lookups on this event loop
+JOB_EXECUTION = os.getenv("JOB_EXECUTION", "inline").lower()
+WORKER_CHUNK_ROWS = int(os.getenv("WORKER_CHUNK_ROWS", 100))
+# How often worker-executed jobs are checked for progress and completion
+WORKER_WATCH_INTERVAL = 1.0
+
+# Rows whose lookup failed for a retryable reason are tried again later (ROW_RETRY_ATTEMPTS/BASE_DELAY/MAX_DELAY)
+retry_policy = RetryPolicy.from_env()
+
+# How often a running job checks whether it was cancelled from another process
+CANCEL_CHECK_SECONDS = 1.0
+
+# JOB_TRACE_ENABLED=1 writes a per-row timing trace for every job (uploads can also ask with `trace=true`)
+JOB_TRACE_ENABLED = os.getenv("JOB_TRACE_ENABLED", "0").lower() in ("1", "true", "yes")
+# Event-loop lag is measured by how late a timer scheduled this often fires
+LOOP_LAG_INTERVAL = 0.5
 
-CONCURRENCY_LIMIT = 1000
+# POST /lookup and /lookup/batch answer inline, with foreground responses unless LOOKUP_API_FOREGROUND=0.
+# Their calls share the job scheduler as one interactive flow, so bulk jobs don't hold them up
+LOOKUP_API_FOREGROUND = os.getenv("LOOKUP_API_FOREGROUND", "1").lower() not in ("0", "false", "no")
+LOOKUP_BATCH_MAX_ROWS = int(os.getenv("LOOKUP_BATCH_MAX_ROWS", 100))
+LOOKUP_API_FLOW = "lookup-api"
+api_scheduler.register(LOOKUP_API_FLOW, INTERACTIVE)
+# HTTP status of a failed inline lookup by failure kind (anything else is a 502)
+LOOKUP_FAILURE_STATUS = {TIMEOUT: 504, RATE_LIMIT: 429}
 
-async def process_csv_data(job_id: str, df: pd.DataFrame) -> None:
-    """Process CSV data with LLM contact search."""
+# Finished jobs (and their output files) are evicted after JOB_RETENTION_HOURS, and beyond MAX_STORED_JOBS
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", 72))
+MAX_STORED_JOBS = int(os.getenv("MAX_STORED_JOBS", 500))
+
+def _prepare_chunk(chunk: pd.DataFrame):
+    """Lookup prompts and dedup cluster keys for a chunk of input rows, as lists."""
+    chunk = canonical_columns(chunk)
+    return build_prompts(chunk).tolist(), dedup_keys(chunk).tolist()
+
+async def _update_status(job_id: str, status: Dict) -> None:
+    """Write a running job's status off the event loop."""
+    # The workers keep updating `status` (and its tier/failure counters) while the write runs
+    await asyncio.to_thread(job_store.update_job, job_id, **copy.deepcopy(status))
+
+async def _save_results(job_id: str, rows: List, status: Dict) -> None:
+    """Normalize and store a batch of finished rows with the job's status, off the event loop."""
+    snapshot = copy.deepcopy(status)
+    await asyncio.to_thread(lambda: job_store.save_results(job_id, normalize_contact_numbers(rows), **snapshot))
+
+async def process_csv_data(job_id: str, input_path: str) -> None:
+    """
+    Process an uploaded CSV file with LLM contact search, streaming rows through a worker pool.
+
+    Finished rows are flushed to the job store in small batches while the job runs. If the
+    job already has stored rows (i.e. it is being resumed) those rows are skipped. Rows that
+    fail for a retryable reason are deferred and tried again later without holding a worker.
+    The job's OpenAI calls get a share of the process-wide capacity set by its priority.
+    """
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    api_scheduler.register(job_id, job.get("priority", BULK))
     try:
-        job_status[job_id] = {"status": "processing", "progress": 0, "total": len(df)}
-        
-        semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
-        
-        async def _worker(row: pd.Series, index: int) -> Dict:
-            async with semaphore:
-                result = await process_row(row)
-                # Update progress
-                job_status[job_id]["progress"] = index + 1
-                return result
-        
-        tasks = [_worker(row, idx) for idx, (_, row) in enumerate(df.iterrows())]
-        results = await asyncio.gather(*tasks, return_exceptions=False)
-        
-        # Create output DataFrame
-        out_df = pd.DataFrame(results, columns=[
-            "business_name",
-            "business_address", 
-            "contact_numbers",
-            "search_resources",
-        ])
+        done = await asyncio.to_thread(job_store.completed_indices, job_id)
+        failed = job.get("failed", 0)
+        # Per-tier attempts/hits/latency/cost and failure counts, continued from before an interruption
+        tier_stats = TierStats(job.get("tiers"))
+        failures = FailureReport(job.get("failures"))
+        status = {"status": "processing", "progress": len(done), "completed": len(done) - failed,
+                  "failed": failed, "in_flight": 0, "retrying": 0, "total": 0, "ingesting": True,
+                  "api_calls_saved": 0, "rows_per_sec": 0.0, "eta_seconds": None, "tiers": tier_stats.counters,
+                  "failures": failures.counters, "input_path": input_path, "owner": WORKER_ID}
+        await asyncio.to_thread(job_store.update_job, job_id, **status)
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        # Rows waiting out a retry delay; they hold no worker while they wait
+        deferred = DeferredQueue()
+        # Rows queued, in flight or deferred; the workers stop once input is read and this reaches 0
+        outstanding = 0
+        idle = asyncio.Event()
+        pending_results = []
+        # Per-row stage timings, written next to the results when the job is traced
+        traces = TraceWriter(trace_path(job_id)) if job.get("trace") else None
+        # (time, progress) samples over the last THROUGHPUT_WINDOW seconds for rows/sec and ETA
+        samples = deque([(time.monotonic(), status["progress"])])
+
+        def _update_throughput() -> None:
+            now = time.monotonic()
+            samples.append((now, status["progress"]))
+            while len(samples) > 2 and now - samples[0][0] > THROUGHPUT_WINDOW:
+                samples.popleft()
+            elapsed = now - samples[0][0]
+            rate = (status["progress"] - samples[0][1]) / elapsed if elapsed > 0 else 0.0
+            status["rows_per_sec"] = round(rate, 2)
+            remaining = status["total"] - status["progress"] - status["api_calls_saved"]
+            status["eta_seconds"] = round(remaining / rate, 1) if rate > 0 and not status["ingesting"] else None
+
+        # The last flush's write; cancelling `_flusher` doesn't stop a write already running in its thread
+        last_write: Optional[asyncio.Future] = None
+
+        async def _flush() -> None:
+            nonlocal last_write
+            if last_write is not None:
+                # One write at a time, so results and status reach the store in order
+                await asyncio.wait([last_write])
+            rows = pending_results[:]
+            pending_results.clear()
+            _update_throughput()
+            last_write = asyncio.ensure_future(_write(rows))
+            await asyncio.shield(last_write)
+
+        async def _write(rows: List) -> None:
+            await _save_results(job_id, rows, status)
+            if traces is not None:
+                await asyncio.to_thread(traces.flush)
+
+        def _row_done(trace: Dict, outcome: str, error: Optional[Exception] = None) -> None:
+            ROWS.inc(outcome=outcome)
+            if error is not None:
+                FAILED_ATTEMPTS.inc(kind=classify_failure(error))
+                trace["failure"] = classify_failure(error)
+            if traces is not None:
+                traces.add({**trace, "outcome": outcome})
+
+        async def _flusher() -> None:
+            while True:
+                await asyncio.sleep(RESULT_FLUSH_INTERVAL)
+                await _flush()
+
+        def _track_outstanding(change: int) -> None:
+            nonlocal outstanding
+            outstanding += change
+            if outstanding == 0:
+                idle.set()
+
+        # Dedup cluster key -> index of the row that is looked up for the whole cluster
+        clusters: Dict[int, int] = {}
+
+        async def _producer() -> None:
+            reader = pd.read_csv(input_path, chunksize=INGEST_CHUNK_ROWS, dtype=str)
+            index = 0
+            while True:
+                # Parse and normalize the next chunk off the event loop so HTTP requests stay responsive
+                chunk = await asyncio.to_thread(next, reader, None)
+                if chunk is None:
+                    break
+                prompts, keys = await asyncio.to_thread(_prepare_chunk, chunk)
+                duplicates = []
+                for prompt, key in zip(prompts, keys):
+                    source = clusters.setdefault(key, index)
+                    if source != index:
+                        # Gets a copy of the source row's result once the job finishes
+                        duplicates.append((index, source))
+                    elif index not in done:
+                        _track_outstanding(1)
+                        await queue.put((index, prompt, 0, time.monotonic()))
+                    index += 1
+                if duplicates:
+                    await asyncio.to_thread(job_store.add_duplicates, job_id, duplicates)
+                    status["api_calls_saved"] += len(duplicates)
+                status["total"] = index
+            status["ingesting"] = False
+
+        # In-flight OpenAI calls are bounded by the process-wide rate limiter in WebSearchLLM and
+        # shared with the other jobs in this process by the fair scheduler in front of it
+        async def _worker() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, prompt, retries, queued_at = item
+                status["in_flight"] += 1
+                try:
+                    with row_trace(row_index=index, retries=retries) as trace:
+                        record_stage("queue_wait", time.monotonic() - queued_at)
+                        result = await process_row(prompt, tier_stats)
+                    status["completed"] += 1
+                    if retries:
+                        failures.recovered()
+                    _row_done(trace, "completed")
+                except Exception as e:
+                    failures.failed_attempt(e)
+                    if retry_policy.should_retry(e, retries):
+                        # Try the row again later instead of retrying it in place
+                        failures.deferred()
+                        deferred.defer((index, prompt, retries + 1), retry_policy.delay(e, retries))
+                        status["retrying"] = len(deferred)
+                        _row_done(trace, "deferred", e)
+                        continue
+                    failures.gave_up(e)
+                    result = error_result(e)
+                    status["failed"] += 1
+                    _row_done(trace, "failed", e)
+                finally:
+                    status["in_flight"] -= 1
+                pending_results.append((index, result))
+                status["progress"] += 1
+                _track_outstanding(-1)
+
+        async def _requeue_deferred() -> None:
+            while True:
+                item = await deferred.get()
+                status["retrying"] = len(deferred)
+                await queue.put((*item, time.monotonic()))
+
+        flusher = asyncio.create_task(_flusher())
+        requeuer = asyncio.create_task(_requeue_deferred())
+        with api_scheduler.running(job_id):
+            workers = [asyncio.create_task(_worker()) for _ in range(WORKER_COUNT)]
+        try:
+            await _producer()
+            while outstanding:
+                idle.clear()
+                await idle.wait()
+            for _ in range(WORKER_COUNT):
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except BaseException:
+            for worker in workers:
+                worker.cancel()
+            raise
+        finally:
+            requeuer.cancel()
+            flusher.cancel()
+            await _flush()
+
+        await _complete_job(job_id, input_path, status["total"])
         
-        # Save results
-        output_filename = f"output_{job_id}.csv"
-        output_path = os.path.join("temp", output_filename)
+    except Exception as e:
+        await asyncio.to_thread(job_store.update_job, job_id, status="error", error=str(e))
+    finally:
+        api_scheduler.unregister(job_id)
+        await asyncio.to_thread(_evict_old_jobs)
+
+async def _heartbeat(job_id: str) -> None:
+    """Touch a job's updated_at while this process works on it without writing results."""
+    while True:
+        await asyncio.sleep(STALE_JOB_SECONDS / 4)
+        await asyncio.to_thread(job_store.update_job, job_id)
+
+async def _complete_job(job_id: str, input_path: str, total: int) -> None:
+    """Copy results to duplicate rows, write the output CSV and mark the job completed."""
+    # Fan-out and writing take longer than STALE_JOB_SECONDS for multi-million-row jobs; both run
+    # off the event loop while the heartbeat keeps other processes from taking the job over
+    finalizing_jobs.add(job_id)
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    try:
+        copied, failed = await asyncio.to_thread(job_store.fan_out_duplicates, job_id)
+        if copied:
+            job = await asyncio.to_thread(job_store.get_job, job_id)
+            await asyncio.to_thread(job_store.update_job, job_id, completed=job.get("completed", 0) + copied - failed,
+                                    failed=job.get("failed", 0) + failed)
+        path = output_path(job_id, "csv")
         os.makedirs("temp", exist_ok=True)
-        out_df.to_csv(output_path, index=False)
-        
-        # Store results for API access
-        results_storage[job_id] = {
-            "data": out_df.to_dict('records'),
-            "filename": output_filename,
-            "path": output_path
-        }
-        
-        job_status[job_id] = {
-            "status": "completed", 
-            "progress": len(df), 
-            "total": len(df),
-            "filename": output_filename
-        }
-        
+        # Write to a temporary name so a download never sees a half-written file
+        await asyncio.to_thread(write_output, _iter_result_pages(job_id), path + ".part", "csv")
+        os.replace(path + ".part", path)
+    finally:
+        heartbeat.cancel()
+        finalizing_jobs.discard(job_id)
+
+    await asyncio.to_thread(
+        job_store.update_job,
+        job_id,
+        status="completed",
+        progress=total,
+        total=total,
+        in_flight=0,
+        eta_seconds=0,
+        ingesting=False,
+        filename=os.path.basename(path),
+        path=path,
+    )
+    # The input is only kept around so an interrupted job can be resumed
+    if os.path.exists(input_path):
+        os.unlink(input_path)
+
+# Batch-mode jobs go through the OpenAI Batch API (BATCH_POLL_SECONDS, BATCH_MAX_REQUESTS)
+batch_runner = BatchRunner.from_env()
+
+async def process_csv_batch(job_id: str, input_path: str) -> None:
+    """
+    Process an uploaded CSV through the OpenAI Batch API instead of one call per row.
+
+    Cached rows are answered immediately. One prompt per dedup cluster is submitted as batches
+    while the file is read, and each batch's results are mapped back to every row in the
+    cluster when it finishes. Requests that failed for a retryable reason are resubmitted in a
+    follow-up batch. Batch ids are stored on the job, so a resumed job collects the batches
+    it already submitted instead of paying for them twice: prompts from the part of the file
+    those batches cover are held back until they are collected, and the rest of the file is
+    submitted while it is read, as in a new job.
+    """
+    try:
+        job = await asyncio.to_thread(job_store.get_job, job_id)
+        done = await asyncio.to_thread(job_store.completed_indices, job_id)
+        failed = job.get("failed", 0)
+        # batch id -> {"status", "total", "completed", "failed", "collected"}
+        batches = job.get("batches", {})
+        failures = FailureReport(job.get("failures"))
+        status = {"status": "processing", "progress": len(done), "completed": len(done) - failed,
+                  "failed": failed, "in_flight": 0, "total": 0, "ingesting": True, "api_calls_saved": 0,
+                  "batches": batches, "failures": failures.counters, "input_path": input_path, "owner": WORKER_ID}
+        await asyncio.to_thread(job_store.update_job, job_id, **status)
+        rows_by_key: Dict[str, List[int]] = {}
+        prompt_by_key: Dict[str, str] = {}
+        unsent: List[str] = []
+        collectors = []
+        # Keys whose request failed for a retryable reason, resubmitted in a follow-up batch
+        retry_keys: List[str] = []
+        retries_by_key: Dict[str, int] = {}
+
+        async def _resolve(key: str, result) -> List:
+            """Output rows for every row waiting on `key`."""
+            indices = rows_by_key.pop(key, [])
+            prompt = prompt_by_key.pop(key, None)
+            if not indices:
+                # Already resolved (e.g. answered by an earlier batch too): no rows, nothing to count
+                return []
+            if isinstance(result, Exception):
+                failures.gave_up(result)
+                output = error_result(result)
+                status["failed"] += len(indices)
+                ROWS.inc(len(indices), outcome="failed")
+            else:
+                if prompt is not None:
+                    await lookup_cache.aset(prompt, result)
+                if key in retries_by_key:
+                    failures.recovered()
+                output = format_result(result)
+                status["completed"] += len(indices)
+                ROWS.inc(len(indices), outcome="completed")
+            status["progress"] += len(indices)
+            status["in_flight"] -= len(indices)
+            return [(index, output) for index in indices]
+
+        async def _collect(batch_id: str) -> None:
+            def _on_update(batch) -> None:
+                counts = batch.request_counts
+                batches[batch_id].update(status=batch.status, total=counts.total if counts else 0,
+                                         completed=counts.completed if counts else 0,
+                                         failed=counts.failed if counts else 0)
+
+            batch = await batch_runner.wait(batch_id, _on_update)
+            rows = []
+            async for key, result in batch_runner.iter_results(batch):
+                if isinstance(result, Exception):
+                    failures.failed_attempt(result)
+                    FAILED_ATTEMPTS.inc(kind=classify_failure(result))
+                    if key in rows_by_key and retry_policy.should_retry(result, retries_by_key.get(key, 0)):
+                        failures.deferred()
+                        ROWS.inc(len(rows_by_key[key]), outcome="deferred")
+                        retry_keys.append(key)
+                        continue
+                rows.extend(await _resolve(key, result))
+                if len(rows) >= INGEST_CHUNK_ROWS:
+                    await _save_results(job_id, rows, status)
+                    rows = []
+            batches[batch_id]["collected"] = True
+            await _save_results(job_id, rows, status)
+
+        async def _submit(keys: List[str]) -> None:
+            requests = [(key, prompt_by_key[key]) for key in keys if key in rows_by_key]
+            for lines in batch_runner.chunk(requests):
+                batch_id = await batch_runner.submit(lines, metadata={"job_id": job_id})
+                # "rows": input rows read when the batch was submitted, i.e. the part of the file it covers
+                batches[batch_id] = {"status": "validating", "total": len(lines), "completed": 0,
+                                     "failed": 0, "collected": False, "rows": status["total"]}
+                await _update_status(job_id, status)
+                collectors.append(asyncio.create_task(_collect(batch_id)))
+
+        async def _heartbeat() -> None:
+            # Batches can take hours; keep the job from looking abandoned while waiting on them
+            while True:
+                await asyncio.sleep(STALE_JOB_SECONDS / 4)
+                await _update_status(job_id, status)
+
+        # Batches submitted before an interruption are collected once the rows they cover are read
+        # again. New prompts from those rows are held until then, and only the ones the batches did
+        # not answer are submitted; prompts past them are submitted during ingest as usual
+        resumed_batches = [batch_id for batch_id, info in batches.items() if not info.get("collected")]
+        resumed_rows = max((batches[batch_id].get("rows", float("inf")) for batch_id in resumed_batches), default=0)
+        resumed: List[asyncio.Task] = []
+        held: List[str] = []
+
+        def _collect_resumed() -> None:
+            if resumed_batches and not resumed:
+                resumed.extend(asyncio.create_task(_collect(batch_id)) for batch_id in resumed_batches)
+                collectors.extend(resumed)
+
+        heartbeat = asyncio.create_task(_heartbeat())
+        try:
+            reader = pd.read_csv(input_path, chunksize=INGEST_CHUNK_ROWS, dtype=str)
+            index = 0
+            while True:
+                chunk = await asyncio.to_thread(next, reader, None)
+                if chunk is None:
+                    break
+                prompts, keys = await asyncio.to_thread(_prepare_chunk, chunk)
+                # The chunk's new prompts are looked up in the cache in one call, off the event loop
+                new = list(dict.fromkeys(prompt for i, (prompt, key) in enumerate(zip(prompts, keys), index)
+                                         if i not in done and str(key) not in rows_by_key))
+                cached_by_prompt = dict(zip(new, await lookup_cache.aget_many(new)))
+                cached_rows = []
+                for prompt, key in zip(prompts, keys):
+                    if index not in done:
+                        # The dedup cluster key doubles as the batch request's custom_id
+                        key = str(key)
+                        if key in rows_by_key:
+                            rows_by_key[key].append(index)
+                            status["api_calls_saved"] += 1
+                            status["in_flight"] += 1
+                            index += 1
+                            continue
+                        cached = cached_by_prompt.get(prompt)
+                        if cached is not None:
+                            cached_rows.append((index, format_result(cached)))
+                            status["completed"] += 1
+                            status["progress"] += 1
+                        else:
+                            rows_by_key[key] = [index]
+                            prompt_by_key[key] = prompt
+                            (held if index < resumed_rows else unsent).append(key)
+                            status["in_flight"] += 1
+                    index += 1
+                status["total"] = index
+                await _save_results(job_id, cached_rows, status)
+                if index >= resumed_rows:
+                    _collect_resumed()
+                if len(unsent) >= batch_runner.max_requests:
+                    await _submit(unsent)
+                    unsent = []
+            status["ingesting"] = False
+
+            _collect_resumed()
+            await asyncio.gather(*resumed)
+            await _submit(held + unsent)
+            await asyncio.gather(*collectors)
+            # Retryable failures go out again in follow-up batches, up to ROW_RETRY_ATTEMPTS rounds
+            while retry_keys:
+                keys, retry_keys = retry_keys, []
+                for key in keys:
+                    retries_by_key[key] = retries_by_key.get(key, 0) + 1
+                collectors.clear()
+                await _submit(keys)
+                await asyncio.gather(*collectors)
+        except BaseException:
+            for task in collectors:
+                task.cancel()
+            raise
+        finally:
+            heartbeat.cancel()
+
+        # Prompts no batch answered (e.g. the batch failed or expired)
+        rows = []
+        for key in list(rows_by_key):
+            rows.extend(await _resolve(key, BatchLookupError("No result returned by the batch", TIMEOUT)))
+        await _save_results(job_id, rows, status)
+
+        await _complete_job(job_id, input_path, status["total"])
+
     except Exception as e:
-        job_status[job_id] = {"status": "error", "error": str(e)}
+        await asyncio.to_thread(job_store.update_job, job_id, status="error", error=str(e))
+    finally:
+        await asyncio.to_thread(_evict_old_jobs)
 
-async def process_row(row: pd.Series) -> Dict:
-    """Process a single row from the CSV."""
-    prompt_parts = []
-    
-    if pd.notna(row.get("Business_Name")):
-        prompt_parts.append(f"Business Name: {row['Business_Name']}")
-    if pd.notna(row.get("Address")):
-        prompt_parts.append(f"Address: {row['Address']}")
-    if pd.notna(row.get("web_page")):
-        prompt_parts.append(f"web_page: {row['web_page']}")
-    if pd.notna(row.get("other_info")):
-        prompt_parts.append(f"other_info: {row['other_info']}")
-    
-    prompt = ", ".join(prompt_parts)
-    
+async def enqueue_job(job_id: str, input_path: str) -> None:
+    """
+    Split a job into chunks of WORKER_CHUNK_ROWS prompts in the job store's work queue.
+
+    worker.py processes do the lookups; `_watch_worker_jobs` reports their progress and
+    writes the output once every chunk is done. Chunk i always holds input rows
+    [i * WORKER_CHUNK_ROWS, (i + 1) * WORKER_CHUNK_ROWS), so an interrupted enqueue is simply
+    run again and skips the chunks it already added.
+    """
     try:
-        result = await llm_contact_search(prompt)
-        return {
-            "business_name": result.get("business_name", ""),
-            "business_address": result.get("business_address", ""),
-            "contact_numbers": ", ".join(result.get("contact_numbers", [])),
-            "search_resources": result.get("search_resources", ""),
-        }
+        done = await asyncio.to_thread(job_store.completed_indices, job_id)
+        enqueued = await asyncio.to_thread(job_store.chunk_indices, job_id)
+        await asyncio.to_thread(job_store.update_job, job_id, status="processing", ingesting=True,
+                                input_path=input_path, owner=WORKER_ID)
+
+        # Dedup cluster key -> index of the row that is looked up for the whole cluster
+        clusters: Dict[int, int] = {}
+        saved = 0
+
+        def _enqueue_chunk(chunk: pd.DataFrame, start: int) -> None:
+            nonlocal saved
+            prompts, keys = _prepare_chunk(chunk)
+            duplicates = []
+            for offset in range(0, len(prompts), WORKER_CHUNK_ROWS):
+                first = start + offset
+                rows = []
+                for i, prompt in enumerate(prompts[offset:offset + WORKER_CHUNK_ROWS]):
+                    source = clusters.setdefault(keys[offset + i], first + i)
+                    if source != first + i:
+                        duplicates.append((first + i, source))
+                    elif first + i not in done:
+                        rows.append((first + i, prompt))
+                if rows and first // WORKER_CHUNK_ROWS not in enqueued:
+                    job_store.enqueue_chunk(job_id, first // WORKER_CHUNK_ROWS, rows)
+            if duplicates:
+                job_store.add_duplicates(job_id, duplicates)
+                saved += len(duplicates)
+
+        # Ingest blocks are a whole number of worker chunks, so every block starts on a chunk boundary
+        block_rows = max(1, INGEST_CHUNK_ROWS // WORKER_CHUNK_ROWS) * WORKER_CHUNK_ROWS
+        reader = pd.read_csv(input_path, chunksize=block_rows, dtype=str)
+        index = 0
+        while True:
+            chunk = await asyncio.to_thread(next, reader, None)
+            if chunk is None:
+                break
+            await asyncio.to_thread(_enqueue_chunk, chunk, index)
+            index += len(chunk)
+            await asyncio.to_thread(job_store.update_job, job_id, total=index, api_calls_saved=saved)
+        await asyncio.to_thread(job_store.update_job, job_id, total=index, api_calls_saved=saved, ingesting=False)
     except Exception as e:
-        return {
-            "business_name": "",
-            "business_address": "",
-            "contact_numbers": "",
-            "search_resources": f"Error: {str(e)}",
-        }
+        await asyncio.to_thread(job_store.update_job, job_id, status="error", error=str(e))
+
+async def _watch_worker_jobs() -> None:
+    """Report progress of worker-executed jobs and finish the ones whose chunks are all done."""
+    samples: Dict[str, deque] = {}
+    while True:
+        await asyncio.sleep(WORKER_WATCH_INTERVAL)
+        for job in await asyncio.to_thread(job_store.list_jobs, ["processing"]):
+            job_id = job["job_id"]
+            if job.get("execution") != "workers" or job.get("ingesting", True):
+                continue
+            counts = await asyncio.to_thread(job_store.chunk_counts, job_id)
+            if counts["queued"] or counts["leased"] or counts["deferred"]:
+                now = time.monotonic()
+                window = samples.setdefault(job_id, deque())
+                window.append((now, job.get("progress", 0)))
+                while len(window) > 2 and now - window[0][0] > THROUGHPUT_WINDOW:
+                    window.popleft()
+                elapsed = now - window[0][0]
+                rate = (job.get("progress", 0) - window[0][1]) / elapsed if elapsed > 0 else 0.0
+                remaining = job.get("total", 0) - job.get("progress", 0) - job.get("api_calls_saved", 0)
+                await asyncio.to_thread(job_store.update_job, job_id, in_flight=counts["leased"],
+                                        retrying=counts["deferred"], rows_per_sec=round(rate, 2),
+                                        eta_seconds=round(remaining / rate, 1) if rate > 0 else None)
+            elif await asyncio.to_thread(job_store.transition_job, job_id, "processing", "finalizing"):
+                # Only one web process wins the transition and writes the output
+                samples.pop(job_id, None)
+                try:
+                    await _complete_job(job_id, job["input_path"], job.get("total", 0))
+                except Exception as e:
+                    await asyncio.to_thread(job_store.update_job, job_id, status="error", error=str(e))
+                await asyncio.to_thread(_evict_old_jobs)
+
+async def run_job(job_id: str, input_path: str) -> None:
+    """
+    Run a job with the engine chosen at upload time.
+
+    A cancel request (see `cancel_job`) cancels this task: no further lookups are dispatched,
+    in-flight background responses are cancelled, rows finished so far are kept and the job
+    ends up "cancelled".
+    """
+    watcher = asyncio.create_task(_watch_for_cancel(job_id, asyncio.current_task()))
+    try:
+        job = await asyncio.to_thread(job_store.get_job, job_id)
+        if job and job.get("mode") == "batch":
+            await process_csv_batch(job_id, input_path)
+        elif job and job.get("execution") == "workers":
+            await enqueue_job(job_id, input_path)
+        else:
+            await process_csv_data(job_id, input_path)
+    except asyncio.CancelledError:
+        if not (await asyncio.to_thread(job_store.get_job, job_id) or {}).get("cancel_requested"):
+            raise
+        await _finish_cancelled_job(job_id)
+    finally:
+        watcher.cancel()
+
+async def _watch_for_cancel(job_id: str, task: asyncio.Task) -> None:
+    """Cancel `task` once the job is cancelled (the request may have been handled by another process)."""
+    while True:
+        await asyncio.sleep(CANCEL_CHECK_SECONDS)
+        job = await asyncio.to_thread(job_store.get_job, job_id)
+        if job is None or job.get("cancel_requested"):
+            task.cancel()
+            return
+
+async def _finish_cancelled_job(job_id: str) -> None:
+    """Cancel a cancelled job's unfinished batches and mark it cancelled."""
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        return
+    pending = [batch_id for batch_id, info in job.get("batches", {}).items()
+               if not info.get("collected") and info.get("status") not in TERMINAL_BATCH_STATUSES]
+    for batch_id, outcome in zip(pending, await asyncio.gather(
+            *[batch_runner.cancel(batch_id) for batch_id in pending], return_exceptions=True)):
+        if isinstance(outcome, Exception):
+            logger.warning(f"Could not cancel batch {batch_id}: {outcome}")
+    await asyncio.to_thread(job_store.update_job, job_id, status="cancelled", in_flight=0, retrying=0,
+                            eta_seconds=None, owner=WORKER_ID)
+
+def _iter_result_pages(job_id: str, page_size: int = 10000):
+    """Yield a job's stored results in row order, one page of (row_index, output row) at a time."""
+    after = -1
+    while True:
+        page = job_store.get_results(job_id, after=after, limit=page_size)
+        if not page:
+            return
+        yield page
+        after = page[-1][0]
+
+# Output files being written for a download, so concurrent requests for one file wait for the same write
+_output_writes: Dict[str, asyncio.Task] = {}
+
+async def _ensure_output(job_id: str, fmt: str) -> str:
+    """Path of a completed job's output file in `fmt`, written from the job store on first request."""
+    path = output_path(job_id, fmt)
+    if os.path.exists(path):
+        return path
+    write = _output_writes.get(path)
+    if write is None:
+        async def _write() -> None:
+            try:
+                await asyncio.to_thread(write_output, _iter_result_pages(job_id), path + ".part", fmt)
+                os.replace(path + ".part", path)
+            finally:
+                _output_writes.pop(path, None)
+        write = _output_writes[path] = asyncio.ensure_future(_write())
+    # Shielded: a client disconnecting doesn't abort a write other requests are waiting for
+    await asyncio.shield(write)
+    return path
+
+def _evict_old_jobs() -> None:
+    """Apply the retention policy and remove files belonging to evicted jobs."""
+    for job in job_store.evict(JOB_RETENTION_HOURS * 3600, MAX_STORED_JOBS):
+        outputs = [output_path(job["job_id"], fmt) for fmt in OUTPUT_FORMATS]
+        for path in (job.get("path"), job.get("input_path"), trace_path(job["job_id"]), *outputs):
+            if path and os.path.exists(path):
+                os.unlink(path)
+
+def _public_status(job: Dict) -> Dict:
+    """Fields of a job record that are returned by /status."""
+    status = job["status"]
+    if status in ACTIVE_STATUSES and time.time() - job["updated_at"] > STALE_JOB_SECONDS:
+        status = "interrupted"
+    public = {"status": status, "progress": job.get("progress", 0), "total": job.get("total", 0)}
+    for field in ("mode", "priority", "completed", "failed", "in_flight", "retrying", "rows_per_sec", "eta_seconds",
+                  "ingesting", "api_calls_saved", "batches", "filename", "error"):
+        if field in job:
+            public[field] = job[field]
+    if job.get("tiers"):
+        public["tiers"] = summarize_tiers(job["tiers"])
+    if job.get("failures"):
+        public["failures"] = summarize_failures(job["failures"])
+    return public
+
+def _start_job(job_id: str, input_path: str) -> None:
+    """Run a job in this process, keeping a reference so the task isn't garbage collected."""
+    task = asyncio.create_task(run_job(job_id, input_path))
+    running_jobs.add(task)
+    job_tasks[job_id] = task
+    task.add_done_callback(running_jobs.discard)
+    task.add_done_callback(lambda _task: job_tasks.pop(job_id, None) if job_tasks.get(job_id) is _task else None)
+
+running_jobs = set()
+# Tasks of the jobs running in this process, so a cancel request can stop them right away
+job_tasks: Dict[str, asyncio.Task] = {}
+# Jobs this process is writing the output of (worker-executed jobs are finalized outside job_tasks)
+finalizing_jobs: Set[str] = set()
+
+def _running_here(job_id: str) -> bool:
+    return job_id in job_tasks or job_id in finalizing_jobs
+
+async def _resume_stale_jobs() -> None:
+    """Periodically take over active jobs whose owner stopped heartbeating (crash, redeploy, dead worker)."""
+    while True:
+        for job in await asyncio.to_thread(job_store.list_jobs, ACTIVE_STATUSES):
+            if job.get("execution") == "workers" and job["status"] == "processing" and not job.get("ingesting", True):
+                # Fully enqueued: worker leases, not this process, keep the job going
+                continue
+            if _running_here(job["job_id"]):
+                # Late with its heartbeat (e.g. a blocked event loop), but still running in this process
+                continue
+            input_path = job.get("input_path", "")
+            if os.path.exists(input_path) and await asyncio.to_thread(job_store.claim_job, job["job_id"], WORKER_ID,
+                                                                      STALE_JOB_SECONDS):
+                logger.info(f"Resuming interrupted job: {job['job_id']}")
+                _start_job(job["job_id"], input_path)
+        await asyncio.sleep(STALE_JOB_SECONDS / 4)
+
+async def _monitor_loop_lag() -> None:
+    """Record how late the event loop runs a periodic timer (time the loop spent blocked or saturated)."""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(max(0.0, time.monotonic() - start - LOOP_LAG_INTERVAL))
+
+async def process_row(prompt: str, tier_stats: Optional[TierStats] = None, foreground: bool = False) -> Dict:
+    """Look up a single row by its prompt (see prompt_builder.py). Raises if the lookup fails."""
+    result = await llm_contact_search(prompt, tier_stats, foreground)
+    return format_result(result)
+
+class LookupRequest(BaseModel):
+    """One business to look up inline; the fields are the CSV input columns."""
+    business_name: Optional[str] = None
+    address: Optional[str] = None
+    web_page: Optional[str] = None
+    other_info: Optional[str] = None
+
+    def to_row(self) -> Dict:
+        values = {"Business_Name": self.business_name, "Address": self.address, "web_page": self.web_page,
+                  "other_info": self.other_info}
+        return {column: value.strip() for column, value in values.items() if value and value.strip()}
+
+class LookupBatchRequest(BaseModel):
+    rows: List[LookupRequest]
+
+def _answer_source(tier_stats: TierStats) -> str:
+    """Where an inline lookup's answer came from: the cache, the last tier tried, or an identical lookup in flight."""
+    if tier_stats.counters.get("cache", {}).get("hits"):
+        return "cache"
+    tiers = [tier for tier in tier_stats.counters if tier != "cache"]
+    return tiers[-1] if tiers else "coalesced"
+
+async def _lookup(request: LookupRequest) -> Dict:
+    """Look up one business through the cache, coalescing and lookup tiers; the output row plus timings."""
+    row = request.to_row()
+    if not row.get("Business_Name") and not row.get("Address"):
+        raise HTTPException(status_code=400, detail="business_name or address is required")
+    tier_stats = TierStats()
+    with api_scheduler.running(LOOKUP_API_FLOW), row_trace() as trace:
+        result = await process_row(build_prompt(row), tier_stats, LOOKUP_API_FOREGROUND)
+    # The vectorized normalize_contact_numbers costs a few ms of pandas overhead for a single row
+    result["unverified_numbers"] = ", ".join(unverified_entries(result["contact_numbers"]))
+    result["contact_numbers"] = ", ".join(extract_phone_numbers(result["contact_numbers"]))
+    # Stage timings in milliseconds; counts (polls) as they are
+    timing = {stage: round(value * 1000, 1) if isinstance(value, float) else value for stage, value in trace.items()}
+    return {"result": result, "source": _answer_source(tier_stats), "timing_ms": timing}
 
 @app.get("/")
 async def read_root():
@@ -164,92 +866,456 @@ async def read_root():
         )
 
 @app.post("/upload")
-async def upload_csv(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    """Upload and process CSV file."""
+async def upload_csv(file: UploadFile = File(...), mode: str = Form("realtime"), priority: str = Form(BULK),
+                     trace: Optional[bool] = Form(None)):
+    """
+    Upload and process CSV file. `mode=batch` runs the job through the OpenAI Batch API;
+    `priority=interactive` gives a small urgent job most of the API capacity while it runs next
+    to bulk jobs; `trace=true` records per-row stage timings (see /jobs/{job_id}/trace).
+    """
     try:
-        print(f"Received file: {file.filename}")
+        logger.info(f"Received file: {file.filename}")
         
         if not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="Only CSV files are allowed")
+        if mode not in ("realtime", "batch"):
+            raise HTTPException(status_code=400, detail="mode must be 'realtime' or 'batch'")
+        if priority not in PRIORITIES:
+            raise HTTPException(status_code=400, detail="priority must be 'interactive' or 'bulk'")
         
-        # Read CSV content
-        content = await file.read()
-        print(f"File size: {len(content)} bytes")
-        
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.csv') as tmp_file:
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
+        # Generate job ID
+        job_id = str(uuid.uuid4())
+        logger.info(f"Generated job ID: {job_id}")
+
+        # Stream the upload to disk in chunks instead of reading it into memory
+        os.makedirs("temp", exist_ok=True)
+        input_path = os.path.join("temp", f"input_{job_id}.csv")
+        size = 0
+        async with aiofiles.open(input_path, "wb") as out_file:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                await out_file.write(chunk)
+        logger.info(f"File size: {size} bytes")
         
-        # Read CSV with pandas
+        # Only the header is needed to validate the upload; rows are parsed while processing
         try:
-            df = pd.read_csv(tmp_file_path)
-            print(f"CSV loaded successfully. Shape: {df.shape}")
-            print(f"Columns: {list(df.columns)}")
+            columns = list(pd.read_csv(input_path, nrows=0).columns)
+            logger.info(f"Columns: {columns}")
         except Exception as e:
-            os.unlink(tmp_file_path)
+            os.unlink(input_path)
             raise HTTPException(status_code=400, detail=f"Error reading CSV: {str(e)}")
         
-        # Clean up temp file
-        os.unlink(tmp_file_path)
-        
-        # Validate required columns (flexible column names)
-        required_cols = ["business_name", "Business_Name", "address", "Address"]
-        if not any(col in df.columns for col in required_cols):
-            available_cols = ", ".join(df.columns)
+        # Validate required columns (flexible column names, see prompt_builder.COLUMN_ALIASES)
+        if not has_required_columns(columns):
+            os.unlink(input_path)
+            available_cols = ", ".join(columns)
             raise HTTPException(
                 status_code=400, 
-                detail=f"CSV must contain either 'business_name'/'Business_Name' or 'address'/'Address' columns. Available columns: {available_cols}"
+                detail=f"CSV must contain a business name (e.g. 'Business_Name') or address (e.g. 'Address') column. Available columns: {available_cols}"
             )
         
-        # Generate job ID
-        job_id = str(uuid.uuid4())
-        print(f"Generated job ID: {job_id}")
-        
         # Start background processing
-        background_tasks.add_task(process_csv_data, job_id, df)
+        await asyncio.to_thread(job_store.create_job, job_id, status="queued", mode=mode, priority=priority,
+                                execution=JOB_EXECUTION, progress=0, total=0, input_path=input_path, owner=WORKER_ID,
+                                trace=JOB_TRACE_ENABLED if trace is None else trace)
+        _start_job(job_id, input_path)
         
         return {"job_id": job_id, "message": "File uploaded successfully, processing started"}
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Upload error: {e}")
+        logger.exception(f"Upload error: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 @app.get("/status/{job_id}")
 async def get_job_status(job_id: str):
     """Get the status of a processing job."""
-    if job_id not in job_status:
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return _public_status(job)
+
+# Server-sent progress events are coalesced to at most one per SSE_INTERVAL seconds
+SSE_INTERVAL = 0.5
+SSE_KEEPALIVE_SECONDS = 15
+
+async def _progress_events(request: Request, job_id: str):
+    """Yield an SSE message whenever the job's public status changes, until it finishes."""
+    last_sent = None
+    last_write = time.monotonic()
+    while not await request.is_disconnected():
+        job = await asyncio.to_thread(job_store.get_job, job_id)
+        if job is None:
+            yield "event: error\ndata: {\"detail\": \"Job not found\"}\n\n"
+            return
+        status = _public_status(job)
+        if status != last_sent:
+            yield f"data: {json.dumps(status)}\n\n"
+            last_sent = status
+            last_write = time.monotonic()
+            if status["status"] in ("completed", "error", "cancelled"):
+                return
+        elif time.monotonic() - last_write > SSE_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_write = time.monotonic()
+        await asyncio.sleep(SSE_INTERVAL)
+
+@app.get("/events/{job_id}")
+async def stream_job_events(job_id: str, request: Request):
+    """Push job progress (counts, rows/sec, ETA) to the browser as server-sent events."""
+    if await asyncio.to_thread(job_store.get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return StreamingResponse(
+        _progress_events(request, job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Failed rows listed by /jobs/{job_id}/failures
+MAX_FAILURE_ROWS = 100
+
+@app.get("/jobs/{job_id}/failures")
+async def get_job_failures(job_id: str, limit: int = MAX_FAILURE_ROWS):
+    """Failure report for a job: failures by kind, retries, recovered rows and the rows that failed."""
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    limit = max(1, min(limit, MAX_FAILURE_ROWS))
+    page = await asyncio.to_thread(job_store.get_results, job_id, -1, limit, 0, None, ERROR_PREFIX)
+    return {
+        "job_id": job_id,
+        "failed": job.get("failed", 0),
+        **summarize_failures(job.get("failures", {})),
+        "circuit_breaker": circuit_breaker.stats(),
+        "rows": [{"row_index": index, "error": result.get("search_resources", "")[len(ERROR_PREFIX):]}
+                 for index, result in page if result.get("search_resources", "").startswith(ERROR_PREFIX)],
+    }
+
+@app.post("/lookup")
+async def lookup(request: LookupRequest):
+    """
+    Look up one business and return its output row inline, with the source of the answer
+    (cache, web_page, search_low, ...) and the milliseconds spent per stage.
+    """
+    try:
+        return await _lookup(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        kind = classify_failure(e)
+        raise HTTPException(status_code=LOOKUP_FAILURE_STATUS.get(kind, 502), detail={"error": str(e), "failure": kind})
+
+@app.post("/lookup/batch")
+async def lookup_batch(request: LookupBatchRequest):
+    """
+    Look up up to LOOKUP_BATCH_MAX_ROWS businesses concurrently. Results come back in request
+    order; a row that failed has `error` and `failure` (its failure kind) instead of `result`.
+    """
+    if not request.rows:
+        raise HTTPException(status_code=400, detail="rows must not be empty")
+    if len(request.rows) > LOOKUP_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {LOOKUP_BATCH_MAX_ROWS} rows per request; "
+                                                    "upload a CSV for larger jobs")
+
+    async def _lookup_row(row: LookupRequest) -> Dict:
+        try:
+            return await _lookup(row)
+        except HTTPException as e:
+            return {"error": e.detail, "failure": CLIENT}
+        except Exception as e:
+            return {"error": str(e), "failure": classify_failure(e)}
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[_lookup_row(row) for row in request.rows])
+    return {"results": results, "timing_ms": {"total": round((time.perf_counter() - start) * 1000, 1)}}
+
+@app.get("/jobs/{job_id}/trace")
+async def download_job_trace(job_id: str):
+    """
+    Per-row timing trace of a traced job as NDJSON: one line per attempted row with the seconds
+    spent in each stage (queue_wait, slot_wait, create, background_queue, background_wait, parse,
+    page_fetch, row_total), the poll count and the outcome.
+    """
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
+    path = trace_path(job_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No trace for this job (upload with trace=true or set JOB_TRACE_ENABLED=1)")
+    return FileResponse(path, filename=f"trace_{job_id}.jsonl", media_type="application/x-ndjson")
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Stop a running job: nothing new is dispatched, in-flight responses and batches are
+    cancelled, and the rows finished so far stay available for download.
+    """
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "finalizing":
+        raise HTTPException(status_code=409, detail="Job is already writing its output")
+    if job["status"] not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Job is not running (status: {job['status']})")
+    await asyncio.to_thread(job_store.update_job, job_id, cancel_requested=True)
+
+    task = job_tasks.get(job_id)
+    if task is not None:
+        task.cancel()
+        await asyncio.wait({task}, timeout=STALE_JOB_SECONDS)
+    elif (job.get("execution") == "workers" and not job.get("ingesting", True)) \
+            or time.time() - job["updated_at"] > STALE_JOB_SECONDS:
+        # Nothing in a web process is running the job: worker processes drop its chunks
+        # once they see the cancel request, and nobody else would mark it cancelled
+        await _finish_cancelled_job(job_id)
+    # Otherwise another web process owns the job and stops it within CANCEL_CHECK_SECONDS
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    return {"job_id": job_id, "status": job["status"], "completed_rows": job.get("progress", 0),
+            "message": "Job cancelled" if job["status"] == "cancelled" else "Job is being cancelled"}
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: str):
+    """Resume an interrupted, failed or cancelled job, skipping rows that already completed."""
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "completed":
+        raise HTTPException(status_code=400, detail="Job already completed")
+    if not os.path.exists(job.get("input_path", "")):
+        raise HTTPException(status_code=410, detail="Input file for this job is no longer available")
+    if _running_here(job_id):
+        raise HTTPException(status_code=409, detail="Job is already processing")
+    if job["status"] in ("error", "cancelled"):
+        await asyncio.to_thread(job_store.update_job, job_id, status="queued", owner=WORKER_ID, cancel_requested=False)
+    elif not await asyncio.to_thread(job_store.claim_job, job_id, WORKER_ID, STALE_JOB_SECONDS):
+        raise HTTPException(status_code=409, detail="Job is already processing")
     
-    return job_status[job_id]
+    _start_job(job_id, job["input_path"])
+    completed_rows = await asyncio.to_thread(job_store.count_results, job_id)
+    return {"job_id": job_id, "completed_rows": completed_rows, "message": "Job resumed"}
+
+# Page sizes for /results
+RESULTS_PAGE_SIZE = 100
+MAX_RESULTS_PAGE_SIZE = 1000
+NDJSON_BATCH_SIZE = 1000
+
+def _contacts_filter(contacts: str) -> Optional[bool]:
+    """Map the `contacts` query parameter to the job store's missing_contacts filter."""
+    filters = {"all": None, "missing": True, "found": False}
+    if contacts not in filters:
+        raise HTTPException(status_code=400, detail="contacts must be one of: all, missing, found")
+    return filters[contacts]
+
+def _selected_columns(columns: Optional[str]) -> List[str]:
+    if not columns:
+        return OUTPUT_COLUMNS
+    selected = [col.strip() for col in columns.split(",") if col.strip()]
+    unknown = [col for col in selected if col not in OUTPUT_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+    return selected
+
+def _result_row(index: int, result: Dict, columns: List[str]) -> Dict:
+    return {"row_index": index, **{col: result.get(col, "") for col in columns}}
+
+async def _stream_ndjson(job_id: str, cursor: int, columns: List[str], missing_contacts, search):
+    """Yield matching results as newline-delimited JSON, reading the store one batch at a time."""
+    while True:
+        page = await asyncio.to_thread(
+            job_store.get_results, job_id, cursor, NDJSON_BATCH_SIZE, 0, missing_contacts, search
+        )
+        if not page:
+            return
+        yield "".join(json.dumps(_result_row(index, result, columns)) + "\n" for index, result in page)
+        cursor = page[-1][0]
 
 @app.get("/results/{job_id}")
-async def get_results(job_id: str):
-    """Get the results of a completed job."""
-    if job_id not in results_storage:
+async def get_results(
+    job_id: str,
+    cursor: int = -1,
+    offset: int = 0,
+    limit: int = RESULTS_PAGE_SIZE,
+    columns: Optional[str] = None,
+    contacts: str = "all",
+    q: Optional[str] = None,
+    format: str = "json",
+):
+    """
+    Get one page of a job's results. While the job is still running, only the rows
+    completed so far are returned (check `status`).
+
+    Rows come back in original order starting after row index `cursor` (pass the returned
+    `next_cursor` to get the next page; `offset` skips matching rows instead). `columns`
+    selects output columns, `contacts` keeps only rows with (`found`) or without (`missing`)
+    contact numbers, and `q` is a text search. `format=ndjson` streams every matching row.
+    """
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Results not found")
+    selected = _selected_columns(columns)
+    missing_contacts = _contacts_filter(contacts)
     
-    return results_storage[job_id]["data"]
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_ndjson(job_id, cursor, selected, missing_contacts, q),
+            media_type="application/x-ndjson",
+        )
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    
+    limit = max(1, min(limit, MAX_RESULTS_PAGE_SIZE))
+    page = await asyncio.to_thread(job_store.get_results, job_id, cursor, limit, offset, missing_contacts, q)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "total": job.get("total", 0),
+        "completed": job.get("progress", 0),
+        "rows": [_result_row(index, result, selected) for index, result in page],
+        "next_cursor": page[-1][0] if len(page) == limit else None,
+    }
+
+@app.get("/results/{job_id}/summary")
+async def get_results_summary(job_id: str):
+    """Get counts of a job's results, with and without contact numbers."""
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    total = await asyncio.to_thread(job_store.count_results, job_id)
+    with_contacts = await asyncio.to_thread(job_store.count_results, job_id, False)
+    return {"total": total, "with_contacts": with_contacts, "without_contacts": total - with_contacts}
 
 @app.get("/download/{job_id}")
-async def download_results(job_id: str):
-    """Download the results CSV file."""
-    if job_id not in results_storage:
+async def download_results(job_id: str, format: str = "csv"):
+    """
+    Download the results as `format`: csv, csv.gz, csv.zst, ndjson or parquet.
+
+    Completed jobs are served from a file (written on the first download of a format) with
+    HTTP range support, so interrupted downloads can resume. While a job is still running this
+    streams the rows completed so far as csv or ndjson, in original row order, with a leading
+    `row_index` column since some rows are still missing.
+    """
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Results not found")
+    if format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(OUTPUT_FORMATS)}")
+    if not format_available(format):
+        raise HTTPException(status_code=501, detail=f"{format} output needs the {OUTPUT_FORMATS[format][2]} package")
+    extension, media_type, _ = OUTPUT_FORMATS[format]
     
-    file_path = results_storage[job_id]["path"]
-    filename = results_storage[job_id]["filename"]
+    if job["status"] != "completed":
+        if format not in STREAMING_FORMATS:
+            raise HTTPException(status_code=409, detail=f"{format} output is available once the job has completed")
+        pages = _iter_result_pages(job_id)
+        return StreamingResponse(
+            ndjson_pages(pages, with_row_index=True) if format == "ndjson" else csv_pages(pages, with_row_index=True),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="partial_output_{job_id}.{extension}"'},
+        )
     
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
+    if format == "csv":
+        file_path = job["path"]
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail="File not found")
+    else:
+        file_path = await _ensure_output(job_id, format)
     
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type='application/octet-stream'
+    return FileResponse(path=file_path, filename=os.path.basename(file_path), media_type=media_type)
+
+@app.get("/formats")
+async def get_formats():
+    """Download formats this install can write (csv.zst and parquet need optional packages)."""
+    return {"formats": [fmt for fmt in OUTPUT_FORMATS if format_available(fmt)], "streaming": list(STREAMING_FORMATS)}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss counters and size of the lookup cache, plus request coalescing counters."""
+    return {**await asyncio.to_thread(lookup_cache.stats), "coalescing": single_flight.stats()}
+
+@app.get("/ratelimit/stats")
+async def get_rate_limit_stats():
+    """Get the current state of the shared OpenAI rate limiter and the job scheduler in front of it."""
+    return {**rate_limiter.stats(), "scheduler": api_scheduler.stats()}
+
+@app.get("/client/stats")
+async def get_client_stats():
+    """
+    Get OpenAI HTTP connection pool metrics (a high pool wait means the client, not the API,
+    is the bottleneck) and hedged request counters.
+    """
+    return {**pool_metrics.stats(), "hedging": hedge_policy.stats()}
+
+JOB_GAUGES = {
+    field: registry.gauge(f"skiptrace_job_{name}", help, ["job_id"])
+    for field, name, help in (
+        ("rows_per_sec", "rows_per_second", "Rows finished per second over the last THROUGHPUT_WINDOW seconds"),
+        ("in_flight", "in_flight_rows", "Rows with a lookup in progress"),
+        ("retrying", "retrying_rows", "Rows waiting for a deferred retry"),
+        ("remaining", "remaining_rows", "Rows left to look up"),
     )
+}
+ACTIVE_JOBS = registry.gauge("skiptrace_active_jobs", "Jobs that are queued, processing or finalizing", ["status"])
+
+@registry.collector
+def _component_metrics():
+    """Scrape-time gauges and counters read from the shared OpenAI client components."""
+    limiter, pool, poller, breaker = rate_limiter.stats(), pool_metrics.stats(), response_poller.stats(), circuit_breaker.stats()
+    scheduler = api_scheduler.stats()
+    return [
+        ("skiptrace_openai_in_flight", "OpenAI calls holding a rate limiter slot", "gauge", [({}, limiter["in_flight"])]),
+        ("skiptrace_openai_concurrency_limit", "Current adaptive concurrency window", "gauge",
+         [({}, limiter["concurrency_limit"])]),
+        ("skiptrace_openai_rate_limited_total", "Rate limited (429) OpenAI calls", "counter",
+         [({}, limiter["rate_limited"])]),
+        ("skiptrace_scheduler_calls", "OpenAI calls per job holding or waiting for a scheduler slot", "gauge",
+         [({"job_id": job_id, "state": state}, job[state]) for job_id, job in scheduler["jobs"].items()
+          for state in ("in_use", "waiting")]),
+        ("skiptrace_pending_responses", "Background responses being polled", "gauge", [({}, poller["pending"])]),
+        ("skiptrace_response_retrieves_total", "Retrieve calls made by the response poller", "counter",
+         [({}, poller["retrieves"])]),
+        ("skiptrace_http_pool_wait_p95_seconds", "p95 wait for a pooled HTTP connection", "gauge",
+         [({}, pool["pool_wait_p95_ms"] / 1000)]),
+        ("skiptrace_cache_lookups_total", "Lookup cache lookups by result", "counter",
+         [({"result": "hit"}, lookup_cache.hits), ({"result": "miss"}, lookup_cache.misses)]),
+        ("skiptrace_coalesced_lookups_total", "Lookups that shared an identical in-flight call", "counter",
+         [({}, single_flight.coalesced)]),
+        ("skiptrace_circuit_breaker_open", "1 while the circuit breaker holds back OpenAI calls", "gauge",
+         [({}, int(breaker["state"] != "closed"))]),
+        ("skiptrace_circuit_breaker_trips_total", "Times the circuit breaker opened", "counter",
+         [({}, breaker["trips"])]),
+        ("skiptrace_hedged_requests_total", "Hedged requests sent, and how many finished first", "counter",
+         [({"result": "sent"}, hedge_policy.hedges), ({"result": "won"}, hedge_policy.hedge_wins)]),
+    ]
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus-style metrics: per-stage row timing histograms, rows/failures/retries counters,
+    OpenAI client state, event-loop lag and progress of active jobs. Lookups run by worker.py
+    processes are exported by those processes (worker.py --metrics-port).
+    """
+    jobs = await asyncio.to_thread(job_store.list_jobs, ACTIVE_STATUSES)
+    for gauge in (*JOB_GAUGES.values(), ACTIVE_JOBS):
+        gauge.clear()
+    for job in jobs:
+        ACTIVE_JOBS.inc(status=job["status"])
+        remaining = job.get("total", 0) - job.get("progress", 0) - job.get("api_calls_saved", 0)
+        for field, gauge in JOB_GAUGES.items():
+            value = max(0, remaining) if field == "remaining" else job.get(field)
+            gauge.set(value or 0, job_id=job["job_id"])
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.delete("/cache")
+async def clear_cache():
+    """Remove all entries from the lookup cache."""
+    return {"removed": await asyncio.to_thread(lookup_cache.clear)}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,210 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from openai import NOT_GIVEN
+
+from failures import BAD_JSON, CLIENT, MODEL_FAILURE, RATE_LIMIT, SERVER, TIMEOUT, LookupFailure, RetryPolicy
+from WebSearchLLM import client_openai, SEARCH_REQUEST_TEMPLATE, build_search_request, lookup_cache, prompt_key
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/responses"
+TERMINAL_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Batch requests run asynchronously on OpenAI's side, so there is nothing to poll for
+BATCH_REQUEST_TEMPLATE = {key: value for key, value in SEARCH_REQUEST_TEMPLATE.items() if key != "background"}
+
+# OpenAI limits per batch input file
+MAX_BATCH_REQUESTS = 50_000
+MAX_BATCH_FILE_BYTES = 190 * 1024 * 1024
+
+
+class BatchLookupError(LookupFailure):
+    """A lookup that did not produce a result inside a batch."""
+
+    def __init__(self, message: str, kind: str = MODEL_FAILURE):
+        super().__init__(kind, message)
+
+
+def _status_kind(status_code) -> str:
+    """Failure kind of a batch request that came back with an HTTP error status."""
+    if status_code == 429:
+        return RATE_LIMIT
+    if status_code is None or status_code >= 500:
+        return SERVER
+    return CLIENT
+
+
+def _output_text(body: Dict) -> str:
+    """Text of the assistant message in a Responses API response body."""
+    for item in body.get("output", []):
+        if item.get("type") == "message":
+            return item["content"][0]["text"]
+    raise BatchLookupError(f"Response {body.get('id')} has no message output (status: {body.get('status')})")
+
+
+class BatchRunner:
+    """
+    Runs lookups through the OpenAI Batch API instead of one background response per row.
+
+    Requests are identified by `custom_id`; callers pick ids that let them map results
+    back (e.g. the prompt key, so duplicate rows share one request).
+    """
+
+    def __init__(self, client=client_openai, work_dir: str = "temp", poll_interval: float = 30.0,
+                 max_requests: int = MAX_BATCH_REQUESTS, completion_window: str = "24h"):
+        self.client = client
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self.completion_window = completion_window
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "BatchRunner":
+        """Build a runner from BATCH_* environment variables."""
+        return cls(
+            poll_interval=float(os.getenv("BATCH_POLL_SECONDS", 30)),
+            max_requests=min(int(os.getenv("BATCH_MAX_REQUESTS", MAX_BATCH_REQUESTS)), MAX_BATCH_REQUESTS),
+            **kwargs,
+        )
+
+    def chunk(self, requests: Iterable[Tuple[str, str]]):
+        """Group (custom_id, prompt) pairs into JSONL batch input lines within the per-file limits."""
+        lines, size = [], 0
+        for custom_id, prompt in requests:
+            line = json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": build_search_request(prompt, BATCH_REQUEST_TEMPLATE),
+            }) + "\n"
+            if lines and (len(lines) >= self.max_requests or size + len(line) > MAX_BATCH_FILE_BYTES):
+                yield lines
+                lines, size = [], 0
+            lines.append(line)
+            size += len(line)
+        if lines:
+            yield lines
+
+    async def submit(self, lines: List[str], metadata: Optional[Dict] = None) -> str:
+        """Upload one JSONL input file and start a batch for it. Returns the batch id."""
+        os.makedirs(self.work_dir, exist_ok=True)
+        path = os.path.join(self.work_dir, f"batch_input_{uuid.uuid4().hex}.jsonl")
+
+        def _write() -> None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+
+        await asyncio.to_thread(_write)
+        try:
+            with open(path, "rb") as f:
+                input_file = await self.client.files.create(file=f, purpose="batch")
+        finally:
+            os.unlink(path)
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+            metadata=metadata or NOT_GIVEN,
+        )
+        logger.info(f"Submitted batch {batch.id} with {len(lines)} requests")
+        return batch.id
+
+    async def wait(self, batch_id: str, on_update=None):
+        """Poll a batch until it reaches a terminal status; `on_update(batch)` is called after every poll."""
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if on_update is not None:
+                on_update(batch)
+            if batch.status in TERMINAL_BATCH_STATUSES:
+                return batch
+            await asyncio.sleep(self.poll_interval)
+
+    async def cancel(self, batch_id: str) -> None:
+        await self.client.batches.cancel(batch_id)
+
+    async def iter_results(self, batch):
+        """Yield (custom_id, result dict or BatchLookupError) for every request the batch answered."""
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            # Output files can be large: stream them line by line instead of loading them whole
+            async with self.client.files.with_streaming_response.content(file_id) as response:
+                async for line in response.iter_lines():
+                    if line.strip():
+                        yield self._parse_line(json.loads(line))
+
+    @staticmethod
+    def _parse_line(record: Dict):
+        custom_id = record["custom_id"]
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or (response.get("body") or {}).get("error") or {}
+            return custom_id, BatchLookupError(error.get("message") or f"HTTP {response.get('status_code')}",
+                                               _status_kind(response.get("status_code")))
+        try:
+            return custom_id, json.loads(_output_text(response["body"]))
+        except BatchLookupError as e:
+            return custom_id, e
+        except (ValueError, KeyError, IndexError) as e:
+            return custom_id, BatchLookupError(str(e), BAD_JSON)
+
+
+async def batch_contact_search(prompts: List[str], runner: Optional[BatchRunner] = None,
+                               retry_policy: Optional[RetryPolicy] = None) -> List:
+    """
+    Look up every prompt through the Batch API.
+
+    Cached prompts are answered locally and duplicates are sent once. With a `retry_policy`,
+    requests that failed for a retryable reason are resubmitted in follow-up batches, up to its
+    number of rounds (like batch-mode jobs in the web app). Returns one result dict (or
+    BatchLookupError) per prompt, in input order.
+    """
+    runner = runner or BatchRunner.from_env()
+    results: List = [None] * len(prompts)
+    by_key: Dict[str, List[int]] = {}
+    unique = []
+    for index, (prompt, cached) in enumerate(zip(prompts, await lookup_cache.aget_many(prompts))):
+        if cached is not None:
+            results[index] = cached
+            continue
+        key = prompt_key(prompt)
+        if key not in by_key:
+            by_key[key] = []
+            unique.append((key, prompt))
+        by_key[key].append(index)
+
+    retries = 0
+    # (key, prompt) of requests that failed for a retryable reason in the current round
+    retry: List[Tuple[str, str]] = []
+
+    async def _run(lines: List[str]) -> None:
+        batch = await runner.wait(await runner.submit(lines))
+        async for key, result in runner.iter_results(batch):
+            indices = by_key.get(key)
+            if not indices:
+                continue
+            if isinstance(result, Exception) and retry_policy is not None \
+                    and retry_policy.should_retry(result, retries):
+                retry.append((key, prompts[indices[0]]))
+                continue
+            del by_key[key]
+            if not isinstance(result, Exception):
+                await lookup_cache.aset(prompts[indices[0]], result)
+            for index in indices:
+                results[index] = result
+
+    while unique:
+        await asyncio.gather(*[_run(lines) for lines in runner.chunk(unique)])
+        unique, retry = retry, []
+        retries += 1
+        if unique:
+            logger.info(f"Resubmitting {len(unique)} failed requests (retry {retries})")
+    for indices in by_key.values():
+        for index in indices:
+            results[index] = BatchLookupError("No result returned by the batch", TIMEOUT)
+    return results
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI Responses API used by the benchmark harness.
+
+Implements `POST /v1/responses`, `GET /v1/responses/{id}` and
+`POST /v1/responses/{id}/cancel` with configurable latency distributions,
+background queue time, stragglers, injected 429/500 errors (with retry-after headers)
+and rate-limit headers, plus the Files and Batches endpoints used by batch
+mode and fake business web pages (`GET /site/{name}`) for the web_page
+lookup tier, so the pipeline can be measured without spending money.
+
+Run standalone:
+    python bench/mock_openai_server.py --port 9100 --latency-mean 8 --error-429-rate 0.02
+and point the app at it with OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+
+app = FastAPI(title="Mock OpenAI Responses API")
+
+# Overridden from the command line (see main()) or by run_benchmark.py
+config = {
+    "latency_dist": "lognormal",   # fixed | uniform | lognormal
+    "latency_mean": 8.0,           # seconds from creation until the response completes
+    "latency_sigma": 0.5,          # spread (uniform: +/- fraction of mean, lognormal: sigma)
+    "queue_time": 0.5,             # seconds a background response stays "queued"
+    "error_429_rate": 0.0,
+    "error_500_rate": 0.0,
+    "failed_rate": 0.0,            # fraction of responses that end with status "failed"
+    "straggler_rate": 0.0,         # fraction of responses that take straggler_factor times longer
+    "straggler_factor": 10.0,
+    "retry_after": 1,
+    "empty_rate": 0.1,             # fraction of lookups that find no contact numbers
+    "low_context_empty_rate": 0.35,  # the same with search_context_size "low"
+    "low_context_latency": 0.6,    # latency of a low-context search relative to latency_mean
+    "site_phone_rate": 0.6,        # fraction of fake business web pages that show a phone number
+    "rpm_limit": 10000,
+    "tpm_limit": 10_000_000,
+    "batch_latency": 5.0,          # seconds until a submitted batch completes
+}
+
+responses = {}
+files = {}
+batches = {}
+counters = {"create": 0, "retrieve": 0, "cancel": 0, "rate_limited": 0, "server_errors": 0,
+            "batches": 0, "batch_requests": 0, "page_fetches": 0}
+
+# Valid NANP area codes used to build realistic fake numbers
+AREA_CODES = ["210", "212", "305", "312", "415", "512", "602", "713", "718", "972"]
+
+
+def sample_latency() -> float:
+    mean = config["latency_mean"]
+    sigma = config["latency_sigma"]
+    if config["latency_dist"] == "fixed":
+        return mean
+    if config["latency_dist"] == "uniform":
+        return random.uniform(mean * (1 - sigma), mean * (1 + sigma))
+    # Lognormal with the requested mean
+    mu = math.log(mean) - sigma ** 2 / 2
+    return random.lognormvariate(mu, sigma)
+
+
+def fake_result(prompt: str, empty_rate: float = None) -> dict:
+    """Deterministic structured output for a prompt."""
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    numbers = []
+    if digest[0] / 255 >= (config["empty_rate"] if empty_rate is None else empty_rate):
+        for i in range(1 + digest[1] % 2):
+            area = AREA_CODES[digest[2 + i] % len(AREA_CODES)]
+            exchange = 200 + digest[4 + i] % 700
+            if exchange % 100 == 11:
+                exchange += 1  # N11 exchanges are not valid
+            line = int.from_bytes(digest[6 + 2 * i:8 + 2 * i], "big") % 10000
+            numbers.append(f"({area}) {exchange}-{line:04d}")
+    name = prompt.split(",")[0].replace("Business Name:", "").strip() or "Unknown business"
+    return {
+        "business_name": name,
+        "business_address": "",
+        "contact_numbers": numbers,
+        "search_resources": "(mock.example.com)",
+    }
+
+
+def response_body(response_id: str) -> dict:
+    record = responses[response_id]
+    now = time.time()
+    if record["cancelled"]:
+        status = "cancelled"
+    elif now < record["created"] + record["queue_time"]:
+        status = "queued"
+    elif now < record["done_at"]:
+        status = "in_progress"
+    elif record["failed"]:
+        status = "failed"
+    else:
+        status = "completed"
+
+    output = []
+    if status == "completed":
+        output = [
+            {"type": "web_search_call", "id": f"ws_{response_id}", "status": "completed"},
+            {
+                "type": "message",
+                "id": f"msg_{response_id}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": json.dumps(record["result"]), "annotations": []}],
+            },
+        ]
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": int(record["created"]),
+        "status": status,
+        "error": {"code": "server_error", "message": "The model failed (mock)"} if status == "failed" else None,
+        "model": record["model"],
+        "output": output,
+        "parallel_tool_calls": True,
+        "tool_choice": "required",
+        "tools": [],
+        "usage": {
+            "input_tokens": record["input_tokens"],
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": 120,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": record["input_tokens"] + 120,
+        },
+    }
+
+
+def rate_limit_headers() -> dict:
+    return {
+        "x-ratelimit-limit-requests": str(config["rpm_limit"]),
+        "x-ratelimit-remaining-requests": str(config["rpm_limit"] - 1),
+        "x-ratelimit-reset-requests": "6ms",
+        "x-ratelimit-limit-tokens": str(config["tpm_limit"]),
+        "x-ratelimit-remaining-tokens": str(config["tpm_limit"] - 3000),
+        "x-ratelimit-reset-tokens": "18ms",
+    }
+
+
+def _error(status_code: int, message: str, error_type: str) -> JSONResponse:
+    headers = {"retry-after": str(config["retry_after"]), **rate_limit_headers()}
+    if status_code == 429:
+        headers["x-ratelimit-remaining-requests"] = "0"
+    return JSONResponse({"error": {"message": message, "type": error_type}}, status_code=status_code, headers=headers)
+
+
+@app.post("/v1/responses")
+async def create_response(request: Request):
+    counters["create"] += 1
+    roll = random.random()
+    if roll < config["error_429_rate"]:
+        counters["rate_limited"] += 1
+        return _error(429, "Rate limit reached (mock)", "rate_limit_exceeded")
+    if roll < config["error_429_rate"] + config["error_500_rate"]:
+        counters["server_errors"] += 1
+        return _error(500, "Internal server error (mock)", "server_error")
+
+    body = await request.json()
+    prompt = body["input"][-1]["content"][0]["text"]
+    response_id = f"resp_{uuid.uuid4().hex}"
+    background = body.get("background", False)
+    low_context = any(tool.get("search_context_size") == "low" for tool in body.get("tools", []))
+    created = time.time()
+    latency = sample_latency() * (config["low_context_latency"] if low_context else 1.0)
+    if random.random() < config["straggler_rate"]:
+        latency *= config["straggler_factor"]
+    responses[response_id] = {
+        "created": created,
+        "queue_time": config["queue_time"] if background else 0.0,
+        "done_at": created + (config["queue_time"] if background else 0.0) + latency,
+        "cancelled": False,
+        "failed": random.random() < config["failed_rate"],
+        "model": body.get("model", "gpt-4.1-mini"),
+        "input_tokens": len(json.dumps(body)) // 4,
+        "result": fake_result(prompt, config["low_context_empty_rate"] if low_context else None),
+    }
+    if not background:
+        await asyncio.sleep(max(0.0, responses[response_id]["done_at"] - time.time()))
+    return JSONResponse(response_body(response_id), headers=rate_limit_headers())
+
+
+@app.get("/v1/responses/{response_id}")
+async def retrieve_response(response_id: str):
+    counters["retrieve"] += 1
+    if response_id not in responses:
+        return _error(404, "No such response", "invalid_request_error")
+    return JSONResponse(response_body(response_id))
+
+
+@app.post("/v1/responses/{response_id}/cancel")
+async def cancel_response(response_id: str):
+    counters["cancel"] += 1
+    if response_id not in responses:
+        return _error(404, "No such response", "invalid_request_error")
+    responses[response_id]["cancelled"] = True
+    return JSONResponse(response_body(response_id))
+
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    file_id = f"file-{uuid.uuid4().hex}"
+    content = await file.read()
+    files[file_id] = content
+    return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": file.filename, "purpose": purpose, "status": "processed"}
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    if file_id not in files:
+        return _error(404, "No such file", "invalid_request_error")
+    return PlainTextResponse(files[file_id])
+
+
+def _finish_batch(record: dict) -> None:
+    """Answer every request in a batch's input file, writing output and error files."""
+    output, errors = [], []
+    for line in files[record["input_file_id"]].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        counters["batch_requests"] += 1
+        if random.random() < config["error_500_rate"]:
+            errors.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                           "response": {"status_code": 500, "request_id": uuid.uuid4().hex,
+                                        "body": {"error": {"message": "Internal server error (mock)"}}},
+                           "error": None})
+            continue
+        response_id = f"resp_{uuid.uuid4().hex}"
+        prompt = request["body"]["input"][-1]["content"][0]["text"]
+        created = time.time()
+        responses[response_id] = {"created": created, "queue_time": 0.0, "done_at": created, "cancelled": False,
+                                  "failed": False,
+                                  "model": request["body"].get("model", "gpt-4.1-mini"),
+                                  "input_tokens": len(line) // 4, "result": fake_result(prompt)}
+        output.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                       "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                                    "body": response_body(response_id)},
+                       "error": None})
+        del responses[response_id]
+    for name, records in (("output_file_id", output), ("error_file_id", errors)):
+        if records:
+            file_id = f"file-{uuid.uuid4().hex}"
+            files[file_id] = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+            record[name] = file_id
+    record["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+
+
+def batch_body(batch_id: str) -> dict:
+    record = batches[batch_id]
+    now = time.time()
+    if record["status"] not in ("cancelled", "completed"):
+        if now >= record["done_at"]:
+            _finish_batch(record)
+            record["status"] = "completed"
+            record["completed_at"] = int(now)
+        elif now >= record["created_at"] + 0.5:
+            record["status"] = "in_progress"
+    return {key: value for key, value in record.items() if key != "done_at"}
+
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    if body.get("input_file_id") not in files:
+        return _error(400, "Unknown input file", "invalid_request_error")
+    counters["batches"] += 1
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    created = time.time()
+    total = sum(1 for line in files[body["input_file_id"]].splitlines() if line.strip())
+    batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body["endpoint"],
+        "input_file_id": body["input_file_id"],
+        "completion_window": body.get("completion_window", "24h"),
+        "status": "validating",
+        "created_at": int(created),
+        "done_at": created + config["batch_latency"],
+        "output_file_id": None,
+        "error_file_id": None,
+        "metadata": body.get("metadata"),
+        "request_counts": {"total": total, "completed": 0, "failed": 0},
+    }
+    return batch_body(batch_id)
+
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    if batch_id not in batches:
+        return _error(404, "No such batch", "invalid_request_error")
+    return batch_body(batch_id)
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    if batch_id not in batches:
+        return _error(404, "No such batch", "invalid_request_error")
+    if batches[batch_id]["status"] not in ("completed", "failed", "expired"):
+        batches[batch_id]["status"] = "cancelled"
+    return batch_body(batch_id)
+
+
+@app.get("/site/{name}")
+async def business_page(name: str):
+    """A fake business home page; `site_phone_rate` of them show a click-to-call number."""
+    counters["page_fetches"] += 1
+    digest = hashlib.sha256(name.encode("utf-8")).digest()
+    contact = ""
+    if digest[0] / 255 < config["site_phone_rate"]:
+        area = AREA_CODES[digest[1] % len(AREA_CODES)]
+        number = f"({area}) {200 + digest[2] % 700}-{int.from_bytes(digest[3:5], 'big') % 10000:04d}"
+        if number[7:9] == "11":
+            number = number[:7] + "12" + number[9:]  # N11 exchanges are not valid
+        contact = f'<p>Call us: <a href="tel:{number}">{number}</a></p>'
+    html = (f"<html><head><title>{name}</title><script>var id = 2125550123;</script></head>"
+            f"<body><h1>{name}</h1><p>Open Mon-Fri 9-5</p>{contact}</body></html>")
+    return HTMLResponse(html)
+
+
+@app.get("/mock/stats")
+async def get_stats():
+    """Call counters since the last reset."""
+    return counters
+
+
+@app.post("/mock/reset")
+async def reset(request: Request):
+    """Clear counters and stored responses, optionally updating the configuration."""
+    updates = await request.json() if await request.body() else {}
+    config.update({key: type(config[key])(value) for key, value in updates.items() if key in config})
+    responses.clear()
+    files.clear()
+    batches.clear()
+    for key in counters:
+        counters[key] = 0
+    return config
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Command-line flags for every entry in `config` (shared with run_benchmark.py)."""
+    for key, default in config.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(default), default=default)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config.update({key: getattr(args, key) for key in config})
+    # Keep idle connections open like the real API so client-side pooling is exercised
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", timeout_keep_alive=75)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the skip-trace pipeline.
+
+Starts bench/mock_openai_server.py as a local stand-in for the OpenAI Responses API,
+generates synthetic CSV datasets and runs the full pipeline against it:
+
+  backend  upload -> processing -> CSV download through the FastAPI app (in-process)
+  app      the batch `main()` in app.py (as a subprocess)
+
+Reports rows/sec, p50/p95/p99 per-row latency, API calls per row, peak RSS and
+event-loop lag for each dataset size.
+
+Examples:
+    python bench/run_benchmark.py --rows 100,1000,10000
+    python bench/run_benchmark.py --rows 100000 --latency-mean 10 --error-429-rate 0.02 --json results.json
+    python bench/run_benchmark.py --target app --rows 1000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.mock_openai_server import add_config_arguments, config as mock_defaults  # noqa: E402
+
+STREETS = ["Main St", "Oak Ave", "Gulfdale St", "Stratford Road", "Commerce Blvd", "Elm St", "Park Ave"]
+CITIES = ["San Antonio, TX 78216", "Baldwin, NY 11510", "Austin, TX 78701", "Phoenix, AZ 85004", "Miami, FL 33101"]
+SUFFIXES = ["", " LLC", " Inc", " Co"]
+
+
+def _variant(row, rng: random.Random):
+    """The same business written differently: case, legal suffix, spacing and URL form."""
+    name, address, web_page, other_info = row
+    name = rng.choice([name.upper(), name.lower(), name + ", LLC", "The " + name])
+    address = address.replace(" St", " Street").replace("\n", rng.choice([", ", "\n", "  "]))
+    if web_page.startswith("http://127.0.0.1"):
+        web_page += rng.choice(["/", ""])  # pages on the mock server only vary in the trailing slash
+    elif web_page:
+        web_page = rng.choice(["https://www.", "http://", ""]) + web_page + rng.choice(["/", ""])
+    return [name, address, web_page, other_info]
+
+
+def generate_dataset(path: str, rows: int, duplicate_rate: float, seed: int = 42, site_url: str = None) -> None:
+    """
+    Write a synthetic input CSV; `duplicate_rate` of the rows repeat an earlier business (written
+    differently). With `site_url`, web pages point at the mock server's fake business pages.
+    """
+    rng = random.Random(seed)
+    businesses = []
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Business_Name", "Address", "web_page", "other_info"])
+        for i in range(rows):
+            if businesses and rng.random() < duplicate_rate:
+                writer.writerow(_variant(rng.choice(businesses), rng))
+                continue
+            name = f"Business {i}{rng.choice(SUFFIXES)}"
+            # Multi-line addresses like the real exports
+            address = f"{rng.randint(1, 9999)} {rng.choice(STREETS)}\n{rng.choice(CITIES)}\nUSA"
+            web_page = ""
+            if rng.random() < 0.3:
+                web_page = f"{site_url}/site/business{i}" if site_url else f"business{i}.example.com"
+            row = [name, address, web_page, ""]
+            if len(businesses) < 100_000:
+                businesses.append(row)
+            writer.writerow(row)
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. how long the event loop was blocked."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self) -> None:
+        self.samples = []
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+
+def start_mock_server(args) -> subprocess.Popen:
+    command = [sys.executable, os.path.join(ROOT, "bench", "mock_openai_server.py"), "--port", str(args.mock_port)]
+    for key in mock_defaults:
+        command += [f"--{key.replace('_', '-')}", str(getattr(args, key))]
+    process = subprocess.Popen(command)
+    import httpx
+
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{args.mock_port}/mock/stats", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Mock OpenAI server did not start")
+
+
+def configure_environment(args, workdir: str) -> dict:
+    env = {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.mock_port}/v1",
+        "LOOKUP_CACHE_ENABLED": "1" if args.cache else "0",
+        "LOOKUP_CACHE_PATH": os.path.join(workdir, "lookup_cache.sqlite3"),
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "RESUME_JOBS_ON_STARTUP": "0",
+        "OPENAI_RPM_LIMIT": str(args.rpm),
+        "OPENAI_TPM_LIMIT": str(args.tpm),
+        "OPENAI_MAX_CONCURRENCY": str(args.max_concurrency),
+        "PROCESSING_MODE": args.mode,
+        "JOB_EXECUTION": "workers" if args.workers else "inline",
+        "BATCH_POLL_SECONDS": "1",
+        # Generated web pages are served by the mock on 127.0.0.1
+        "PAGE_FETCH_ALLOW_PRIVATE": "1",
+    }
+    os.environ.update(env)
+    return env
+
+
+async def bench_backend(args, dataset: str, rows: int) -> dict:
+    """Upload `dataset` to the FastAPI app, wait for the job and download the CSV."""
+    import httpx
+    import uvicorn
+    import backend.main as backend
+
+    latencies = []
+    process_row = backend.process_row
+
+    async def timed_process_row(row, *args):
+        start = time.perf_counter()
+        try:
+            return await process_row(row, *args)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    backend.process_row = timed_process_row
+    server = uvicorn.Server(uvicorn.Config(backend.app, host="127.0.0.1", port=args.app_port, log_level="warning"))
+    server_task = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    monitor = LoopLagMonitor()
+    peak_rss = current_rss_mb()
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    try:
+        async with httpx.AsyncClient(timeout=None) as client:
+            await client.post(f"{mock_url}/mock/reset")
+            monitor.start()
+            start = time.perf_counter()
+            with open(dataset, "rb") as f:
+                upload = await client.post(f"{app_url}/upload", files={"file": ("bench.csv", f, "text/csv")},
+                                           data={"mode": args.mode})
+            upload.raise_for_status()
+            job_id = upload.json()["job_id"]
+            first_result = None
+            while True:
+                status = (await client.get(f"{app_url}/status/{job_id}")).json()
+                peak_rss = max(peak_rss, current_rss_mb())
+                if first_result is None and status.get("progress"):
+                    first_result = time.perf_counter() - start
+                if status["status"] in ("completed", "error"):
+                    break
+                await asyncio.sleep(0.25)
+            download = await client.get(f"{app_url}/download/{job_id}")
+            elapsed = time.perf_counter() - start
+            monitor.stop()
+            mock_stats = (await client.get(f"{mock_url}/mock/stats")).json()
+            pool_stats = (await client.get(f"{app_url}/client/stats")).json()
+    finally:
+        backend.process_row = process_row
+        server.should_exit = True
+        await server_task
+
+    if status["status"] != "completed":
+        raise RuntimeError(f"Job failed: {status.get('error')}")
+    return {
+        "target": "backend",
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(rows / elapsed, 1),
+        "first_result_seconds": round(first_result or elapsed, 2),
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        "requests_per_row": round((mock_stats["create"] + mock_stats["batch_requests"]) / rows, 3),
+        "retrieves_per_row": round(mock_stats["retrieve"] / rows, 3),
+        "rate_limited": mock_stats["rate_limited"],
+        "server_errors": mock_stats["server_errors"],
+        "failed_rows": status.get("failed", 0),
+        "pool_wait_p95_ms": pool_stats["pool_wait_p95_ms"],
+        "peak_rss_mb": round(peak_rss, 1),
+        "loop_lag_p99_ms": round(percentile(monitor.samples, 99) * 1000, 1),
+        "loop_lag_max_ms": round(max(monitor.samples, default=0) * 1000, 1),
+        "download_bytes": len(download.content),
+        "page_fetches": mock_stats["page_fetches"],
+        "tiers": status.get("tiers", {}),
+        "retried_rows": status.get("failures", {}).get("retries", 0),
+        "recovered_rows": status.get("failures", {}).get("recovered_rows", 0),
+        "hedged": pool_stats.get("hedging", {}).get("hedges", 0),
+        "cancelled_responses": mock_stats["cancel"],
+    }
+
+
+def bench_app(args, dataset: str, rows: int, workdir: str) -> dict:
+    """Run app.py's main() on `dataset` in a scratch directory."""
+    import httpx
+
+    run_dir = os.path.join(workdir, f"app_{rows}")
+    os.makedirs(run_dir, exist_ok=True)
+    shutil.copy(dataset, os.path.join(run_dir, "data.csv"))
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    httpx.post(f"{mock_url}/mock/reset")
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT, "app.py")], cwd=run_dir, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    mock_stats = httpx.get(f"{mock_url}/mock/stats").json()
+    return {
+        "target": "app",
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(rows / elapsed, 1),
+        "requests_per_row": round((mock_stats["create"] + mock_stats["batch_requests"]) / rows, 3),
+        "retrieves_per_row": round(mock_stats["retrieve"] / rows, 3),
+        "rate_limited": mock_stats["rate_limited"],
+        "server_errors": mock_stats["server_errors"],
+        # Max RSS over all finished child processes, i.e. the largest app.py run so far
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def print_table(results) -> None:
+    columns = ["target", "rows", "seconds", "rows_per_sec", "first_result_seconds", "latency_p50", "latency_p95",
+               "latency_p99", "requests_per_row", "retrieves_per_row", "failed_rows", "retried_rows", "recovered_rows",
+               "hedged", "cancelled_responses", "pool_wait_p95_ms", "peak_rss_mb",
+               "loop_lag_p99_ms", "loop_lag_max_ms"]
+    columns = [col for col in columns if any(col in result for result in results)]
+    widths = {col: max(len(col), *(len(str(result.get(col, ""))) for result in results)) for col in columns}
+    print("  ".join(col.rjust(widths[col]) for col in columns))
+    for result in results:
+        print("  ".join(str(result.get(col, "")).rjust(widths[col]) for col in columns))
+    for result in results:
+        for tier, stats in result.get("tiers", {}).items():
+            print(f"  {result['rows']} rows  {tier:<12} hit rate {stats['hit_rate']:.2f} ({stats['hits']}/"
+                  f"{stats['attempts']})  avg {stats['avg_latency_ms']:.0f} ms  est. ${stats['cost_usd']:.2f}")
+
+
+async def main_async(args) -> list:
+    workdir = tempfile.mkdtemp(prefix="skiptrace_bench_")
+    configure_environment(args, workdir)
+    os.chdir(workdir)  # the backend writes its temp/ directory relative to the working directory
+    mock = start_mock_server(args)
+    workers = None
+    if args.workers:
+        workers = subprocess.Popen([sys.executable, os.path.join(ROOT, "worker.py"), "--processes", str(args.workers)],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = []
+    try:
+        if args.target == "backend":
+            import logging
+            import backend.main  # noqa: F401  (import once, after the environment is configured)
+
+            for name in ("httpx", "openai"):
+                logging.getLogger(name).setLevel(logging.WARNING)
+        for rows in args.rows:
+            dataset = os.path.join(workdir, f"dataset_{rows}.csv")
+            generate_dataset(dataset, rows, args.duplicate_rate, site_url=f"http://127.0.0.1:{args.mock_port}")
+            print(f"Running {args.target} benchmark with {rows} rows...", file=sys.stderr)
+            if args.target == "backend":
+                # The pipeline prints per-call progress; keep the report readable
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    result = await bench_backend(args, dataset, rows)
+            else:
+                result = bench_app(args, dataset, rows, workdir)
+            results.append(result)
+    finally:
+        for process in (workers, mock):
+            if process is not None:
+                process.terminate()
+                process.wait()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["backend", "app"], default="backend")
+    parser.add_argument("--rows", type=lambda value: [int(v) for v in value.split(",")], default=[100, 1000, 10000],
+                        help="comma-separated dataset sizes, e.g. 100,1000,10000,100000,1000000")
+    parser.add_argument("--mode", choices=["realtime", "batch"], default="realtime",
+                        help="processing engine: one background response per row, or the Batch API")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run lookups in this many worker.py processes (JOB_EXECUTION=workers)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="fraction of rows repeating a business")
+    parser.add_argument("--cache", action="store_true", help="enable the lookup cache (off by default)")
+    parser.add_argument("--rpm", type=float, default=1_000_000, help="OPENAI_RPM_LIMIT for the rate limiter")
+    parser.add_argument("--tpm", type=float, default=1_000_000_000, help="OPENAI_TPM_LIMIT for the rate limiter")
+    parser.add_argument("--max-concurrency", type=int, default=1000, help="OPENAI_MAX_CONCURRENCY")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=9101)
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep generated datasets and outputs")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    results = asyncio.run(main_async(args))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from phone_numbers import normalize_phone_numbers, unverified_phone_numbers
+
+# Columns of every output row, in output CSV order
+OUTPUT_COLUMNS = [
+    "business_name",
+    "business_address",
+    "contact_numbers",
+    "unverified_numbers",
+    "search_resources",
+]
+
+# Prefix of `search_resources` in the row recorded for a failed lookup
+ERROR_PREFIX = "Error: "
+
+
+def format_result(result: Dict) -> Dict:
+    """Output row for a lookup result."""
+    return {
+        "business_name": result.get("business_name", ""),
+        "business_address": result.get("business_address", ""),
+        "contact_numbers": ", ".join(result.get("contact_numbers", [])),
+        "unverified_numbers": "",
+        "search_resources": result.get("search_resources", ""),
+    }
+
+
+def error_result(error: Exception) -> Dict:
+    """Output row recorded for a row whose lookup failed."""
+    return {
+        "business_name": "",
+        "business_address": "",
+        "contact_numbers": "",
+        "unverified_numbers": "",
+        "search_resources": f"{ERROR_PREFIX}{error}",
+    }
+
+
+def normalize_contact_numbers(rows: List[Tuple[int, Dict]]) -> List[Tuple[int, Dict]]:
+    """
+    Output rows with their contact numbers validated and rewritten in E.164 form, in one vectorized
+    pass; entries that did not fully validate are kept as given in `unverified_numbers`.
+    """
+    if not rows:
+        return rows
+    raw = pd.Series([result.get("contact_numbers", "") for _, result in rows])
+    numbers, unverified = normalize_phone_numbers(raw).tolist(), unverified_phone_numbers(raw).tolist()
+    return [(index, {**result, "contact_numbers": number, "unverified_numbers": extra})
+            for (index, result), number, extra in zip(rows, numbers, unverified)]
@@ -0,0 +1,318 @@
+"""
+Failure handling for lookups: classification, deferred row retries and a circuit breaker.
+
+Every failed lookup is classified into a `kind`. Rows that failed for a retryable reason
+are not retried in place (which would keep a worker busy sleeping) but put back on a
+deferred queue and tried again later; a process-wide circuit breaker stops dispatching
+new calls while the provider is failing most of them, so retries don't pile onto an outage.
+"""
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT = "rate_limit"
+SERVER = "server"
+TIMEOUT = "timeout"
+BAD_JSON = "bad_json"
+MODEL_FAILURE = "model_failure"
+CLIENT = "client"
+OTHER = "other"
+
+# Failures worth trying again later; client errors (bad request, auth) will fail the same way
+RETRYABLE_KINDS = {RATE_LIMIT, SERVER, TIMEOUT, BAD_JSON, MODEL_FAILURE}
+# Failures that point at the provider being unhealthy (rate limits are handled by the rate limiter)
+OUTAGE_KINDS = {SERVER, TIMEOUT, MODEL_FAILURE}
+
+
+class LookupFailure(Exception):
+    """A lookup that failed, with the failure `kind` and an optional server-suggested retry delay."""
+
+    def __init__(self, kind: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{kind}: {message}")
+        self.kind = kind
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE_KINDS
+
+
+def classify_failure(error: BaseException) -> str:
+    """Failure kind of an exception raised by a lookup."""
+    if isinstance(error, LookupFailure):
+        return error.kind
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError, TimeoutError)):
+        return TIMEOUT
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return RATE_LIMIT
+    if status_code is not None:
+        return SERVER if status_code >= 500 else CLIENT
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, ConnectionError)):
+        return SERVER
+    return OTHER
+
+
+def as_lookup_failure(error: BaseException, retry_after: Optional[float] = None) -> LookupFailure:
+    """`error` as a classified LookupFailure (returned unchanged if it already is one)."""
+    if isinstance(error, LookupFailure):
+        return error
+    failure = LookupFailure(classify_failure(error), str(error) or type(error).__name__, retry_after)
+    failure.__cause__ = error
+    return failure
+
+
+def is_retryable(error: BaseException) -> bool:
+    return classify_failure(error) in RETRYABLE_KINDS
+
+
+class RetryPolicy:
+    """How often and how long after a failure a row is tried again (exponential backoff with jitter)."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 5.0, max_delay: float = 120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Build a policy from ROW_RETRY_* environment variables."""
+        return cls(
+            max_attempts=int(os.getenv("ROW_RETRY_ATTEMPTS", 3)),
+            base_delay=float(os.getenv("ROW_RETRY_BASE_DELAY", 5)),
+            max_delay=float(os.getenv("ROW_RETRY_MAX_DELAY", 120)),
+        )
+
+    def should_retry(self, error: BaseException, retries: int) -> bool:
+        """Whether a row that has been retried `retries` times already gets another try."""
+        return retries < self.max_attempts and is_retryable(error)
+
+    def delay(self, error: BaseException, retries: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** retries) * (1 + random.random() / 2)
+        return max(delay, getattr(error, "retry_after", None) or 0.0)
+
+
+class DeferredQueue:
+    """
+    Items waiting to be retried, each released once its delay has passed. Waiting items
+    are only heap entries, so a deferred row holds no worker or concurrency slot.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _event(self) -> asyncio.Event:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def defer(self, item, delay: float) -> None:
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), item))
+        self._event().set()
+
+    async def get(self):
+        """Wait for the next item whose delay has passed."""
+        wakeup = self._event()
+        while True:
+            wakeup.clear()
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                return heapq.heappop(self._heap)[2]
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class CircuitBreaker:
+    """
+    Process-wide breaker in front of every OpenAI call.
+
+    While closed, outcomes of recent calls are tracked; when at least `min_failures` of the
+    last `window` calls failed with an outage-type failure and they make up `failure_rate` of
+    the window, the breaker opens and every caller waits for `cooldown` seconds. Then a single
+    probe call is let through: success closes the breaker, failure opens it again for twice
+    as long (up to `max_cooldown`). Waiting callers are woken as soon as the probe's outcome
+    is recorded rather than polling the state.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, window: int = 20, min_failures: int = 10,
+                 cooldown: float = 15.0, max_cooldown: float = 300.0):
+        self.failure_rate = failure_rate
+        self.min_failures = min_failures
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.open_until = 0.0
+        self.trips = 0
+        self.waits = 0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+        self._loop = None
+        self._changed = None
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """Build a breaker from CIRCUIT_* environment variables."""
+        return cls(
+            failure_rate=float(os.getenv("CIRCUIT_FAILURE_RATE", 0.5)),
+            window=int(os.getenv("CIRCUIT_WINDOW", 20)),
+            min_failures=int(os.getenv("CIRCUIT_MIN_FAILURES", 10)),
+            cooldown=float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", 15)),
+        )
+
+    def _state_changed(self) -> asyncio.Event:
+        """Event set on the next change of state or probe; one per event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._changed is None:
+            self._loop = loop
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _notify(self) -> None:
+        """Wake every caller waiting in `wait` to look at the state again."""
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    async def wait(self) -> None:
+        """Wait until a call may be dispatched."""
+        waited = False
+        while True:
+            now = time.monotonic()
+            if self.state == "closed":
+                break
+            if self.state == "open" and now >= self.open_until:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                break
+            waited = True
+            changed = self._state_changed()
+            if self.state == "half_open":
+                # Until the probe call's outcome is recorded
+                await changed.wait()
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), self.open_until - now)
+            except asyncio.TimeoutError:
+                pass
+        self.waits += waited
+
+    def record_success(self) -> None:
+        self._outcomes.append(False)
+        if self.state == "half_open":
+            logger.info("Circuit breaker closed: provider calls are succeeding again")
+            self.state = "closed"
+            self.cooldown = self.base_cooldown
+            self._outcomes.clear()
+        self._probing = False
+        self._notify()
+
+    def record_failure(self, kind: str) -> None:
+        outage = kind in OUTAGE_KINDS
+        self._outcomes.append(outage)
+        if self.state == "half_open":
+            if outage:
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self._open()
+            else:
+                self.state = "closed"
+        elif self.state == "closed" and outage:
+            failures = sum(self._outcomes)
+            if failures >= self.min_failures and failures >= self.failure_rate * len(self._outcomes):
+                self._open()
+        self._probing = False
+        self._notify()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.open_until = time.monotonic() + self.cooldown
+        self.trips += 1
+        logger.warning(f"Circuit breaker open for {self.cooldown:.0f}s: most recent OpenAI calls failed")
+
+    @asynccontextmanager
+    async def guard(self):
+        """Wait for the breaker, then record how the call made inside the block went."""
+        await self.wait()
+        try:
+            yield self
+        except asyncio.CancelledError:
+            # A cancelled probe says nothing about the provider: let the next caller probe
+            self._probing = False
+            self._notify()
+            raise
+        except Exception as e:
+            self.record_failure(classify_failure(e))
+            raise
+        else:
+            self.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "open_seconds_remaining": round(max(0.0, self.open_until - time.monotonic()), 1)
+            if self.state == "open" else 0.0,
+            "recent_failure_rate": round(sum(self._outcomes) / len(self._outcomes), 3) if self._outcomes else 0.0,
+            "cooldown_seconds": self.cooldown,
+            "waits": self.waits,
+        }
+
+
+class FailureReport:
+    """
+    Per-job failure counters: failed attempts and rows that finally failed, by kind, plus
+    rows deferred for a retry and rows that succeeded on a retry. `counters` is plain JSON
+    ({group: {name: count}}) so it can be stored on the job and added up across workers.
+    """
+
+    def __init__(self, counters: Dict[str, Dict[str, int]] = None):
+        self.counters = counters if counters is not None else {}
+        for group in ("attempts", "final", "rows"):
+            self.counters.setdefault(group, {})
+
+    def _add(self, group: str, name: str) -> None:
+        self.counters[group][name] = self.counters[group].get(name, 0) + 1
+
+    def failed_attempt(self, error: BaseException) -> None:
+        self._add("attempts", classify_failure(error))
+
+    def deferred(self) -> None:
+        self._add("rows", "deferred")
+
+    def recovered(self) -> None:
+        self._add("rows", "recovered")
+
+    def gave_up(self, error: BaseException) -> None:
+        self._add("final", classify_failure(error))
+
+
+def summarize_failures(counters: Dict[str, Dict[str, int]]) -> Dict:
+    """Failure report returned by the API, from stored FailureReport counters."""
+    rows = counters.get("rows", {})
+    return {
+        "failed_attempts": counters.get("attempts", {}),
+        "failed_rows": counters.get("final", {}),
+        "retries": rows.get("deferred", 0),
+        "recovered_rows": rows.get("recovered", 0),
+    }
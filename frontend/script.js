@@ -1,7 +1,12 @@
 // Global variables
 let currentJobId = null;
 let progressInterval = null;
+let progressEvents = null;
 let currentResults = [];
+let nextCursor = -1;
+let loadingPage = false;
+let searchTimeout = null;
+const RESULTS_PAGE_SIZE = 100;
 
 // DOM elements
 const fileUploadArea = document.getElementById('fileUploadArea');
@@ -10,6 +15,8 @@ const fileInfo = document.getElementById('fileInfo');
 const fileName = document.getElementById('fileName');
 const fileSize = document.getElementById('fileSize');
 const uploadBtn = document.getElementById('uploadBtn');
+const modeSelect = document.getElementById('modeSelect');
+const prioritySelect = document.getElementById('prioritySelect');
 const uploadSection = document.getElementById('uploadSection');
 const progressSection = document.getElementById('progressSection');
 const resultsSection = document.getElementById('resultsSection');
@@ -19,9 +26,16 @@ const progressPercentage = document.getElementById('progressPercentage');
 const estimatedTime = document.getElementById('estimatedTime');
 const processingStatus = document.getElementById('processingStatus');
 const downloadBtn = document.getElementById('downloadBtn');
+const formatSelect = document.getElementById('formatSelect');
+const partialResults = document.getElementById('partialResults');
+const partialDownloadBtn = document.getElementById('partialDownloadBtn');
 const newUploadBtn = document.getElementById('newUploadBtn');
+const cancelJobBtn = document.getElementById('cancelJobBtn');
+const startOverBtn = document.getElementById('startOverBtn');
 const resultsTableBody = document.getElementById('resultsTableBody');
 const searchInput = document.getElementById('searchInput');
+const contactsFilter = document.getElementById('contactsFilter');
+const tableWrapper = document.getElementById('tableWrapper');
 const totalBusinesses = document.getElementById('totalBusinesses');
 const totalContacts = document.getElementById('totalContacts');
 const successRate = document.getElementById('successRate');
@@ -32,8 +46,27 @@ const errorMessage = document.getElementById('errorMessage');
 // Initialize event listeners
 document.addEventListener('DOMContentLoaded', function() {
     initializeEventListeners();
+    loadFormats();
 });
 
+// Hide download formats whose optional package isn't installed on the server
+async function loadFormats() {
+    try {
+        const response = await fetch('/formats');
+        if (!response.ok) {
+            return;
+        }
+        const { formats } = await response.json();
+        Array.from(formatSelect.options).forEach(option => {
+            if (!formats.includes(option.value)) {
+                option.remove();
+            }
+        });
+    } catch (error) {
+        console.error('Error loading download formats:', error);
+    }
+}
+
 function initializeEventListeners() {
     // File input change
     csvFileInput.addEventListener('change', handleFileSelect);
@@ -46,14 +79,21 @@ function initializeEventListeners() {
     // Upload button
     uploadBtn.addEventListener('click', uploadFile);
     
-    // Download button
+    // Download buttons (the partial one is shown while a job is still running)
     downloadBtn.addEventListener('click', downloadResults);
+    partialDownloadBtn.addEventListener('click', downloadPartialResults);
     
-    // New upload button
+    // New upload buttons, and cancelling a running job
     newUploadBtn.addEventListener('click', resetToUpload);
+    startOverBtn.addEventListener('click', resetToUpload);
+    cancelJobBtn.addEventListener('click', cancelJob);
     
-    // Search input
+    // Search input and contacts filter
     searchInput.addEventListener('input', filterResults);
+    contactsFilter.addEventListener('change', filterResults);
+
+    // Load the next page of results when the table is scrolled near the bottom
+    tableWrapper.addEventListener('scroll', handleTableScroll);
 }
 
 // File handling functions
@@ -115,6 +155,8 @@ async function uploadFile() {
 
     const formData = new FormData();
     formData.append('file', file);
+    formData.append('mode', modeSelect.value);
+    formData.append('priority', prioritySelect.value);
 
     try {
         const response = await fetch('/upload', {
@@ -155,10 +197,38 @@ function showProgress() {
 }
 
 function startProgressTracking() {
+    // Prefer server-sent events; fall back to polling /status if the stream can't be used
+    if (window.EventSource) {
+        progressEvents = new EventSource(`/events/${currentJobId}`);
+        progressEvents.onmessage = event => handleStatusUpdate(JSON.parse(event.data));
+        progressEvents.onerror = () => {
+            if (progressEvents && progressEvents.readyState === EventSource.CLOSED) {
+                console.warn('Progress stream closed, falling back to polling');
+                stopProgressTracking();
+                startPolling();
+            }
+        };
+    } else {
+        startPolling();
+    }
+}
+
+function startPolling() {
     progressInterval = setInterval(checkProgress, 2000);
     checkProgress(); // Check immediately
 }
 
+function stopProgressTracking() {
+    if (progressEvents) {
+        progressEvents.close();
+        progressEvents = null;
+    }
+    if (progressInterval) {
+        clearInterval(progressInterval);
+        progressInterval = null;
+    }
+}
+
 async function checkProgress() {
     if (!currentJobId) return;
 
@@ -174,20 +244,49 @@ async function checkProgress() {
         }
 
         const status = await response.json();
-        console.log('Status update:', status);
+        await handleStatusUpdate(status);
+    } catch (error) {
+        console.error('Error checking progress:', error);
+    }
+}
+
+async function handleStatusUpdate(status) {
+    console.log('Status update:', status);
 
-        updateProgressDisplay(status);
+    updateProgressDisplay(status);
 
-        if (status.status === 'completed') {
-            clearInterval(progressInterval);
-            await loadResults();
-        } else if (status.status === 'error') {
-            clearInterval(progressInterval);
-            showError('Processing failed: ' + status.error);
-            resetToUpload();
+    if (status.status === 'completed') {
+        stopProgressTracking();
+        await loadResults();
+    } else if (status.status === 'error') {
+        stopProgressTracking();
+        showError('Processing failed: ' + status.error);
+        resetToUpload();
+    } else if (status.status === 'cancelled') {
+        // Rows finished before the cancel can still be downloaded
+        stopProgressTracking();
+        cancelJobBtn.style.display = 'none';
+        startOverBtn.style.display = 'flex';
+        estimatedTime.textContent = '-';
+    }
+}
+
+async function cancelJob() {
+    if (!currentJobId || !confirm('Cancel this job? Rows finished so far are kept.')) return;
+
+    cancelJobBtn.disabled = true;
+    try {
+        const response = await fetch(`/jobs/${currentJobId}/cancel`, { method: 'POST' });
+        const result = await response.json();
+        if (!response.ok) {
+            throw new Error(result.detail || 'Cancel failed');
         }
+        // The final status arrives through the progress stream
+        processingStatus.textContent = result.message;
     } catch (error) {
-        console.error('Error checking progress:', error);
+        showError('Could not cancel the job: ' + error.message);
+    } finally {
+        cancelJobBtn.disabled = false;
     }
 }
 
@@ -197,15 +296,20 @@ function updateProgressDisplay(status) {
     const percentage = total > 0 ? Math.round((progress / total) * 100) : 0;
 
     progressFill.style.width = `${percentage}%`;
-    progressText.textContent = `${progress} / ${total} processed`;
+    progressText.textContent = `${progress} / ${total} processed` +
+        (status.failed ? ` (${status.failed} failed)` : '') +
+        (status.rows_per_sec ? ` · ${status.rows_per_sec} rows/sec` : '') +
+        (status.api_calls_saved ? ` · ${status.api_calls_saved} duplicates` : '');
     progressPercentage.textContent = `${percentage}%`;
-    processingStatus.textContent = status.status.charAt(0).toUpperCase() + status.status.slice(1);
+    processingStatus.textContent = status.status.charAt(0).toUpperCase() + status.status.slice(1) +
+        (status.in_flight ? ` (${status.in_flight} in flight)` : '');
+
+    // Completed rows can be downloaded before the whole job finishes
+    partialResults.style.display = progress > 0 ? 'flex' : 'none';
 
-    // Calculate estimated time
-    if (progress > 0 && total > 0) {
-        const remainingItems = total - progress;
-        const estimatedSeconds = (remainingItems / progress) * 30; // Rough estimate
-        estimatedTime.textContent = formatTime(estimatedSeconds);
+    // Estimated time comes from the server's measured throughput
+    if (status.eta_seconds !== undefined && status.eta_seconds !== null) {
+        estimatedTime.textContent = formatTime(status.eta_seconds);
     }
 }
 
@@ -218,34 +322,72 @@ function formatTime(seconds) {
 // Results functions
 async function loadResults() {
     try {
-        const response = await fetch(`/results/${currentJobId}`);
-        const results = await response.json();
-        
-        currentResults = results;
-        displayResults(results);
+        const response = await fetch(`/results/${currentJobId}/summary`);
+        const summary = await response.json();
+
+        displaySummary(summary);
         showResults();
+        await reloadResults();
     } catch (error) {
         showError('Failed to load results: ' + error.message);
     }
 }
 
-function displayResults(results) {
-    // Update summary
-    const totalBusinessesCount = results.length;
-    const totalContactsCount = results.filter(r => r.contact_numbers && r.contact_numbers.trim()).length;
+function displaySummary(summary) {
+    const totalBusinessesCount = summary.total;
+    const totalContactsCount = summary.with_contacts;
     const successRateValue = totalBusinessesCount > 0 ? Math.round((totalContactsCount / totalBusinessesCount) * 100) : 0;
 
     totalBusinesses.textContent = totalBusinessesCount;
     totalContacts.textContent = totalContactsCount;
     successRate.textContent = successRateValue + '%';
-
-    // Populate table
-    populateTable(results);
 }
 
-function populateTable(results) {
+async function reloadResults() {
+    // Start again from the first page (e.g. after the search or filter changed)
+    currentResults = [];
+    nextCursor = -1;
     resultsTableBody.innerHTML = '';
+    tableWrapper.scrollTop = 0;
+    await loadNextPage();
+}
+
+async function loadNextPage() {
+    if (!currentJobId || loadingPage || nextCursor === null) return;
+    loadingPage = true;
+
+    const params = new URLSearchParams({
+        cursor: nextCursor,
+        limit: RESULTS_PAGE_SIZE,
+        contacts: contactsFilter.value
+    });
+    const searchTerm = searchInput.value.trim();
+    if (searchTerm) params.set('q', searchTerm);
+
+    try {
+        const response = await fetch(`/results/${currentJobId}?${params}`);
+        if (!response.ok) {
+            throw new Error('Failed to load results page');
+        }
+        const page = await response.json();
+
+        currentResults = currentResults.concat(page.rows);
+        nextCursor = page.next_cursor;
+        appendRows(page.rows);
+    } catch (error) {
+        showError('Failed to load results: ' + error.message);
+    } finally {
+        loadingPage = false;
+    }
+}
+
+function handleTableScroll() {
+    if (tableWrapper.scrollTop + tableWrapper.clientHeight >= tableWrapper.scrollHeight - 200) {
+        loadNextPage();
+    }
+}
 
+function appendRows(results) {
     results.forEach(row => {
         const tr = document.createElement('tr');
         
@@ -263,9 +405,13 @@ function populateTable(results) {
         const contactTd = document.createElement('td');
         if (row.contact_numbers && row.contact_numbers.trim()) {
             const contacts = row.contact_numbers.split(',').map(c => c.trim()).filter(c => c);
-            contactTd.innerHTML = contacts.map(contact => 
-                `<span class="contact-number">${contact}</span>`
-            ).join(' ');
+            contacts.forEach(contact => {
+                const badge = document.createElement('span');
+                badge.className = 'contact-number';
+                badge.textContent = contact;
+                contactTd.appendChild(badge);
+                contactTd.appendChild(document.createTextNode(' '));
+            });
         } else {
             contactTd.textContent = 'No contacts found';
             contactTd.style.color = '#a0aec0';
@@ -289,36 +435,38 @@ function showResults() {
 
 // Filter and search functions
 function filterResults() {
-    const searchTerm = searchInput.value.toLowerCase();
-    const filteredResults = currentResults.filter(row => {
-        return (
-            (row.business_name && row.business_name.toLowerCase().includes(searchTerm)) ||
-            (row.business_address && row.business_address.toLowerCase().includes(searchTerm)) ||
-            (row.contact_numbers && row.contact_numbers.toLowerCase().includes(searchTerm)) ||
-            (row.search_resources && row.search_resources.toLowerCase().includes(searchTerm))
-        );
-    });
-    populateTable(filteredResults);
+    // Debounce so typing doesn't fire a request per keystroke; filtering happens server-side
+    clearTimeout(searchTimeout);
+    searchTimeout = setTimeout(reloadResults, 300);
 }
 
 // Download and export functions
 async function downloadResults() {
+    await saveDownload('skip_trace_results', formatSelect.value);
+}
+
+async function downloadPartialResults() {
+    await saveDownload('partial_skip_trace_results', 'csv');
+}
+
+async function saveDownload(filePrefix, format) {
     if (!currentJobId) return;
 
     try {
-        const response = await fetch(`/download/${currentJobId}`);
+        const response = await fetch(`/download/${currentJobId}?format=${encodeURIComponent(format)}`);
         if (response.ok) {
             const blob = await response.blob();
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
-            a.download = `skip_trace_results_${new Date().toISOString().split('T')[0]}.csv`;
+            a.download = `${filePrefix}_${new Date().toISOString().split('T')[0]}.${format}`;
             document.body.appendChild(a);
             a.click();
             window.URL.revokeObjectURL(url);
             document.body.removeChild(a);
         } else {
-            throw new Error('Download failed');
+            const error = await response.json().catch(() => ({}));
+            throw new Error(error.detail || 'Download failed');
         }
     } catch (error) {
         showError('Download failed: ' + error.message);
@@ -369,11 +517,8 @@ function resetToUpload() {
     currentJobId = null;
     currentResults = [];
     
-    // Clear progress interval
-    if (progressInterval) {
-        clearInterval(progressInterval);
-        progressInterval = null;
-    }
+    // Stop progress updates
+    stopProgressTracking();
     
     // Reset file input
     csvFileInput.value = '';
@@ -385,9 +530,15 @@ function resetToUpload() {
     progressPercentage.textContent = '0%';
     estimatedTime.textContent = 'Calculating...';
     processingStatus.textContent = 'Initializing...';
+    partialResults.style.display = 'none';
+    cancelJobBtn.style.display = 'flex';
+    startOverBtn.style.display = 'none';
     
-    // Reset search
+    // Reset search and pagination
     searchInput.value = '';
+    contactsFilter.value = 'all';
+    nextCursor = -1;
+    resultsTableBody.innerHTML = '';
     
     // Show upload section
     uploadSection.style.display = 'block';
@@ -0,0 +1,80 @@
+"""
+Hedged requests for straggling background responses.
+
+Most lookups finish close to the typical latency, but a few background responses sit
+queued or in progress far longer, holding a whole job at 99%. Once a response has been
+pending longer than the p95 of recently completed ones, a second identical request is
+sent and whichever finishes first is used; the other one is cancelled.
+"""
+
+import os
+import bisect
+from collections import deque
+from typing import Dict, Optional
+
+
+class HedgePolicy:
+    """
+    Tracks completed response latencies per request kind (e.g. search context size) over a
+    sliding window and decides when a slow response gets a hedge. Hedges are capped at
+    `budget` of all calls so a general slowdown doesn't double the traffic.
+    """
+
+    def __init__(self, quantile: float = 0.95, min_samples: int = 50, window: int = 500, budget: float = 0.1):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.budget = budget
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._window = window
+        self._samples: Dict[str, deque] = {}
+        self._sorted: Dict[str, list] = {}
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        """Build a policy from HEDGE_* environment variables (HEDGE_QUANTILE=0 disables hedging)."""
+        return cls(
+            quantile=float(os.getenv("HEDGE_QUANTILE", 0.95)),
+            min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", 50)),
+            budget=float(os.getenv("HEDGE_BUDGET", 0.1)),
+        )
+
+    def record(self, kind: str, seconds: float) -> None:
+        """Latency of a completed response of this kind."""
+        samples = self._samples.setdefault(kind, deque())
+        ordered = self._sorted.setdefault(kind, [])
+        if len(samples) >= self._window:
+            ordered.pop(bisect.bisect_left(ordered, samples.popleft()))
+        samples.append(seconds)
+        bisect.insort(ordered, seconds)
+
+    def hedge_delay(self, kind: str) -> Optional[float]:
+        """Seconds after which a pending response of this kind gets a hedge; None while unknown or disabled."""
+        ordered = self._sorted.get(kind, ())
+        if not self.quantile or len(ordered) < self.min_samples:
+            return None
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+
+    def start_call(self) -> None:
+        self.calls += 1
+
+    def try_hedge(self) -> bool:
+        """Whether a hedge may be sent now (counts it if so)."""
+        if self.hedges >= self.budget * self.calls:
+            return False
+        self.hedges += 1
+        return True
+
+    def hedge_won(self) -> None:
+        self.hedge_wins += 1
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0,
+            "hedge_after_seconds": {kind: round(delay, 2) for kind in self._sorted
+                                    if (delay := self.hedge_delay(kind)) is not None},
+        }
@@ -0,0 +1,670 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from contact_rows import ERROR_PREFIX
+
+DEFAULT_STORE_PATH = os.path.join("temp", "jobs.sqlite3")
+
+# Jobs in these states may still have work left to do
+ACTIVE_STATUSES = ("queued", "processing", "finalizing")
+
+# Result fields matched by the `search` filter
+SEARCH_FIELDS = ("business_name", "business_address", "contact_numbers", "search_resources")
+
+
+def _add_counters(totals: Dict[str, Dict[str, float]], counters: Optional[Dict[str, Dict[str, float]]]) -> Dict:
+    """Nested {group: {counter: value}} totals with `counters` added."""
+    totals = {group: dict(values) for group, values in totals.items()}
+    for group, values in (counters or {}).items():
+        group_totals = totals.setdefault(group, {})
+        for name, value in values.items():
+            group_totals[name] = group_totals.get(name, 0) + value
+    return totals
+
+
+class JobStore:
+    """
+    Storage for job state and per-row results.
+
+    A job is a dict of fields (status, progress, total, input_path, ...) plus the
+    `created_at`/`updated_at` timestamps maintained by the store. Results are stored
+    per row index so they can be written incrementally and read back in row order.
+    """
+
+    def create_job(self, job_id: str, **fields) -> Dict:
+        raise NotImplementedError
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def update_job(self, job_id: str, **fields) -> None:
+        raise NotImplementedError
+
+    def claim_job(self, job_id: str, owner: str, stale_after: float) -> bool:
+        """Atomically take over an active job whose owner has not updated it for `stale_after` seconds."""
+        raise NotImplementedError
+
+    def list_jobs(self, statuses: Iterable[str] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def save_results(self, job_id: str, rows: List[Tuple[int, Dict]], **job_fields) -> None:
+        """Store `(row_index, result)` pairs and update job fields in one step."""
+        raise NotImplementedError
+
+    def completed_indices(self, job_id: str) -> Set[int]:
+        raise NotImplementedError
+
+    def get_results(self, job_id: str, after: int = -1, limit: int = None, offset: int = 0,
+                    missing_contacts: bool = None, search: str = None) -> List[Tuple[int, Dict]]:
+        """
+        Results with row index greater than `after`, in row order, skipping the first `offset`
+        matches. `missing_contacts` keeps only rows without (True) or with (False) contact
+        numbers; `search` is a case-insensitive substring match on the result fields.
+        """
+        raise NotImplementedError
+
+    def count_results(self, job_id: str, missing_contacts: bool = None, search: str = None) -> int:
+        raise NotImplementedError
+
+    def transition_job(self, job_id: str, from_status: str, to_status: str) -> bool:
+        """Atomically move a job from `from_status` to `to_status`; False if it was not in `from_status`."""
+        raise NotImplementedError
+
+    def delete_job(self, job_id: str) -> None:
+        raise NotImplementedError
+
+    def add_duplicates(self, job_id: str, pairs: List[Tuple[int, int]]) -> None:
+        """Record (row_index, source_index) pairs: each row gets a copy of its source row's result."""
+        raise NotImplementedError
+
+    def fan_out_duplicates(self, job_id: str) -> Tuple[int, int]:
+        """
+        Copy results to every recorded duplicate whose source row has a result.
+        Returns (rows copied, how many of those are failed lookups).
+        """
+        raise NotImplementedError
+
+    # Work queue used by standalone worker processes (JOB_EXECUTION=workers). A job is split
+    # into chunks of (row_index, prompt) pairs; a worker leases a chunk, and the lease expires
+    # if the worker dies so another worker picks the chunk up.
+
+    def enqueue_chunk(self, job_id: str, chunk_index: int, rows: List[Tuple[int, str]]) -> None:
+        """Add a chunk of work for a job; raises ValueError if the job already has a chunk with that index."""
+        raise NotImplementedError
+
+    def chunk_indices(self, job_id: str) -> Set[int]:
+        """Indexes of the chunks enqueued for a job so far (so an interrupted enqueue can skip them)."""
+        raise NotImplementedError
+
+    def lease_chunk(self, owner: str, lease_seconds: float) -> Optional[Dict]:
+        """
+        Take the next queued chunk (or one whose lease expired) of an active job, chunks of
+        jobs uploaded with priority "interactive" first. Returns {"job_id", "chunk_index", "rows"} or None when there is no work.
+        """
+        raise NotImplementedError
+
+    def renew_lease(self, job_id: str, chunk_index: int, owner: str, lease_seconds: float) -> bool:
+        raise NotImplementedError
+
+    def complete_chunk(self, job_id: str, chunk_index: int, rows: List[Tuple[int, Dict]],
+                       completed: int, failed: int, counters: Dict[str, Dict[str, Dict[str, float]]] = None,
+                       deferred: List[Tuple[int, str, int]] = None, retry_at: float = 0.0) -> bool:
+        """
+        Store a chunk's results, mark it done and add its counts to the job's progress in one
+        step. Returns False (and stores nothing) if the chunk was already completed.
+
+        `counters` maps job fields (e.g. "tiers", "failures") to nested counters added to them.
+        `deferred` rows, as (row_index, prompt, retries), go into a new chunk that can't be
+        leased before `retry_at`.
+        """
+        raise NotImplementedError
+
+    def chunk_counts(self, job_id: str) -> Dict[str, int]:
+        """Number of rows per chunk status ('queued', 'leased', 'deferred', 'done') for a job."""
+        raise NotImplementedError
+
+    def evict(self, retention_seconds: float, max_jobs: int) -> List[Dict]:
+        """
+        Delete finished jobs older than `retention_seconds`, then the oldest finished jobs
+        beyond `max_jobs`. Returns the deleted job records so callers can clean up files.
+        """
+        now = time.time()
+        finished = [job for job in self.list_jobs() if job["status"] not in ACTIVE_STATUSES]
+        finished.sort(key=lambda job: job["updated_at"])
+        expired = [job for job in finished if now - job["updated_at"] > retention_seconds]
+        remaining = finished[len(expired):]
+        if len(remaining) > max_jobs:
+            expired += remaining[:len(remaining) - max_jobs]
+        for job in expired:
+            self.delete_job(job["job_id"])
+        return expired
+
+    @staticmethod
+    def from_env() -> "JobStore":
+        """Build the store selected by JOB_STORE ('sqlite' or 'memory')."""
+        if os.getenv("JOB_STORE", "sqlite").lower() == "memory":
+            return MemoryJobStore()
+        return SQLiteJobStore(os.getenv("JOB_STORE_PATH", DEFAULT_STORE_PATH))
+
+
+class MemoryJobStore(JobStore):
+    """In-process store; nothing survives a restart. Useful for tests and single-shot runs."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict] = {}
+        self._results: Dict[str, Dict[int, Dict]] = {}
+        self._chunks: Dict[Tuple[str, int], Dict] = {}
+        self._duplicates: Dict[str, Dict[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def create_job(self, job_id: str, **fields) -> Dict:
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {**fields, "job_id": job_id, "created_at": now, "updated_at": now}
+            self._results[job_id] = {}
+            return dict(self._jobs[job_id])
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def update_job(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def claim_job(self, job_id: str, owner: str, stale_after: float) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.get("status") not in ACTIVE_STATUSES:
+                return False
+            if time.time() - job["updated_at"] < stale_after:
+                return False
+            job.update(owner=owner, updated_at=time.time())
+            return True
+
+    def list_jobs(self, statuses: Iterable[str] = None) -> List[Dict]:
+        statuses = set(statuses) if statuses else None
+        return [dict(job) for job in self._jobs.values() if statuses is None or job.get("status") in statuses]
+
+    def save_results(self, job_id: str, rows: List[Tuple[int, Dict]], **job_fields) -> None:
+        with self._lock:
+            self._results.setdefault(job_id, {}).update(rows)
+            if job_id in self._jobs:
+                self._jobs[job_id].update(job_fields, updated_at=time.time())
+
+    def completed_indices(self, job_id: str) -> Set[int]:
+        return set(self._results.get(job_id, {}))
+
+    @staticmethod
+    def _matches(result: Dict, missing_contacts: bool, search: str) -> bool:
+        if missing_contacts is not None and (not result.get("contact_numbers")) != missing_contacts:
+            return False
+        if search:
+            text = " ".join(str(result.get(field) or "") for field in SEARCH_FIELDS)
+            return search.casefold() in text.casefold()
+        return True
+
+    def get_results(self, job_id: str, after: int = -1, limit: int = None, offset: int = 0,
+                    missing_contacts: bool = None, search: str = None) -> List[Tuple[int, Dict]]:
+        results = self._results.get(job_id, {})
+        indices = [index for index in sorted(results)
+                   if index > after and self._matches(results[index], missing_contacts, search)]
+        indices = indices[offset:] if limit is None else indices[offset:offset + limit]
+        return [(index, results[index]) for index in indices]
+
+    def count_results(self, job_id: str, missing_contacts: bool = None, search: str = None) -> int:
+        results = self._results.get(job_id, {}).values()
+        if missing_contacts is None and not search:
+            return len(results)
+        return sum(1 for result in results if self._matches(result, missing_contacts, search))
+
+    def transition_job(self, job_id: str, from_status: str, to_status: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.get("status") != from_status:
+                return False
+            job.update(status=to_status, updated_at=time.time())
+            return True
+
+    def delete_job(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._results.pop(job_id, None)
+            self._duplicates.pop(job_id, None)
+            for key in [key for key in self._chunks if key[0] == job_id]:
+                del self._chunks[key]
+
+    def add_duplicates(self, job_id: str, pairs: List[Tuple[int, int]]) -> None:
+        with self._lock:
+            self._duplicates.setdefault(job_id, {}).update(pairs)
+
+    def fan_out_duplicates(self, job_id: str) -> Tuple[int, int]:
+        copied = failed = 0
+        with self._lock:
+            results = self._results.setdefault(job_id, {})
+            for index, source in self._duplicates.get(job_id, {}).items():
+                if source in results:
+                    results[index] = dict(results[source])
+                    copied += 1
+                    failed += str(results[source].get("search_resources") or "").startswith(ERROR_PREFIX)
+        return copied, failed
+
+    def enqueue_chunk(self, job_id: str, chunk_index: int, rows: List[Tuple[int, str]]) -> None:
+        with self._lock:
+            if (job_id, chunk_index) in self._chunks:
+                raise ValueError(f"Chunk {chunk_index} of job {job_id} already exists")
+            self._chunks[(job_id, chunk_index)] = {
+                "job_id": job_id, "chunk_index": chunk_index, "rows": list(rows),
+                "status": "queued", "owner": None, "lease_expires": 0.0,
+            }
+
+    def chunk_indices(self, job_id: str) -> Set[int]:
+        return {index for chunk_job_id, index in list(self._chunks) if chunk_job_id == job_id}
+
+    def lease_chunk(self, owner: str, lease_seconds: float) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            for key in sorted(self._chunks, key=lambda key: (
+                    self._jobs.get(key[0], {}).get("priority") != "interactive", key[1], key[0])):
+                chunk = self._chunks[key]
+                job = self._jobs.get(chunk["job_id"])
+                if job is None or job.get("status") not in ACTIVE_STATUSES:
+                    continue
+                if chunk["status"] == "queued" or (chunk["status"] in ("leased", "deferred")
+                                                   and chunk["lease_expires"] < now):
+                    chunk.update(status="leased", owner=owner, lease_expires=now + lease_seconds)
+                    return {"job_id": chunk["job_id"], "chunk_index": chunk["chunk_index"], "rows": chunk["rows"]}
+        return None
+
+    def renew_lease(self, job_id: str, chunk_index: int, owner: str, lease_seconds: float) -> bool:
+        with self._lock:
+            chunk = self._chunks.get((job_id, chunk_index))
+            if chunk is None or chunk["status"] != "leased" or chunk["owner"] != owner:
+                return False
+            chunk["lease_expires"] = time.time() + lease_seconds
+            return True
+
+    def complete_chunk(self, job_id: str, chunk_index: int, rows: List[Tuple[int, Dict]],
+                       completed: int, failed: int, counters: Dict[str, Dict[str, Dict[str, float]]] = None,
+                       deferred: List[Tuple[int, str, int]] = None, retry_at: float = 0.0) -> bool:
+        with self._lock:
+            chunk = self._chunks.get((job_id, chunk_index))
+            if chunk is None or chunk["status"] == "done":
+                return False
+            chunk["status"] = "done"
+            self._results.setdefault(job_id, {}).update(rows)
+            if deferred:
+                retry_index = min([0, *(index for chunk_job_id, index in self._chunks if chunk_job_id == job_id)]) - 1
+                self._chunks[(job_id, retry_index)] = {
+                    "job_id": job_id, "chunk_index": retry_index, "rows": list(deferred),
+                    "status": "deferred", "owner": None, "lease_expires": retry_at,
+                }
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(
+                    progress=job.get("progress", 0) + completed + failed,
+                    completed=job.get("completed", 0) + completed,
+                    failed=job.get("failed", 0) + failed,
+                    updated_at=time.time(),
+                )
+                for field, values in (counters or {}).items():
+                    job[field] = _add_counters(job.get(field, {}), values)
+            return True
+
+    def chunk_counts(self, job_id: str) -> Dict[str, int]:
+        counts = {"queued": 0, "leased": 0, "deferred": 0, "done": 0}
+        for (chunk_job_id, _), chunk in list(self._chunks.items()):
+            if chunk_job_id == job_id:
+                counts[chunk["status"]] += len(chunk["rows"])
+        return counts
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Local SQLite store. Safe to share between several uvicorn worker processes on one
+    machine (WAL mode); results are indexed by (job_id, row_index).
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " owner TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, updated_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " job_id TEXT NOT NULL,"
+            " row_index INTEGER NOT NULL,"
+            " result TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, row_index)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " job_id TEXT NOT NULL,"
+            " chunk_index INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " owner TEXT,"
+            " lease_expires REAL NOT NULL DEFAULT 0,"
+            " row_count INTEGER NOT NULL,"
+            " rows TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, chunk_index))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_status ON chunks(status, chunk_index)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS duplicates ("
+            " job_id TEXT NOT NULL,"
+            " row_index INTEGER NOT NULL,"
+            " source_index INTEGER NOT NULL,"
+            " PRIMARY KEY (job_id, row_index)) WITHOUT ROWID"
+        )
+
+    @staticmethod
+    def _row_to_job(row) -> Dict:
+        job_id, status, owner, created_at, updated_at, data = row
+        return {**json.loads(data), "job_id": job_id, "status": status, "owner": owner,
+                "created_at": created_at, "updated_at": updated_at}
+
+    def _select_job(self, job_id: str) -> Optional[Dict]:
+        row = self._conn.execute(
+            "SELECT job_id, status, owner, created_at, updated_at, data FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def _update(self, job_id: str, fields: Dict, now: float) -> None:
+        job = self._select_job(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        data = {k: v for k, v in job.items() if k not in ("job_id", "status", "owner", "created_at", "updated_at")}
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, owner = ?, updated_at = ?, data = ? WHERE job_id = ?",
+            (job["status"], job.get("owner"), now, json.dumps(data), job_id),
+        )
+
+    def create_job(self, job_id: str, **fields) -> Dict:
+        now = time.time()
+        data = {k: v for k, v in fields.items() if k not in ("status", "owner")}
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, owner, created_at, updated_at, data)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, fields.get("status", "queued"), fields.get("owner"), now, now, json.dumps(data)),
+            )
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._select_job(job_id)
+
+    def update_job(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._update(job_id, fields, time.time())
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def claim_job(self, job_id: str, owner: str, stale_after: float) -> bool:
+        now = time.time()
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        with self._lock:
+            claimed = self._conn.execute(
+                f"UPDATE jobs SET owner = ?, updated_at = ? WHERE job_id = ? AND status IN ({placeholders})"
+                " AND updated_at < ?",
+                (owner, now, job_id, *ACTIVE_STATUSES, now - stale_after),
+            ).rowcount
+        return claimed == 1
+
+    def list_jobs(self, statuses: Iterable[str] = None) -> List[Dict]:
+        query = "SELECT job_id, status, owner, created_at, updated_at, data FROM jobs"
+        params = ()
+        if statuses:
+            params = tuple(statuses)
+            query += f" WHERE status IN ({', '.join('?' for _ in params)})"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def save_results(self, job_id: str, rows: List[Tuple[int, Dict]], **job_fields) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO results (job_id, row_index, result) VALUES (?, ?, ?)",
+                    [(job_id, index, json.dumps(result)) for index, result in rows],
+                )
+                self._update(job_id, job_fields, now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def completed_indices(self, job_id: str) -> Set[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT row_index FROM results WHERE job_id = ?", (job_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    @staticmethod
+    def _filters(missing_contacts: bool, search: str) -> Tuple[str, tuple]:
+        clauses, params = "", ()
+        if missing_contacts is not None:
+            operator = "=" if missing_contacts else "<>"
+            clauses += f" AND COALESCE(json_extract(result, '$.contact_numbers'), '') {operator} ''"
+        if search:
+            text = " || ' ' || ".join(f"COALESCE(json_extract(result, '$.{field}'), '')" for field in SEARCH_FIELDS)
+            pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses += f" AND ({text}) LIKE ? ESCAPE '\\'"
+            params += (pattern,)
+        return clauses, params
+
+    def get_results(self, job_id: str, after: int = -1, limit: int = None, offset: int = 0,
+                    missing_contacts: bool = None, search: str = None) -> List[Tuple[int, Dict]]:
+        clauses, params = self._filters(missing_contacts, search)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row_index, result FROM results WHERE job_id = ? AND row_index > ?" + clauses +
+                " ORDER BY row_index LIMIT ? OFFSET ?",
+                (job_id, after, *params, -1 if limit is None else limit, offset),
+            ).fetchall()
+        return [(index, json.loads(result)) for index, result in rows]
+
+    def count_results(self, job_id: str, missing_contacts: bool = None, search: str = None) -> int:
+        clauses, params = self._filters(missing_contacts, search)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM results WHERE job_id = ?" + clauses, (job_id, *params)
+            ).fetchone()[0]
+
+    def transition_job(self, job_id: str, from_status: str, to_status: str) -> bool:
+        with self._lock:
+            changed = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                (to_status, time.time(), job_id, from_status),
+            ).rowcount
+        return changed == 1
+
+    def delete_job(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM duplicates WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add_duplicates(self, job_id: str, pairs: List[Tuple[int, int]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO duplicates (job_id, row_index, source_index) VALUES (?, ?, ?)",
+                    [(job_id, index, source) for index, source in pairs],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # Duplicates copied per transaction, so other writers (e.g. the job's heartbeat) get the lock in between
+    FAN_OUT_BATCH_ROWS = 50_000
+
+    def fan_out_duplicates(self, job_id: str) -> Tuple[int, int]:
+        copied = failed = 0
+        after = -1
+        while True:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    last = self._conn.execute(
+                        "SELECT MAX(row_index) FROM (SELECT row_index FROM duplicates"
+                        " WHERE job_id = ? AND row_index > ? ORDER BY row_index LIMIT ?)",
+                        (job_id, after, self.FAN_OUT_BATCH_ROWS),
+                    ).fetchone()[0]
+                    if last is not None:
+                        batch_copied, batch_failed = self._conn.execute(
+                            "SELECT COUNT(*), COALESCE(SUM(json_extract(r.result, '$.search_resources') LIKE ? || '%'), 0)"
+                            " FROM duplicates d JOIN results r ON r.job_id = d.job_id AND r.row_index = d.source_index"
+                            " WHERE d.job_id = ? AND d.row_index > ? AND d.row_index <= ?",
+                            (ERROR_PREFIX, job_id, after, last),
+                        ).fetchone()
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO results (job_id, row_index, result)"
+                            " SELECT d.job_id, d.row_index, r.result"
+                            " FROM duplicates d JOIN results r ON r.job_id = d.job_id AND r.row_index = d.source_index"
+                            " WHERE d.job_id = ? AND d.row_index > ? AND d.row_index <= ?",
+                            (job_id, after, last),
+                        )
+                        copied += batch_copied
+                        failed += batch_failed
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            if last is None:
+                return copied, failed
+            after = last
+
+    def enqueue_chunk(self, job_id: str, chunk_index: int, rows: List[Tuple[int, str]]) -> None:
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO chunks (job_id, chunk_index, status, row_count, rows)"
+                    " VALUES (?, ?, 'queued', ?, ?)",
+                    (job_id, chunk_index, len(rows), json.dumps(rows)),
+                )
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Chunk {chunk_index} of job {job_id} already exists") from e
+
+    def chunk_indices(self, job_id: str) -> Set[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_index FROM chunks WHERE job_id = ?", (job_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def lease_chunk(self, owner: str, lease_seconds: float) -> Optional[Dict]:
+        now = time.time()
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Interactive jobs first, then lowest chunk index, so concurrent jobs are served round-robin
+                row = self._conn.execute(
+                    "SELECT c.job_id, c.chunk_index, c.rows FROM chunks c JOIN jobs j ON j.job_id = c.job_id"
+                    f" WHERE j.status IN ({placeholders})"
+                    " AND (c.status = 'queued' OR (c.status IN ('leased', 'deferred') AND c.lease_expires < ?))"
+                    " ORDER BY json_extract(j.data, '$.priority') = 'interactive' DESC, c.chunk_index LIMIT 1",
+                    (*ACTIVE_STATUSES, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE chunks SET status = 'leased', owner = ?, lease_expires = ?"
+                        " WHERE job_id = ? AND chunk_index = ?",
+                        (owner, now + lease_seconds, row[0], row[1]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"job_id": row[0], "chunk_index": row[1], "rows": [tuple(item) for item in json.loads(row[2])]}
+
+    def renew_lease(self, job_id: str, chunk_index: int, owner: str, lease_seconds: float) -> bool:
+        with self._lock:
+            renewed = self._conn.execute(
+                "UPDATE chunks SET lease_expires = ?"
+                " WHERE job_id = ? AND chunk_index = ? AND owner = ? AND status = 'leased'",
+                (time.time() + lease_seconds, job_id, chunk_index, owner),
+            ).rowcount
+        return renewed == 1
+
+    def complete_chunk(self, job_id: str, chunk_index: int, rows: List[Tuple[int, Dict]],
+                       completed: int, failed: int, counters: Dict[str, Dict[str, Dict[str, float]]] = None,
+                       deferred: List[Tuple[int, str, int]] = None, retry_at: float = 0.0) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                marked = self._conn.execute(
+                    "UPDATE chunks SET status = 'done', rows = '[]'"
+                    " WHERE job_id = ? AND chunk_index = ? AND status <> 'done'",
+                    (job_id, chunk_index),
+                ).rowcount
+                if marked:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO results (job_id, row_index, result) VALUES (?, ?, ?)",
+                        [(job_id, index, json.dumps(result)) for index, result in rows],
+                    )
+                    if deferred:
+                        # Retry chunks get negative indexes so they never collide with chunks still being enqueued
+                        self._conn.execute(
+                            "INSERT INTO chunks (job_id, chunk_index, status, lease_expires, row_count, rows)"
+                            " SELECT ?, MIN(0, MIN(chunk_index)) - 1, 'deferred', ?, ?, ? FROM chunks WHERE job_id = ?",
+                            (job_id, retry_at, len(deferred), json.dumps(deferred), job_id),
+                        )
+                    job = self._select_job(job_id)
+                    if job is not None:
+                        fields = {
+                            "progress": job.get("progress", 0) + completed + failed,
+                            "completed": job.get("completed", 0) + completed,
+                            "failed": job.get("failed", 0) + failed,
+                        }
+                        for field, values in (counters or {}).items():
+                            fields[field] = _add_counters(job.get(field, {}), values)
+                        self._update(job_id, fields, now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return marked == 1
+
+    def chunk_counts(self, job_id: str) -> Dict[str, int]:
+        counts = {"queued": 0, "leased": 0, "deferred": 0, "done": 0}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, SUM(row_count) FROM chunks WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall()
+        counts.update({status: total for status, total in rows})
+        return counts
@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp", "lookup_cache.sqlite3")
+
+# Hits only record their access time in memory; it is written out with the next `set`, or on
+# its own once this many hits are pending or the oldest has waited this long
+TOUCH_FLUSH_ENTRIES = 1000
+TOUCH_FLUSH_SECONDS = 30.0
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a lookup prompt so that cosmetic differences map to the same cache key."""
+    text = str(prompt).casefold()
+    text = re.sub(r"\s+", " ", text)            # newlines/tabs/repeated spaces -> single space
+    text = re.sub(r"\s*([,:])\s*", r"\1 ", text)  # consistent spacing around separators
+    return text.strip(" ,")
+
+
+def prompt_key(prompt: str) -> str:
+    """Stable hash of the normalized prompt, used as the primary key."""
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+class LookupCache:
+    """
+    Disk-backed (SQLite) cache of contact search results keyed on the normalized prompt.
+
+    Entries expire after `ttl_seconds`; once the table grows past `max_entries`
+    the least recently used entries are evicted. `get` only reads: access times of hits are
+    batched in memory and written in one statement (see TOUCH_FLUSH_*), so a cache hit does not
+    commit a write transaction.
+
+    Async code uses `aget`/`aset`, which run the SQLite calls on the cache's own thread: a write
+    can wait up to 30s for another process's lock, and that must neither stall the event loop nor
+    tie up the default executor's threads that job store calls (heartbeats) run on. Every call
+    holds the cache's lock anyway, so one thread serves them all.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = 30 * 24 * 3600,
+                 max_entries: int = 200_000, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes_since_evict = 0
+        # key -> last access time of hits not yet written to the table
+        self._touched = {}
+        self._touched_since = 0.0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lookup-cache")
+
+    @classmethod
+    def from_env(cls) -> "LookupCache":
+        """Build a cache from LOOKUP_CACHE_* environment variables."""
+        return cls(
+            path=os.getenv("LOOKUP_CACHE_PATH", DEFAULT_CACHE_PATH),
+            ttl_seconds=float(os.getenv("LOOKUP_CACHE_TTL_HOURS", 30 * 24)) * 3600,
+            max_entries=int(os.getenv("LOOKUP_CACHE_MAX_ENTRIES", 200_000)),
+            enabled=os.getenv("LOOKUP_CACHE_ENABLED", "1").lower() not in ("0", "false", "no"),
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lookup_cache ("
+                " key TEXT PRIMARY KEY,"
+                " prompt TEXT NOT NULL,"
+                " result TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lookup_cache_last_access ON lookup_cache(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, prompt: str):
+        """Return the cached result dict for `prompt`, or None on a miss/expired entry."""
+        return self.get_many([prompt])[0]
+
+    def get_many(self, prompts: List[str]) -> List:
+        """`get` for each of several prompts, under one lock acquisition."""
+        if not self.enabled:
+            return [None] * len(prompts)
+        now = time.time()
+        results = []
+        with self._lock:
+            conn = self._connection()
+            for prompt in prompts:
+                key = prompt_key(prompt)
+                row = conn.execute(
+                    "SELECT result FROM lookup_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self.hits += 1
+                if not self._touched:
+                    self._touched_since = now
+                self._touched[key] = now
+                results.append(json.loads(row[0]))
+            if len(self._touched) >= TOUCH_FLUSH_ENTRIES or now - self._touched_since >= TOUCH_FLUSH_SECONDS:
+                self._write_touched(conn)
+                conn.commit()
+        return results
+
+    async def aget(self, prompt: str):
+        """`get` without blocking the event loop."""
+        if not self.enabled:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, prompt)
+
+    async def aget_many(self, prompts: List[str]) -> List:
+        """`get_many` without blocking the event loop."""
+        if not self.enabled or not prompts:
+            return [None] * len(prompts)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get_many, prompts)
+
+    async def aset(self, prompt: str, result: dict) -> None:
+        """`set` without blocking the event loop."""
+        if self.enabled:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.set, prompt, result)
+
+    def _write_touched(self, conn: sqlite3.Connection) -> None:
+        """Write pending access times of hits (the caller commits)."""
+        if self._touched:
+            conn.executemany("UPDATE lookup_cache SET last_access = ? WHERE key = ?",
+                             [(at, key) for key, at in self._touched.items()])
+            self._touched = {}
+
+    def flush(self) -> None:
+        """Write pending access times of hits now."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._touched:
+                conn = self._connection()
+                self._write_touched(conn)
+                conn.commit()
+
+    def set(self, prompt: str, result: dict) -> None:
+        """Store a successful result for `prompt`."""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO lookup_cache (key, prompt, result, created_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (prompt_key(prompt), normalize_prompt(prompt), json.dumps(result), now, now + self.ttl_seconds, now),
+            )
+            self._write_touched(conn)
+            conn.commit()
+            self._writes_since_evict += 1
+            # Counting rows is a table scan, so only enforce the bound every so often
+            if self._writes_since_evict >= 100:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM lookup_cache WHERE expires_at <= ?", (now,)).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM lookup_cache").fetchone()[0]
+        if count > self.max_entries:
+            removed += conn.execute(
+                "DELETE FROM lookup_cache WHERE key IN ("
+                " SELECT key FROM lookup_cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        conn.commit()
+        self.evictions += removed
+        self._writes_since_evict = 0
+        if removed:
+            logger.info(f"Lookup cache evicted {removed} entries")
+
+    def clear(self) -> int:
+        """Remove every entry; returns the number of rows deleted."""
+        with self._lock:
+            conn = self._connection()
+            removed = conn.execute("DELETE FROM lookup_cache").rowcount
+            self._touched = {}
+            conn.commit()
+        return removed
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus the current table size."""
+        entries = 0
+        if self.enabled:
+            self.flush()
+            with self._lock:
+                entries = self._connection().execute("SELECT COUNT(*) FROM lookup_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
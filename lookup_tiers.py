@@ -0,0 +1,281 @@
+"""
+Cheap-first lookup tiers and their per-job accounting.
+
+A lookup walks LOOKUP_TIERS in order and stops at the first tier whose answer has a valid
+phone number. `web_page` fetches the row's own web page (and its /contact page) and reads
+the numbers straight out of the HTML without any model call; `search_<size>` tiers run the
+web-search model with that search context size, so the expensive high-context search only
+runs for rows the cheaper tiers could not answer.
+"""
+
+import os
+import re
+import socket
+import asyncio
+import ipaddress
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+import httpcore
+import httpx
+
+from phone_numbers import extract_phone_numbers
+
+# Tiers tried after the cache, cheapest first (overridden by LOOKUP_TIERS)
+DEFAULT_LOOKUP_TIERS = "web_page,search_low,search_high"
+
+# Pages are read up to this size; contact details are near the top or in the footer of small pages
+MAX_PAGE_BYTES = 1_000_000
+# A page listing more numbers than this is a directory or listing page, not the business's own
+MAX_PAGE_NUMBERS = 5
+# Redirects followed per page; every hop is checked like the original URL
+MAX_REDIRECTS = 5
+
+# Estimated prices in USD for cost accounting (gpt-4.1-mini tokens, web search calls by context size)
+TOKEN_PRICES = {"input_tokens": 0.40 / 1_000_000, "output_tokens": 1.60 / 1_000_000}
+SEARCH_CALL_PRICES = {"low": 0.025, "medium": 0.0275, "high": 0.030}
+
+_TEL_LINK_RE = re.compile(r"""href\s*=\s*["']tel:([^"']+)["']""", re.I)
+_HIDDEN_RE = re.compile(r"<(script|style|noscript)\b.*?</\1\s*>", re.I | re.S)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def parse_tiers(value: str) -> List[str]:
+    """Tier names from a comma-separated LOOKUP_TIERS value."""
+    return [tier.strip() for tier in value.split(",") if tier.strip()]
+
+
+def search_context_size(tier: str) -> Optional[str]:
+    """Search context size of a `search_<size>` tier, None for other tiers."""
+    return tier[len("search_"):] if tier.startswith("search_") else None
+
+
+class TierStats:
+    """
+    Per-tier counters for one job: attempts, hits (answers with a valid number), time spent,
+    tokens, web search calls and estimated cost. `counters` is plain JSON so it can be stored
+    on the job record and added up across worker processes.
+    """
+
+    FIELDS = ("attempts", "hits", "seconds", "input_tokens", "output_tokens", "search_calls", "cost_usd")
+
+    def __init__(self, counters: Dict[str, Dict[str, float]] = None):
+        self.counters = counters if counters is not None else {}
+
+    def record(self, tier: str, hit: bool, seconds: float, usage: Dict = None) -> None:
+        counters = self.counters.setdefault(tier, dict.fromkeys(self.FIELDS, 0))
+        counters["attempts"] += 1
+        counters["hits"] += int(hit)
+        counters["seconds"] += seconds
+        if usage:
+            cost = sum(usage.get(field, 0) * price for field, price in TOKEN_PRICES.items())
+            cost += usage.get("search_calls", 0) * SEARCH_CALL_PRICES.get(search_context_size(tier) or "high", 0)
+            for field in ("input_tokens", "output_tokens", "search_calls"):
+                counters[field] += usage.get(field, 0)
+            counters["cost_usd"] += cost
+
+    def merge(self, counters: Dict[str, Dict[str, float]], usage: bool = True) -> None:
+        """Add counters recorded by another TierStats; `usage=False` leaves out tokens, search calls and cost."""
+        for tier, values in counters.items():
+            own = self.counters.setdefault(tier, dict.fromkeys(self.FIELDS, 0))
+            for field in self.FIELDS if usage else ("attempts", "hits", "seconds"):
+                own[field] += values.get(field, 0)
+
+    def summary(self) -> Dict[str, Dict]:
+        return summarize_tiers(self.counters)
+
+
+def summarize_tiers(counters: Dict[str, Dict[str, float]]) -> Dict[str, Dict]:
+    """Hit rate, average latency and cost per tier from stored counters."""
+    summary = {}
+    for tier, tier_counters in counters.items():
+        attempts = tier_counters.get("attempts", 0)
+        summary[tier] = {
+            "attempts": attempts,
+            "hits": tier_counters.get("hits", 0),
+            "hit_rate": round(tier_counters.get("hits", 0) / attempts, 3) if attempts else 0.0,
+            "avg_latency_ms": round(tier_counters.get("seconds", 0) / attempts * 1000, 1) if attempts else 0.0,
+            "tokens": tier_counters.get("input_tokens", 0) + tier_counters.get("output_tokens", 0),
+            "search_calls": tier_counters.get("search_calls", 0),
+            "cost_usd": round(tier_counters.get("cost_usd", 0), 4),
+        }
+    return summary
+
+
+def _page_numbers(html: str) -> List[str]:
+    # Click-to-call links are the most reliable; otherwise read the visible text
+    numbers = extract_phone_numbers(", ".join(_TEL_LINK_RE.findall(html)))
+    if not numbers:
+        numbers = extract_phone_numbers(_TAG_RE.sub(" ", _HIDDEN_RE.sub(" ", html)))
+    return numbers
+
+
+def is_public_address(address: str) -> bool:
+    """Whether an IP address is on the public internet (not loopback, private, link-local, metadata, ...)."""
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def resolve(host: str, port: int) -> List[str]:
+    """Addresses a host name resolves to."""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+class PublicAddressBackend(httpcore.AsyncNetworkBackend):
+    """
+    Network backend that only connects to public addresses. The host is resolved once, here,
+    and the connection goes to the address that was checked, so a second DNS answer (DNS
+    rebinding) can't send it elsewhere. TLS still verifies and sends SNI for the host name.
+    """
+
+    def __init__(self, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self._backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            addresses = await resolve(host, port)
+        except socket.gaierror as e:
+            raise httpcore.ConnectError(f"Cannot resolve {host}: {e}") from e
+        blocked = [address for address in addresses if not is_public_address(address)]
+        if blocked or not addresses:
+            raise httpcore.ConnectError(f"{host} resolves to a non-public address ({', '.join(blocked)})")
+        return await self._backend.connect_tcp(addresses[0], port, timeout=timeout, local_address=local_address,
+                                               socket_options=socket_options)
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise httpcore.ConnectError("Web pages are not fetched over unix sockets")
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class PublicAddressTransport(httpx.AsyncHTTPTransport):
+    """httpx transport whose connections go through PublicAddressBackend (and never a proxy)."""
+
+    def __init__(self, limits: httpx.Limits, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        super().__init__(limits=limits, trust_env=False)
+        # httpx has no option for the network backend, so the connection pool is built here
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=PublicAddressBackend(backend),
+        )
+
+
+class PageFetcher:
+    """
+    The `web_page` tier: reads contact numbers off a row's own web page with a plain HTTP client.
+
+    Web pages come from uploaded files and POST /lookup, so only http(s) URLs are fetched and
+    connections only go to public addresses (see PublicAddressBackend), never through a proxy
+    from the environment. Redirects are followed one hop at a time with the same checks.
+
+    The HTTP client belongs to the event loop it was created in: it is created on first use in
+    the running loop (the server, `app.py` and each worker process run their own) and should be
+    closed with `aclose()` when that loop shuts down.
+    """
+
+    def __init__(self, timeout: float = 5.0, max_bytes: int = MAX_PAGE_BYTES, allow_private: bool = False,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.allow_private = allow_private
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+
+    @classmethod
+    def from_env(cls) -> "PageFetcher":
+        return cls(
+            timeout=float(os.getenv("PAGE_FETCH_TIMEOUT", 5)),
+            allow_private=os.getenv("PAGE_FETCH_ALLOW_PRIVATE", "0").lower() in ("1", "true", "yes"),
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            limits = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+            transport = self._transport
+            if transport is None:
+                transport = (httpx.AsyncHTTPTransport(limits=limits, trust_env=False) if self.allow_private
+                             else PublicAddressTransport(limits))
+            self._client = httpx.AsyncClient(
+                transport=transport,
+                timeout=self.timeout,
+                follow_redirects=False,
+                trust_env=False,
+                headers={"User-Agent": "Mozilla/5.0 (compatible; SkipTraceBot/1.0)"},
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the HTTP client of the running event loop, if one was created."""
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = self._client_loop = None
+
+    def check_url(self, url: str) -> None:
+        """
+        Raise ValueError unless `url` is http(s) with a host, and (unless private addresses are
+        allowed) not a literal non-public IP address. Host names are checked when connecting.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Not an http(s) URL: {url}")
+        if self.allow_private:
+            return
+        try:
+            ipaddress.ip_address(parts.hostname.split("%")[0])
+        except ValueError:
+            return  # a host name, not an address
+        if not is_public_address(parts.hostname):
+            raise ValueError(f"Not a public address: {parts.hostname}")
+
+    async def fetch(self, url: str) -> str:
+        """Text of an HTML page (at most `max_bytes` of it), or "" if it can't or may not be fetched."""
+        try:
+            client = self._get_client()
+            for _ in range(MAX_REDIRECTS + 1):
+                self.check_url(url)
+                async with client.stream("GET", url) as response:
+                    if response.is_redirect:
+                        url = urljoin(str(response.url), response.headers["location"])
+                        continue
+                    if response.status_code != 200 or "html" not in response.headers.get("content-type", ""):
+                        return ""
+                    body = bytearray()
+                    async for data in response.aiter_bytes():
+                        body += data
+                        if len(body) >= self.max_bytes:
+                            break
+                    return body[:self.max_bytes].decode(response.encoding or "utf-8", errors="replace")
+            return ""
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError):
+            # Unreachable, malformed or non-public web pages are common in real exports; the next tier takes over
+            return ""
+
+    async def lookup(self, fields: Dict[str, str]) -> Optional[Dict]:
+        """Result built from the numbers on the row's web page (or its /contact page); None if the row has no web page."""
+        web_page = (fields.get("web_page") or "").strip()
+        if not web_page:
+            return None
+        url = web_page if "://" in web_page else "https://" + web_page
+        numbers = []
+        for page in dict.fromkeys([url, urljoin(url, "/contact")]):
+            numbers = _page_numbers(await self.fetch(page))
+            if numbers:
+                break
+        if len(numbers) > MAX_PAGE_NUMBERS:
+            numbers = []
+        return {
+            "business_name": fields.get("Business_Name", ""),
+            "business_address": fields.get("Address", ""),
+            "contact_numbers": numbers,
+            "search_resources": f"({urlsplit(url).netloc})",
+        }
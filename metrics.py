@@ -0,0 +1,292 @@
+"""
+Hot-path instrumentation: per-stage row timings, counters and gauges in the Prometheus
+text exposition format, plus optional per-row timing traces.
+
+Each stage of a lookup (job queue wait, rate limiter/circuit breaker wait, response creation,
+time queued on OpenAI's side, polling, parsing, ...) is timed with `timed(stage)` or
+`record_stage()`. Timings go into the `skiptrace_stage_seconds` histogram and, while a row is
+being traced (`row_trace()`), into that row's trace, so a job's wall-clock time can be broken
+down row by row. The trace lives in a context variable, so tasks started for the row (e.g. a
+coalesced single-flight call) add to the same trace without it being passed around.
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from a cache hit to a slow web search
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def _snapshot(self) -> List[Tuple[Tuple, object]]:
+        # Copied under the lock: metrics may be rendered from another thread (worker.py --metrics-port)
+        with self._lock:
+            return sorted((key, list(value) if isinstance(value, list) else value)
+                          for key, value in self._values.items())
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(dict(zip(self.labels, key)))} {_format_value(value)}"
+                for key, value in self._snapshot()]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, counts in self._snapshot():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(round(counts[-2], 6))}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics of this process. Besides metrics updated on the hot path, `collector` functions are
+    called at scrape time to report gauges read from existing components (rate limiter, poller,
+    cache, ...), returning (name, help, type, [(labels, value), ...]) tuples.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict, float]]]]]] = []
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable) -> Callable:
+        """Register a scrape-time collector (usable as a decorator)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.header() + metric.render()
+        for collect in self._collectors:
+            for name, help, metric_type, samples in collect():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {metric_type}"]
+                lines += [f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "skiptrace_stage_seconds",
+    "Time spent in each stage of a row lookup (queue_wait, slot_wait, create, background_queue, "
+    "background_wait, foreground, parse, page_fetch, row_total)",
+    ["stage"],
+)
+RESPONSE_POLLS = registry.histogram(
+    "skiptrace_response_polls", "Retrieve calls needed per background response", buckets=COUNT_BUCKETS)
+RESPONSES = registry.counter(
+    "skiptrace_responses_total", "Background responses by final status (timeout: cancelled at the deadline)",
+    ["status"])
+RETRIES = registry.counter(
+    "skiptrace_openai_retries_total", "OpenAI calls retried in place, by HTTP status code", ["status_code"])
+FAILED_ATTEMPTS = registry.counter(
+    "skiptrace_lookup_failures_total", "Failed row lookup attempts by failure kind", ["kind"])
+ROWS = registry.counter(
+    "skiptrace_rows_total", "Rows finished by outcome (deferred: failed and queued for a retry)", ["outcome"])
+LOOP_LAG = registry.histogram(
+    "skiptrace_event_loop_lag_seconds", "How late the event loop ran a timer scheduled every 0.5s")
+
+_current_trace: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("row_trace", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add the time spent in a stage to the stage histogram and the current row's trace."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+def add_to_trace(field: str, value: float) -> None:
+    """Add a count (e.g. polls) to the current row's trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace[field] = trace.get(field, 0) + value
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the block as `stage` (also around awaits: the stage's wall-clock time is recorded)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_stages():
+    """Record the stages timed inside the block into a new dict (yielded) instead of the current row's trace."""
+    stages = {}
+    token = _current_trace.set(stages)
+    try:
+        yield stages
+    finally:
+        _current_trace.reset(token)
+
+
+def add_stages(stages: Dict) -> None:
+    """Add stage timings and counts collected elsewhere (see `collect_stages`) to the current row's trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        for field, value in stages.items():
+            trace[field] = trace.get(field, 0) + value
+
+
+@contextmanager
+def row_trace(**fields):
+    """Trace the row processed inside the block; yields its trace dict (stage -> seconds)."""
+    trace = dict(fields)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        total = time.perf_counter() - start
+        STAGE_SECONDS.observe(total, stage="row_total")
+        trace["row_total"] = total
+
+
+class TraceWriter:
+    """Appends row traces to a job's NDJSON trace file in batches."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending: List[Dict] = []
+
+    def add(self, trace: Dict) -> None:
+        self._pending.append({key: round(value, 4) if isinstance(value, float) else value
+                              for key, value in trace.items()})
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        # Swapped out first: rows finishing on the event loop keep adding while this runs in a thread
+        pending, self._pending = self._pending, []
+        lines = "".join(json.dumps(trace) + "\n" for trace in pending)
+        # One append per flush, so several worker processes can share a job's trace file
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+def serve_metrics(port: int) -> None:
+    """Serve `registry` on http://0.0.0.0:<port>/metrics from a daemon thread (for processes without a web server)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def trace_path(job_id: str, directory: str = "temp") -> str:
+    """Trace file of a job (shared by the web process and worker processes)."""
+    return os.path.join(directory, f"trace_{job_id}.jsonl")
@@ -0,0 +1,143 @@
+import os
+import time
+import inspect
+import importlib.util
+from collections import deque
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+# httpcore trace events that mark the end of the wait for a pooled connection:
+# either a new connection starts connecting or the request goes out on an idle one
+_POOL_ACQUIRED_EVENTS = ("connect_tcp.started", "connect_unix_socket.started", "send_request_headers.started")
+
+
+def _h2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class HTTPClientSettings:
+    """Connection pool, protocol and timeout settings for the shared OpenAI client."""
+
+    def __init__(self, max_connections: int = 1000, max_keepalive_connections: int = None,
+                 keepalive_expiry: float = 30.0, http2: bool = None, connect_timeout: float = 10.0,
+                 read_timeout: float = 60.0, write_timeout: float = 30.0, pool_timeout: float = 30.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_connections if max_keepalive_connections is None else max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        # HTTP/2 multiplexes many calls over a few connections, but needs the optional h2 package
+        self.http2 = _h2_available() if http2 is None else http2
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+
+    @classmethod
+    def from_env(cls) -> "HTTPClientSettings":
+        """Build settings from OPENAI_HTTP_* environment variables."""
+        http2 = os.getenv("OPENAI_HTTP2", "auto").lower()
+        keepalive = os.getenv("OPENAI_HTTP_MAX_KEEPALIVE")
+        return cls(
+            max_connections=int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", 1000)),
+            max_keepalive_connections=int(keepalive) if keepalive else None,
+            keepalive_expiry=float(os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", 30)),
+            http2=None if http2 == "auto" else http2 in ("1", "true", "yes", "on"),
+            connect_timeout=float(os.getenv("OPENAI_HTTP_CONNECT_TIMEOUT", 10)),
+            read_timeout=float(os.getenv("OPENAI_HTTP_READ_TIMEOUT", 60)),
+            write_timeout=float(os.getenv("OPENAI_HTTP_WRITE_TIMEOUT", 30)),
+            pool_timeout=float(os.getenv("OPENAI_HTTP_POOL_TIMEOUT", 30)),
+        )
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+class PoolMetrics:
+    """
+    Time requests spend waiting for a pooled connection.
+
+    A growing pool wait means calls are queueing inside the client (pool too small)
+    rather than waiting on the API.
+    """
+
+    def __init__(self, window: int = 2000):
+        self.requests = 0
+        self.in_flight = 0
+        self.new_connections = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record_wait(self, seconds: float) -> None:
+        self.waits += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self.recent.append(seconds)
+
+    def stats(self) -> dict:
+        recent = sorted(self.recent)
+        p95 = recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "new_connections": self.new_connections,
+            "pool_wait_avg_ms": round(1000 * self.wait_total / self.waits, 2) if self.waits else 0.0,
+            "pool_wait_p95_ms": round(1000 * p95, 2),
+            "pool_wait_max_ms": round(1000 * self.wait_max, 2),
+        }
+
+
+class MeteredTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that records pool wait times using httpcore's trace extension."""
+
+    def __init__(self, metrics: PoolMetrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        metrics = self.metrics
+        started = time.perf_counter()
+        acquired = False
+        previous_trace = request.extensions.get("trace")
+
+        async def trace(event_name, info):
+            nonlocal acquired
+            if not acquired and event_name.endswith(_POOL_ACQUIRED_EVENTS):
+                acquired = True
+                metrics.record_wait(time.perf_counter() - started)
+            if event_name.endswith("connect_tcp.started"):
+                metrics.new_connections += 1
+            if previous_trace is not None:
+                result = previous_trace(event_name, info)
+                if inspect.isawaitable(result):
+                    await result
+
+        request.extensions["trace"] = trace
+        metrics.requests += 1
+        metrics.in_flight += 1
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            metrics.in_flight -= 1
+
+
+def create_openai_client(settings: HTTPClientSettings = None, metrics: PoolMetrics = None, **kwargs) -> AsyncOpenAI:
+    """AsyncOpenAI client backed by a tuned, metered connection pool."""
+    settings = settings or HTTPClientSettings.from_env()
+    transport = MeteredTransport(metrics or PoolMetrics(), limits=settings.limits(), http2=settings.http2)
+    http_client = DefaultAsyncHttpxClient(transport=transport, timeout=settings.timeout())
+    # The SDK applies its own per-request timeout, so it has to be passed here as well
+    return AsyncOpenAI(http_client=http_client, timeout=settings.timeout(), **kwargs)
@@ -0,0 +1,110 @@
+"""
+Output files of a job in several formats, written page by page from the job store so a
+500k-row export never has to fit in memory:
+
+    csv       contact numbers joined with ", " (the original output)
+    csv.gz    the same CSV, gzip-compressed
+    csv.zst   the same CSV, zstd-compressed (needs the optional `zstandard` package)
+    ndjson    one JSON object per row, `contact_numbers` as a list
+    parquet   `contact_numbers` as a list<string> column, one row group per page (needs `pyarrow`)
+"""
+
+import io
+import os
+import gzip
+import json
+import importlib.util
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import pandas as pd
+
+from contact_rows import OUTPUT_COLUMNS
+
+# Format -> (file extension, media type, optional package it needs)
+OUTPUT_FORMATS = {
+    "csv": ("csv", "text/csv", None),
+    "csv.gz": ("csv.gz", "application/gzip", None),
+    "csv.zst": ("csv.zst", "application/zstd", "zstandard"),
+    "ndjson": ("ndjson", "application/x-ndjson", None),
+    "parquet": ("parquet", "application/vnd.apache.parquet", "pyarrow"),
+}
+# Formats that can be streamed while a job is still running
+STREAMING_FORMATS = ("csv", "ndjson")
+
+GZIP_LEVEL = int(os.getenv("OUTPUT_GZIP_LEVEL", 6))
+ZSTD_LEVEL = int(os.getenv("OUTPUT_ZSTD_LEVEL", 3))
+
+Page = List[Tuple[int, Dict]]
+
+
+def format_available(fmt: str) -> bool:
+    """Whether the optional package a format needs is installed."""
+    package = OUTPUT_FORMATS[fmt][2]
+    return package is None or importlib.util.find_spec(package) is not None
+
+
+def output_path(job_id: str, fmt: str, directory: str = "temp") -> str:
+    return os.path.join(directory, f"output_{job_id}.{OUTPUT_FORMATS[fmt][0]}")
+
+
+def split_numbers(contact_numbers: str) -> List[str]:
+    """Normalized `contact_numbers` text back into a list."""
+    return contact_numbers.split(", ") if contact_numbers else []
+
+
+def csv_pages(pages: Iterable[Page], with_row_index: bool = False) -> Iterator[str]:
+    """CSV text per page of results; the header comes with the first page (alone if there are no rows)."""
+    columns = (["row_index"] if with_row_index else []) + OUTPUT_COLUMNS
+    header = True
+    for page in pages:
+        rows = [{"row_index": index, **result} for index, result in page]
+        yield pd.DataFrame(rows, columns=columns).to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield pd.DataFrame(columns=columns).to_csv(index=False)
+
+
+def ndjson_pages(pages: Iterable[Page], with_row_index: bool = False) -> Iterator[str]:
+    """NDJSON text per page of results, with `contact_numbers` as a list."""
+    for page in pages:
+        lines = []
+        for index, result in page:
+            row = {"row_index": index} if with_row_index else {}
+            row.update((column, result.get(column, "")) for column in OUTPUT_COLUMNS)
+            row["contact_numbers"] = split_numbers(row["contact_numbers"])
+            lines.append(json.dumps(row, ensure_ascii=False) + "\n")
+        yield "".join(lines)
+
+
+def _open_text(path: str, fmt: str):
+    if fmt == "csv.gz":
+        return gzip.open(path, "wt", compresslevel=GZIP_LEVEL, newline="", encoding="utf-8")
+    if fmt == "csv.zst":
+        import zstandard
+        writer = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, "wb"))
+        return io.TextIOWrapper(writer, encoding="utf-8", newline="")
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def _write_parquet(pages: Iterable[Page], path: str) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.list_(pa.string()) if column == "contact_numbers" else pa.string())
+                        for column in OUTPUT_COLUMNS])
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for page in pages:
+            columns = {column: [result.get(column, "") for _, result in page] for column in OUTPUT_COLUMNS}
+            columns["contact_numbers"] = [split_numbers(numbers) for numbers in columns["contact_numbers"]]
+            writer.write_table(pa.table(columns, schema=schema))
+
+
+def write_output(pages: Iterable[Page], path: str, fmt: str) -> None:
+    """Write pages of (row_index, output row) results to `path` in `fmt`, one page in memory at a time."""
+    if fmt == "parquet":
+        _write_parquet(pages, path)
+        return
+    texts = ndjson_pages(pages) if fmt == "ndjson" else csv_pages(pages)
+    with _open_text(path, fmt) as f:
+        for text in texts:
+            f.write(text)
@@ -0,0 +1,135 @@
+"""
+Vectorized parsing and validation of the contact numbers returned by the model.
+
+Every number is parsed out of the free-form text, validated against the North American
+Numbering Plan (area codes in service from the table below, valid exchange codes) and
+written in E.164 form, so "(210) 617-7200" and "210.617.7200" become one "+12106177200".
+Rows left without a valid number are the ones worth a targeted retry. Entries that validation
+can't fully account for (vanity numbers, unknown area codes, extensions) are kept as given by
+`unverified_phone_numbers`, so nothing the model found is silently lost.
+"""
+
+import re
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+# NANP area codes in service or assigned for overlay, bundled so validation needs no network access
+AREA_CODES = frozenset("""
+    205 251 256 334 659 938 907 480 520 602 623 928 327 479 501 870
+    209 213 279 310 323 341 350 369 408 415 424 442 510 530 559 562 619 626 628 650 657 661 669 707
+    714 738 747 760 805 818 820 831 840 858 909 916 925 949 951
+    303 719 720 970 983 203 475 860 959 302 202 771
+    239 305 321 324 352 386 407 448 561 645 656 689 727 728 754 772 786 813 850 863 904 941 954
+    229 404 470 478 678 706 762 770 912 943 808 208 986
+    217 224 309 312 331 447 464 618 630 708 730 773 779 815 847 861 872 219 260 317 463 574 765 812 930
+    319 515 563 641 712 316 620 785 913 270 364 502 606 859 225 318 337 504 985 207
+    227 240 301 410 443 667 339 351 413 508 617 774 781 857 978
+    231 248 269 313 517 586 616 679 734 810 906 947 989 218 320 507 612 651 763 952 228 601 662 769
+    235 314 417 557 573 636 660 816 406 308 402 531 702 725 775 603
+    201 551 609 640 732 848 856 862 908 973 505 575
+    212 315 329 332 347 363 516 518 585 607 624 631 646 680 716 718 838 845 914 917 929 934
+    252 336 472 704 743 828 910 919 980 984 701
+    216 220 234 283 326 330 380 419 436 440 513 567 614 740 937 405 539 572 580 918 458 503 541 971
+    215 223 267 272 412 445 484 570 582 610 717 724 814 835 878 401 803 821 839 843 854 864 605
+    423 615 629 731 865 901 931
+    210 214 254 281 325 346 361 409 430 432 469 512 682 713 726 737 806 817 830 832 903 915 936 940
+    945 956 972 979 385 435 801 802 276 434 540 571 686 703 757 804 826 948 206 253 360 425 509 564
+    304 681 262 274 353 414 534 608 715 920 307
+    787 939 340 671 670 684
+    800 833 844 855 866 877 888
+    204 226 236 249 250 257 263 289 306 343 354 365 367 368 382 403 416 418 428 431 437 438 450 460
+    468 474 506 514 519 548 579 581 584 587 600 604 613 639 647 672 683 705 709 742 753 778 780 782
+    807 819 825 867 873 879 902 905 942
+    242 246 264 268 284 345 441 473 649 658 664 721 758 767 784 809 829 849 868 869 876
+""".split())
+
+# A non-NANP number in international form, or a 10-digit NANP number with an optional +1 / 1 prefix
+_PHONE_RE = re.compile(
+    r"\+(?P<intl>[02-9][\d\s().-]{5,18}\d)"
+    r"|(?<!\d)(?:\+?1[\s.-]*)?\(?(?P<npa>\d{3})\)?[\s.-]*(?P<nxx>\d{3})[\s.-]*(?P<line>\d{4})(?!\d)"
+)
+
+
+def normalize_phone_numbers(numbers: pd.Series) -> pd.Series:
+    """
+    Valid numbers of each row in E.164 form, deduplicated and joined with ", ".
+
+    Each value is the text of a row's numbers (e.g. the joined `contact_numbers` column);
+    rows without a valid number come back as "".
+    """
+    text = numbers.fillna("").astype(str).reset_index(drop=True)
+    matches = text.str.extractall(_PHONE_RE)
+    if matches.empty:
+        return pd.Series("", index=numbers.index)
+
+    nanp = matches["npa"].notna()
+    npa, nxx, line = matches["npa"].fillna(""), matches["nxx"].fillna(""), matches["line"].fillna("")
+    intl = matches["intl"].fillna("").str.replace(r"\D", "", regex=True)
+    valid_nanp = (
+        npa.isin(AREA_CODES)
+        & nxx.str.match(r"[2-9]")
+        & (nxx.str[1:] != "11")                           # N11 service codes
+        & ~((nxx == "555") & line.str.startswith("01"))   # 555-01XX is reserved for fiction
+    )
+    valid = (nanp & valid_nanp) | (~nanp & intl.str.len().between(8, 15))
+    e164 = ("+1" + npa + nxx + line).where(nanp, "+" + intl)[valid]
+
+    # Numbers stay in the order they were given; a groupby join is far slower than this loop
+    joined = [""] * len(text)
+    seen = set()
+    for row, number in zip(e164.index.get_level_values(0).tolist(), e164.tolist()):
+        if (row, number) not in seen:
+            seen.add((row, number))
+            joined[row] = f"{joined[row]}, {number}" if joined[row] else number
+    return pd.Series(joined, index=numbers.index, dtype=object)
+
+
+def _valid_number(match: re.Match) -> Optional[str]:
+    """E.164 form of one `_PHONE_RE` match, or None if it is not a valid number."""
+    npa, nxx, line = match.group("npa", "nxx", "line")
+    if npa is None:
+        digits = re.sub(r"\D", "", match.group("intl"))
+        return "+" + digits if 8 <= len(digits) <= 15 else None
+    if npa in AREA_CODES and nxx[0] >= "2" and nxx[1:] != "11" and not (nxx == "555" and line[:2] == "01"):
+        return "+1" + npa + nxx + line
+    return None
+
+
+def extract_phone_numbers(text: str) -> List[str]:
+    """Valid numbers in one piece of text, in E.164 form and first-seen order (same rules as above, unvectorized)."""
+    numbers = []
+    for match in _PHONE_RE.finditer(text):
+        number = _valid_number(match)
+        if number and number not in numbers:
+            numbers.append(number)
+    return numbers
+
+
+def unverified_entries(text: str) -> List[str]:
+    """
+    Comma-separated entries of one row's numbers that still contain digits once their valid
+    numbers are taken out (no valid number, or one with an extension), as given.
+    """
+    entries = []
+    for entry in (entry.strip() for entry in str(text).split(",")):
+        rest = _PHONE_RE.sub(lambda match: "" if _valid_number(match) else match.group(0), entry)
+        if re.search(r"\d", rest) and entry not in entries:
+            entries.append(entry)
+    return entries
+
+
+def unverified_phone_numbers(numbers: pd.Series) -> pd.Series:
+    """`unverified_entries` of each row joined with ", " ("" for rows whose numbers all validated)."""
+    text = numbers.fillna("").astype(str)
+    # Most rows are clean: only rows with digits outside their valid numbers need the entry-by-entry check
+    suspect = text.str.replace(_PHONE_RE, lambda match: "" if _valid_number(match) else match.group(0),
+                               regex=True).str.contains(r"\d", regex=True)
+    unverified = pd.Series("", index=numbers.index, dtype=object)
+    unverified[suspect] = [", ".join(unverified_entries(value)) for value in text[suspect].tolist()]
+    return unverified
+
+
+def has_valid_number(numbers: Iterable[str]) -> bool:
+    """Whether any of one row's numbers is valid."""
+    return bool(extract_phone_numbers(", ".join(numbers)))
@@ -0,0 +1,85 @@
+"""
+Vectorized input normalization used to find duplicate rows before any API call.
+
+Rows whose business name, address, web page and other info are the same after
+normalization form one dedup cluster: the cluster is looked up once and the result is
+copied to every row in it.
+"""
+
+import re
+
+import pandas as pd
+
+# Trailing legal-entity designators that don't identify a business ("Acme Inc" == "ACME, LLC")
+LEGAL_SUFFIXES = [
+    "and co", "and company", "llc", "l l c", "inc", "incorporated", "corp", "corporation", "co", "company",
+    "ltd", "limited", "lp", "llp", "pllc", "pc", "plc", "pa",
+]
+
+# USPS Publication 28 abbreviations for the most common street suffixes and unit designators
+USPS_ABBREVIATIONS = {
+    "alley": "aly", "avenue": "ave", "boulevard": "blvd", "circle": "cir", "court": "ct", "drive": "dr",
+    "expressway": "expy", "freeway": "fwy", "highway": "hwy", "lane": "ln", "parkway": "pkwy", "place": "pl",
+    "plaza": "plz", "road": "rd", "square": "sq", "street": "st", "terrace": "ter", "trail": "trl", "way": "way",
+    "apartment": "apt", "building": "bldg", "floor": "fl", "suite": "ste", "room": "rm", "unit": "unit",
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "northeast": "ne", "northwest": "nw", "southeast": "se", "southwest": "sw",
+}
+
+_LEGAL_SUFFIX_RE = r"(?:\s+(?:" + "|".join(re.escape(suffix) for suffix in LEGAL_SUFFIXES) + r"))+$"
+_USPS_RE = r"\b(" + "|".join(USPS_ABBREVIATIONS) + r")\b"
+
+# Input columns that make up a row's identity (canonical names, see prompt_builder.py)
+DEDUP_COLUMNS = ("Business_Name", "Address", "web_page", "other_info")
+
+
+def _clean(values: pd.Series) -> pd.Series:
+    return values.fillna("").astype(str).str.casefold()
+
+
+def _collapse_whitespace(values: pd.Series) -> pd.Series:
+    return values.str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def normalize_business_names(names: pd.Series) -> pd.Series:
+    """Case, punctuation and legal suffixes: 'The Balloons Boutique, LLC.' -> 'balloons boutique'."""
+    names = _clean(names).str.replace("&", " and ", regex=False)
+    names = names.str.replace(r"[^\w\s]", " ", regex=True)
+    names = _collapse_whitespace(names)
+    names = names.str.replace(r"^the\s+", "", regex=True)
+    return names.str.replace(_LEGAL_SUFFIX_RE, "", regex=True)
+
+
+def normalize_addresses(addresses: pd.Series) -> pd.Series:
+    """Whitespace/newlines, punctuation, ZIP+4 and USPS abbreviations: '10 Main Street,\\nSuite B' -> '10 main st ste b'."""
+    addresses = _clean(addresses).str.replace(r"[.,#]", " ", regex=True)
+    addresses = _collapse_whitespace(addresses)
+    addresses = addresses.str.replace(r"\b(\d{5})-\d{4}\b", r"\1", regex=True)
+    addresses = addresses.str.replace(_USPS_RE, lambda match: USPS_ABBREVIATIONS[match.group(1)], regex=True)
+    return addresses.str.replace(r"\s+(?:usa|us|united states(?: of america)?)$", "", regex=True)
+
+
+def normalize_urls(urls: pd.Series) -> pd.Series:
+    """Scheme, www., query string and trailing slashes: 'https://www.Acme.com/' -> 'acme.com'."""
+    urls = _clean(urls).str.strip()
+    urls = urls.str.replace(r"^[a-z][a-z0-9+.-]*://", "", regex=True)
+    urls = urls.str.replace(r"^www\d*\.", "", regex=True)
+    urls = urls.str.replace(r"[?#].*$", "", regex=True)
+    return urls.str.rstrip("/")
+
+
+def normalize_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalized identity columns for a chunk of input rows (missing columns count as empty)."""
+    empty = pd.Series("", index=df.index)
+    column = lambda name: df[name] if name in df.columns else empty
+    return pd.DataFrame({
+        "business_name": normalize_business_names(column("Business_Name")),
+        "address": normalize_addresses(column("Address")),
+        "web_page": normalize_urls(column("web_page")),
+        "other_info": _collapse_whitespace(_clean(column("other_info"))),
+    }, index=df.index)
+
+
+def dedup_keys(df: pd.DataFrame) -> pd.Series:
+    """64-bit cluster key per row; rows with equal keys are duplicates of each other."""
+    return pd.util.hash_pandas_object(normalize_rows(df), index=False)
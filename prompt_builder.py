@@ -0,0 +1,96 @@
+"""
+Lookup prompts for input rows, shared by the web app, worker chunks, batch mode and app.py.
+
+Input files name their columns in different ways ("Business_Name", "business_name",
+"Business Name", "website", ...); `canonical_columns` maps them onto the canonical input
+columns once per chunk. Prompts are then built for a whole chunk with column operations
+(`build_prompts`) instead of row by row, which keeps ingestion of million-row files to seconds.
+"""
+
+import re
+from typing import Dict, Iterable
+
+import pandas as pd
+
+# Canonical input column -> label used in the prompt, in prompt order
+PROMPT_FIELDS = {
+    "Business_Name": "Business Name",
+    "Address": "Address",
+    "web_page": "web_page",
+    "other_info": "other_info",
+}
+
+# Normalized header (lowercase, runs of spaces/dashes/underscores as "_") -> canonical column
+COLUMN_ALIASES = {
+    "business_name": "Business_Name",
+    "businessname": "Business_Name",
+    "company_name": "Business_Name",
+    "address": "Address",
+    "business_address": "Address",
+    "web_page": "web_page",
+    "webpage": "web_page",
+    "website": "web_page",
+    "url": "web_page",
+    "other_info": "other_info",
+    "notes": "other_info",
+}
+
+# At least one of these has to be present for a row to be looked up
+REQUIRED_COLUMNS = ("Business_Name", "Address")
+
+
+def _normalize_header(name) -> str:
+    return re.sub(r"[\s_-]+", "_", str(name).strip()).lower()
+
+
+def column_mapping(columns: Iterable) -> Dict[str, str]:
+    """Input column -> canonical column; the first column mapping onto a canonical name wins."""
+    mapping = {}
+    for column in columns:
+        canonical = COLUMN_ALIASES.get(_normalize_header(column))
+        if canonical is not None and canonical not in mapping.values():
+            mapping[column] = canonical
+    return mapping
+
+
+def has_required_columns(columns: Iterable) -> bool:
+    return any(canonical in REQUIRED_COLUMNS for canonical in column_mapping(columns).values())
+
+
+def canonical_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """The input columns of a chunk under their canonical names (other columns are dropped)."""
+    mapping = column_mapping(df.columns)
+    return df[list(mapping)].rename(columns=mapping)
+
+
+def build_prompts(df: pd.DataFrame) -> pd.Series:
+    """Lookup prompt for every row of a chunk with canonical columns, e.g. "Business Name: Acme, Address: 1 Main St"."""
+    prompts = pd.Series("", index=df.index, dtype=object)
+    for column, label in PROMPT_FIELDS.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        present = values.notna()
+        if not present.any():
+            continue
+        part = label + ": " + values[present].astype(str)
+        # ", " between parts only where the prompt already has one
+        prompts[present] = prompts[present].where(prompts[present] == "", prompts[present] + ", ") + part
+    return prompts
+
+
+def build_prompt(row: Dict) -> str:
+    """Lookup prompt for a single row given as {canonical column: value} (same format as build_prompts)."""
+    return ", ".join(f"{label}: {row[column]}" for column, label in PROMPT_FIELDS.items()
+                     if column in row and pd.notna(row[column]))
+
+
+_PROMPT_LABELS = {label: column for column, label in PROMPT_FIELDS.items()}
+_PROMPT_FIELD_RE = re.compile(
+    r"(?:^|, )(" + "|".join(_PROMPT_LABELS) + r"): (.*?)(?=, (?:" + "|".join(_PROMPT_LABELS) + r"): |$)", re.S
+)
+
+
+def prompt_fields(prompt: str) -> Dict[str, str]:
+    """Canonical input columns of the row a prompt was built from (the inverse of build_prompt)."""
+    return {_PROMPT_LABELS[label]: value for label, value in _PROMPT_FIELD_RE.findall(prompt)}
@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value) -> float:
+    """Parse OpenAI reset headers such as '20ms', '1s' or '6m0s' into seconds."""
+    if value is None:
+        return 0.0
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in _DURATION_PART.findall(value))
+
+
+class _Bucket:
+    """Token bucket refilled continuously at `limit` units per minute."""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.level = limit
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.limit, self.level + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # A request larger than the whole bucket only waits for a full bucket
+        missing = min(amount, self.limit) - self.level
+        return max(0.0, missing * 60 / self.limit)
+
+    def sync(self, limit, remaining, reset_seconds: float, now: float) -> None:
+        """Adopt the server's view of the bucket from rate-limit headers."""
+        if limit:
+            self.limit = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+            self.updated = now
+        if reset_seconds and remaining is not None and float(remaining) <= 0:
+            # Empty bucket: make the local refill line up with the server's reset time
+            self.level = -self.limit * reset_seconds / 60
+            self.updated = now
+
+
+class AdaptiveRateLimiter:
+    """
+    Process-wide limiter for OpenAI calls.
+
+    Combines requests/min and tokens/min token buckets (kept in sync with the
+    `x-ratelimit-*` response headers) with an AIMD concurrency window: the window
+    grows on success (doubling per round trip until the first rate limit, then by one
+    slot per round trip) and is halved when a 429 comes back, at which point all
+    callers also pause until the advertised retry-after has passed.
+    """
+
+    def __init__(self, requests_per_minute: float = 5000, tokens_per_minute: float = 4_000_000,
+                 max_concurrency: int = 1000, initial_concurrency: int = 50, min_concurrency: int = 1):
+        self.requests = _Bucket(requests_per_minute)
+        self.tokens = _Bucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(min(initial_concurrency, max_concurrency))
+        self.slow_start_threshold = float(max_concurrency)
+        self.in_flight = 0
+        self.rate_limited = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._loop = None
+        self._condition = None
+
+    @classmethod
+    def from_env(cls) -> "AdaptiveRateLimiter":
+        """Build a limiter from OPENAI_* rate limit environment variables."""
+        return cls(
+            requests_per_minute=float(os.getenv("OPENAI_RPM_LIMIT", 5000)),
+            tokens_per_minute=float(os.getenv("OPENAI_TPM_LIMIT", 4_000_000)),
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", 1000)),
+            initial_concurrency=int(os.getenv("OPENAI_INITIAL_CONCURRENCY", 50)),
+        )
+
+    def _get_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self.in_flight = 0
+        return self._condition
+
+    def _delay(self, tokens: float, now: float):
+        """Seconds to wait before a call may start; None means wait for a slot to free up."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.concurrency):
+            return None
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    async def acquire(self, tokens: float) -> None:
+        condition = self._get_condition()
+        while True:
+            async with condition:
+                delay = self._delay(tokens, time.monotonic())
+                if delay == 0:
+                    self.requests.level -= 1
+                    self.tokens.level -= tokens
+                    self.in_flight += 1
+                    return
+                if delay is None:
+                    # Woken by release(). No timeout here: cancelling a caller (deadline, cancelled job)
+                    # while wait_for is tearing down a timed-out condition.wait() can leave the lock held
+                    await condition.wait()
+                    continue
+            # Waiting for the buckets to refill (or out a 429 pause) doesn't need the lock
+            await asyncio.sleep(min(delay, 1.0))
+
+    async def release(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight = max(0, self.in_flight - 1)
+            condition.notify(max(1, int(self.concurrency) - self.in_flight))
+
+    @asynccontextmanager
+    async def slot(self, tokens: float):
+        """Hold one concurrency slot (and `tokens` of TPM budget) for the duration of a call."""
+        await self.acquire(tokens)
+        try:
+            yield self
+        finally:
+            await self.release()
+
+    def record_usage(self, estimated_tokens: float, actual_tokens) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        if actual_tokens is not None:
+            self.tokens.level = min(self.tokens.limit, self.tokens.level + estimated_tokens - actual_tokens)
+
+    def on_success(self, headers=None) -> None:
+        if headers is not None:
+            self.update_from_headers(headers)
+        if self.concurrency < self.slow_start_threshold:
+            self.concurrency += 1
+        else:
+            self.concurrency += 1 / max(self.concurrency, 1)
+        self.concurrency = min(self.concurrency, float(self.max_concurrency))
+
+    def on_rate_limited(self, headers=None) -> None:
+        self.rate_limited += 1
+        now = time.monotonic()
+        if headers is not None:
+            self.update_from_headers(headers)
+            retry_after = headers.get("retry-after")
+            if retry_after:
+                try:
+                    self.paused_until = max(self.paused_until, now + float(retry_after))
+                except ValueError:
+                    pass
+        # Many in-flight calls see the same 429 burst; only back off once per window
+        if now - self._last_decrease > 1.0:
+            self.concurrency = max(float(self.min_concurrency), self.concurrency / 2)
+            self.slow_start_threshold = self.concurrency
+            self._last_decrease = now
+            logger.warning(f"Rate limited; concurrency window reduced to {int(self.concurrency)}")
+
+    def update_from_headers(self, headers) -> None:
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        self.requests.sync(
+            headers.get("x-ratelimit-limit-requests"),
+            headers.get("x-ratelimit-remaining-requests"),
+            parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+            now,
+        )
+        self.tokens.sync(
+            headers.get("x-ratelimit-limit-tokens"),
+            headers.get("x-ratelimit-remaining-tokens"),
+            parse_reset_duration(headers.get("x-ratelimit-reset-tokens")),
+            now,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": int(self.concurrency),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "requests_per_minute": self.requests.limit,
+            "requests_available": round(self.requests.level, 1),
+            "tokens_per_minute": self.tokens.limit,
+            "tokens_available": round(self.tokens.level, 1),
+            "rate_limited": self.rate_limited,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+        }
@@ -0,0 +1,182 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Dict
+
+from metrics import RESPONSE_POLLS, add_to_trace, record_stage
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATUSES = {"queued", "in_progress"}
+
+
+class _PendingResponse:
+    def __init__(self, response_id: str, future: asyncio.Future, interval: float):
+        self.response_id = response_id
+        self.future = future
+        self.interval = interval
+        self.created = time.monotonic()
+        self.polls = 0
+        self.errors = 0
+        # Seconds until a poll first saw the response leave "queued" (an upper bound of its queue time)
+        self.queued_seconds = None
+
+
+class ResponsePoller:
+    """
+    Central poller for background responses.
+
+    Instead of every coroutine sleeping and calling `responses.retrieve` on its own,
+    callers hand their response to `wait()` and get a future that resolves once the
+    response leaves the queued/in_progress states. Each response is polled on its own
+    schedule (fast at first, backing off as it ages) and all retrieves share a global
+    polls-per-second budget.
+    """
+
+    def __init__(self, client, max_polls_per_second: float = 100, initial_interval: float = 0.5,
+                 max_interval: float = 10.0, backoff: float = 1.5, max_errors: int = 5):
+        self.client = client
+        self.max_polls_per_second = max_polls_per_second
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_errors = max_errors
+        self.retrieves = 0
+        self.resolved = 0
+        self._pending: Dict[str, _PendingResponse] = {}
+        self._schedule = []
+        self._in_flight = set()
+        self._sequence = itertools.count()
+        self._tokens = max_polls_per_second
+        self._last_refill = time.monotonic()
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+
+    @classmethod
+    def from_env(cls, client) -> "ResponsePoller":
+        """Build a poller from RESPONSE_POLL_* environment variables."""
+        return cls(
+            client,
+            max_polls_per_second=float(os.getenv("RESPONSE_POLL_MAX_PER_SECOND", 100)),
+            initial_interval=float(os.getenv("RESPONSE_POLL_INITIAL_INTERVAL", 0.5)),
+            max_interval=float(os.getenv("RESPONSE_POLL_MAX_INTERVAL", 10.0)),
+        )
+
+    async def wait(self, response):
+        """
+        Wait until `response` is no longer queued/in_progress and return its final state.
+        The wait, the time spent queued and the number of polls are recorded for the current row.
+        """
+        if response.status not in PENDING_STATUSES:
+            return response
+        self._ensure_running()
+        future = self._loop.create_future()
+        entry = _PendingResponse(response.id, future, self.initial_interval)
+        if response.status != "queued":
+            entry.queued_seconds = 0.0
+        self._pending[response.id] = entry
+        future.add_done_callback(lambda _f, response_id=response.id: self._pending.pop(response_id, None))
+        self._schedule_poll(entry, time.monotonic() + entry.interval)
+        result = await future
+        record_stage("background_wait", time.monotonic() - entry.created)
+        if entry.queued_seconds is not None:
+            record_stage("background_queue", entry.queued_seconds)
+        RESPONSE_POLLS.observe(entry.polls)
+        add_to_trace("polls", entry.polls)
+        return result
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (e.g. successive asyncio.run calls)
+            self._loop = loop
+            self._pending.clear()
+            self._schedule.clear()
+            self._in_flight.clear()
+            self._wakeup = asyncio.Event()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def _schedule_poll(self, entry: _PendingResponse, when: float) -> None:
+        heapq.heappush(self._schedule, (when, next(self._sequence), entry.response_id))
+        self._wakeup.set()
+
+    def _take_token(self, now: float) -> bool:
+        self._tokens = min(
+            self.max_polls_per_second,
+            self._tokens + (now - self._last_refill) * self.max_polls_per_second,
+        )
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def _run(self) -> None:
+        while self._pending:
+            now = time.monotonic()
+            while self._schedule and self._schedule[0][0] <= now:
+                entry = self._pending.get(self._schedule[0][2])
+                if entry is None:
+                    heapq.heappop(self._schedule)  # waiter went away
+                    continue
+                if not self._take_token(now):
+                    break
+                heapq.heappop(self._schedule)
+                task = asyncio.ensure_future(self._poll(entry))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+
+            if self._schedule and self._schedule[0][0] <= now:
+                timeout = 1 / self.max_polls_per_second  # out of budget, wait for a token
+            elif self._schedule:
+                timeout = self._schedule[0][0] - now
+            else:
+                timeout = self.max_interval
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, entry: _PendingResponse) -> None:
+        self.retrieves += 1
+        entry.polls += 1
+        try:
+            response = await self.client.responses.retrieve(entry.response_id)
+        except Exception as e:
+            entry.errors += 1
+            if entry.errors >= self.max_errors:
+                if not entry.future.done():
+                    entry.future.set_exception(e)
+                return
+            logger.warning(f"Polling response {entry.response_id} failed ({e}); backing off")
+            entry.interval = min(entry.interval * self.backoff * 2, self.max_interval)
+            self._schedule_poll(entry, time.monotonic() + entry.interval)
+            return
+
+        if entry.future.done():
+            return
+        if entry.queued_seconds is None and response.status != "queued":
+            entry.queued_seconds = time.monotonic() - entry.created
+        if response.status in PENDING_STATUSES:
+            entry.errors = 0
+            entry.interval = min(entry.interval * self.backoff, self.max_interval)
+            self._schedule_poll(entry, time.monotonic() + entry.interval)
+        else:
+            self.resolved += 1
+            entry.future.set_result(response)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "retrieves": self.retrieves,
+            "resolved": self.resolved,
+            "retrieves_per_response": round(self.retrieves / self.resolved, 2) if self.resolved else 0.0,
+            "max_polls_per_second": self.max_polls_per_second,
+        }
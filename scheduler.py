@@ -0,0 +1,177 @@
+"""
+Fair sharing of OpenAI call capacity between the jobs running in a process.
+
+Every job's rows compete for the same rate limiter, which hands out slots first come, first
+served: a 200k-row bulk job keeps a thousand calls queued, and a 20-row lookup uploaded after
+it waits behind all of them. The scheduler sits in front of the rate limiter and admits at most
+as many calls as its concurrency window; when a call finishes, the freed slot goes to the job
+with the lowest virtual finish time (start-time fair queuing). A job's share of the capacity is
+proportional to its weight, which comes from its priority, so an interactive job gets most of
+the slots that free up while it has calls waiting, and the bulk job keeps the rest.
+
+Calls are attributed to a job through a context variable set by whoever processes the job's rows
+(`running(job_id)`); calls outside any job (e.g. app.py) share one default bulk flow.
+"""
+
+import os
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Optional
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+_current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("scheduler_job", default=None)
+
+
+class _Flow:
+    """Calls of one job: its weight, waiting callers and virtual finish time."""
+
+    def __init__(self, priority: str, weight: float):
+        self.priority = priority
+        self.weight = weight
+        self.finish = 0.0
+        self.waiters: deque = deque()
+        self.in_use = 0
+        self.granted = 0
+        self.refs = 0
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of OpenAI calls across jobs.
+
+    `capacity` returns how many calls may run at once (the rate limiter's current concurrency
+    window), so the scheduler follows the limiter as it grows or backs off after a 429 and
+    calls rarely queue inside the limiter, where the order would be first come, first served.
+    """
+
+    def __init__(self, capacity: Callable[[], int], weights: Dict[str, float] = None):
+        self.capacity = capacity
+        self.weights = {INTERACTIVE: 20.0, BULK: 1.0, **(weights or {})}
+        self.in_use = 0
+        self.virtual_time = 0.0
+        self._waiting = 0
+        self._flows: Dict[Optional[str], _Flow] = {}
+
+    @classmethod
+    def from_env(cls, capacity: Callable[[], int]) -> "FairScheduler":
+        """Build a scheduler with SCHEDULER_*_WEIGHT environment variables (shares of the capacity per job)."""
+        return cls(capacity, {
+            INTERACTIVE: float(os.getenv("SCHEDULER_INTERACTIVE_WEIGHT", 20)),
+            BULK: float(os.getenv("SCHEDULER_BULK_WEIGHT", 1)),
+        })
+
+    def register(self, job_id: str, priority: str = BULK) -> None:
+        """Start scheduling calls of a job at its priority's weight (nestable: one `unregister` per call)."""
+        flow = self._flows.get(job_id)
+        if flow is None:
+            flow = self._flows[job_id] = _Flow(priority, self.weights[priority])
+            # A new job starts at the current virtual time instead of catching up on past service
+            flow.finish = self.virtual_time
+        flow.priority, flow.weight = priority, self.weights[priority]
+        flow.refs += 1
+
+    def unregister(self, job_id: str) -> None:
+        flow = self._flows.get(job_id)
+        if flow is None:
+            return
+        flow.refs -= 1
+        if flow.refs <= 0 and not flow.waiters and not flow.in_use:
+            del self._flows[job_id]
+
+    @contextmanager
+    def running(self, job_id: str):
+        """Attribute OpenAI calls made inside the block (and tasks it starts) to `job_id`."""
+        token = _current_job.set(job_id)
+        try:
+            yield
+        finally:
+            _current_job.reset(token)
+
+    def current_priority(self) -> str:
+        """Priority of the job that calls made here are attributed to (bulk outside a registered job)."""
+        flow = self._flows.get(_current_job.get())
+        return flow.priority if flow is not None else BULK
+
+    def _flow(self, job_id: Optional[str]) -> _Flow:
+        flow = self._flows.get(job_id)
+        if flow is None:
+            # Unregistered callers (no job, or a job that finished while its last calls ran)
+            flow = self._flows.setdefault(None, _Flow(BULK, self.weights[BULK]))
+        return flow
+
+    def _limit(self) -> int:
+        return max(1, int(self.capacity()))
+
+    def _grant(self, flow: _Flow) -> None:
+        start = max(flow.finish, self.virtual_time)
+        self.virtual_time = start
+        flow.finish = start + 1 / flow.weight
+        flow.in_use += 1
+        flow.granted += 1
+        self.in_use += 1
+
+    def _dispatch(self) -> None:
+        while self._waiting and self.in_use < self._limit():
+            flow = min((flow for flow in self._flows.values() if flow.waiters),
+                       key=lambda flow: max(flow.finish, self.virtual_time) + 1 / flow.weight)
+            waiter = flow.waiters.popleft()
+            self._waiting -= 1
+            if waiter.cancelled():
+                continue
+            self._grant(flow)
+            waiter.set_result(None)
+
+    def _release(self, flow: _Flow) -> None:
+        flow.in_use -= 1
+        self.in_use -= 1
+        if flow.refs <= 0 and not flow.in_use and not flow.waiters:
+            # The job was unregistered while this call ran
+            self._flows = {job_id: other for job_id, other in self._flows.items() if other is not flow}
+        self._dispatch()
+
+    async def acquire(self) -> _Flow:
+        flow = self._flow(_current_job.get())
+        if not self._waiting and self.in_use < self._limit():
+            self._grant(flow)
+            return flow
+        waiter = asyncio.get_running_loop().create_future()
+        flow.waiters.append(waiter)
+        self._waiting += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just before the caller was cancelled: pass the slot on
+                self._release(flow)
+            elif waiter in flow.waiters:
+                flow.waiters.remove(waiter)
+                self._waiting -= 1
+            raise
+        return flow
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the scheduler's call slots, on behalf of the job set with `running()`."""
+        flow = await self.acquire()
+        try:
+            yield
+        finally:
+            self._release(flow)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self._limit(),
+            "in_use": self.in_use,
+            "waiting": self._waiting,
+            "weights": self.weights,
+            "jobs": {
+                job_id or "(none)": {"priority": flow.priority, "in_use": flow.in_use,
+                                     "waiting": len(flow.waiters), "granted": flow.granted}
+                for job_id, flow in self._flows.items()
+            },
+        }
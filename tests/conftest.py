@@ -0,0 +1,28 @@
+"""
+Shared test setup: the repository root on sys.path, settings that keep tests offline, and a
+`store` fixture that runs a test against both job stores.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Set before any module reads them at import time; nothing listens on the API address
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"
+os.environ["LOOKUP_CACHE_ENABLED"] = "0"
+os.environ["JOB_STORE"] = "memory"
+os.environ["RESUME_JOBS_ON_STARTUP"] = "0"
+
+from job_store import MemoryJobStore, SQLiteJobStore  # noqa: E402
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
@@ -0,0 +1,36 @@
+import asyncio
+
+import pandas as pd
+
+import app
+from preprocess import dedup_keys
+
+
+def _chunk(names, start=0):
+    chunk = pd.DataFrame({"Business_Name": names}, index=range(start, start + len(names)))
+    return chunk, dedup_keys(chunk)
+
+
+def test_chunks_are_grouped_up_to_the_batch_size():
+    chunks = [_chunk(["A", "B", "A"]), _chunk(["C"], 3), _chunk(["D", "E"], 4), _chunk(["F"], 6)]
+    groups = list(app.group_chunks(chunks, max_prompts=3))
+    # Duplicates inside a chunk count once
+    assert [[chunk.index[0] for chunk, _ in group] for group in groups] == [[0, 3], [4, 6]]
+
+
+def test_group_results_are_split_back_into_chunks(monkeypatch):
+    calls = []
+
+    async def fake_lookup(prompts, mode):
+        calls.append(prompts)
+        return [{"business_name": prompt, "business_address": "", "contact_numbers": "",
+                 "search_resources": ""} for prompt in prompts]
+
+    monkeypatch.setattr(app, "lookup_prompts", fake_lookup)
+    group = [_chunk(["A", "B", "A"]), _chunk([], 3), _chunk(["C"], 3)]
+    first, empty, last = asyncio.run(app.lookup_chunks(group, "batch"))
+
+    assert calls == [["Business Name: A", "Business Name: B", "Business Name: C"]]
+    assert list(first["business_name"]) == ["Business Name: A", "Business Name: B", "Business Name: A"]
+    assert empty.empty
+    assert list(last.index) == [3] and last["business_name"].iloc[0] == "Business Name: C"
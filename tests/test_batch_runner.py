@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+from batch_runner import BatchLookupError, BatchRunner, batch_contact_search
+from failures import CLIENT, SERVER, RetryPolicy
+from lookup_cache import prompt_key
+
+
+class FakeRunner(BatchRunner):
+    """Answers batches in-process; `failures` maps a prompt to the errors its first attempts get."""
+
+    def __init__(self, failures=None, max_requests=2):
+        super().__init__(client=None, max_requests=max_requests)
+        self.failures = {prompt_key(prompt): list(errors) for prompt, errors in (failures or {}).items()}
+        self.batches = []
+
+    async def submit(self, lines, metadata=None):
+        self.batches.append([json.loads(line)["custom_id"] for line in lines])
+        return len(self.batches) - 1
+
+    async def wait(self, batch_id, on_update=None):
+        return batch_id
+
+    async def iter_results(self, batch):
+        for key in self.batches[batch]:
+            errors = self.failures.get(key)
+            if errors:
+                yield key, errors.pop(0)
+            else:
+                yield key, {"business_name": key}
+
+
+def _search(prompts, runner, retry_policy=None):
+    return asyncio.run(batch_contact_search(prompts, runner, retry_policy))
+
+
+def test_duplicates_share_one_request():
+    runner = FakeRunner()
+    results = _search(["Business Name: Acme", "Business Name: Other", "Business Name:  acme"], runner)
+    assert [len(batch) for batch in runner.batches] == [2]
+    assert results[0] == results[2] == {"business_name": prompt_key("Business Name: Acme")}
+
+
+def test_retryable_failures_go_out_in_follow_up_batches():
+    runner = FakeRunner({"Business Name: Acme": [BatchLookupError("boom", SERVER)] * 2})
+    results = _search(["Business Name: Acme", "Business Name: Other"], runner, RetryPolicy(max_attempts=3))
+    assert [len(batch) for batch in runner.batches] == [2, 1, 1]
+    assert not any(isinstance(result, Exception) for result in results)
+
+
+def test_failures_are_returned_after_the_last_round():
+    runner = FakeRunner({
+        "Business Name: Acme": [BatchLookupError("boom", SERVER)] * 5,
+        "Business Name: Other": [BatchLookupError("bad request", CLIENT)],
+    })
+    acme, other = _search(["Business Name: Acme", "Business Name: Other"], runner, RetryPolicy(max_attempts=2))
+    # Acme: first attempt plus two retries; the client error is not retried
+    assert [len(batch) for batch in runner.batches] == [2, 1, 1]
+    assert isinstance(acme, BatchLookupError) and isinstance(other, BatchLookupError)
+
+
+def test_no_retries_without_a_policy():
+    runner = FakeRunner({"Business Name: Acme": [BatchLookupError("boom", SERVER)]})
+    (result,) = _search(["Business Name: Acme"], runner)
+    assert isinstance(result, BatchLookupError)
+    assert len(runner.batches) == 1
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import WebSearchLLM
+from lookup_tiers import TierStats
+from metrics import record_stage, row_trace
+from scheduler import BULK, INTERACTIVE
+
+RESULT = {"business_name": "Acme", "contact_numbers": ["5125550100"]}
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Each search takes 0.1s; records the scheduler priority it ran at."""
+    calls = []
+
+    async def search(business_info, tier_stats=None, foreground=False):
+        calls.append(WebSearchLLM.api_scheduler.current_priority())
+        record_stage("create", 0.05)
+        await asyncio.sleep(0.1)
+        tier_stats.record("search_low", True, 0.1, {"input_tokens": 1000, "search_calls": 1})
+        return RESULT
+
+    monkeypatch.setattr(WebSearchLLM, "_search_and_cache", search)
+    scheduler = WebSearchLLM.api_scheduler
+    scheduler.register("bulk-a", BULK)
+    scheduler.register("bulk-b", BULK)
+    scheduler.register("interactive", INTERACTIVE)
+    yield calls
+    for job_id in ("bulk-a", "bulk-b", "interactive"):
+        scheduler.unregister(job_id)
+
+
+async def lookup(job_id: str, delay: float = 0.0):
+    """One row of `job_id`: its result, tier stats and trace."""
+    await asyncio.sleep(delay)
+    tier_stats = TierStats()
+    with WebSearchLLM.api_scheduler.running(job_id), row_trace() as trace:
+        result = await WebSearchLLM.llm_contact_search("Acme, Austin", tier_stats)
+    return result, tier_stats.counters, trace
+
+
+def test_interactive_lookup_does_not_join_a_bulk_search(searches):
+    async def scenario():
+        return await asyncio.gather(lookup("bulk-a"), lookup("bulk-b", 0.01), lookup("interactive", 0.02))
+
+    (a_result, a_tiers, a_trace), (b_result, b_tiers, b_trace), (i_result, i_tiers, i_trace) = asyncio.run(scenario())
+    # The two bulk rows share a search; the interactive row gets its own, at its own priority
+    assert searches == [BULK, INTERACTIVE]
+    assert a_result == b_result == i_result == RESULT
+
+    # Every row sees the attempt and stage timings; the shared search's cost is counted once
+    for tiers in (a_tiers, b_tiers, i_tiers):
+        assert tiers["search_low"]["attempts"] == 1 and tiers["search_low"]["hits"] == 1
+    for trace in (a_trace, b_trace, i_trace):
+        assert trace["create"] == 0.05
+    assert a_tiers["search_low"]["input_tokens"] == 1000 and a_tiers["search_low"]["cost_usd"] > 0
+    assert b_tiers["search_low"]["input_tokens"] == 0 and b_tiers["search_low"]["cost_usd"] == 0
+    assert i_tiers["search_low"]["search_calls"] == 1
+
+
+def test_cancelling_one_job_keeps_the_shared_search_for_the_other(searches):
+    async def scenario():
+        first = asyncio.create_task(lookup("bulk-a"))
+        second = asyncio.create_task(lookup("bulk-b", 0.01))
+        await asyncio.sleep(0.03)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        return await second
+
+    result, tiers, _ = asyncio.run(scenario())
+    assert result == RESULT
+    assert searches == [BULK]
+    assert tiers["search_low"]["attempts"] == 1
+
+
+def test_failure_reaches_every_caller(monkeypatch, searches):
+    async def failing(business_info, tier_stats=None, foreground=False):
+        await asyncio.sleep(0.05)
+        tier_stats.record("search_low", False, 0.05)
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(WebSearchLLM, "_search_and_cache", failing)
+
+    async def scenario():
+        return await asyncio.gather(lookup("bulk-a"), lookup("bulk-b", 0.01), return_exceptions=True)
+
+    assert [str(error) for error in asyncio.run(scenario())] == ["provider down"] * 2
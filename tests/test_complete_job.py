@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+from backend import main
+from job_store import SQLiteJobStore
+
+
+@pytest.fixture
+def backend_store(store, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "job_store", store)
+    # Output files go to ./temp
+    monkeypatch.chdir(tmp_path)
+    return store
+
+
+def _result(name: str) -> dict:
+    return {"business_name": name, "business_address": "", "contact_numbers": "+15125550100",
+            "search_resources": "(example.com)"}
+
+
+def test_duplicates_are_fanned_out(backend_store, monkeypatch):
+    monkeypatch.setattr(SQLiteJobStore, "FAN_OUT_BATCH_ROWS", 3)
+    backend_store.create_job("job", status="finalizing", completed=5, failed=0)
+    backend_store.save_results("job", [(i, _result(f"Business {i}")) for i in range(5)])
+    # Rows 5..14 repeat rows 0..4
+    backend_store.add_duplicates("job", [(i, i % 5) for i in range(5, 15)])
+
+    asyncio.run(main._complete_job("job", "missing-input.csv", 15))
+
+    job = backend_store.get_job("job")
+    assert job["status"] == "completed"
+    assert job["completed"] == 15
+    output = pd.read_csv(job["path"], dtype=str)
+    assert list(output["business_name"]) == [f"Business {i % 5}" for i in range(15)]
+
+
+def test_slow_finalize_keeps_its_heartbeat(backend_store, monkeypatch):
+    monkeypatch.setattr(main, "STALE_JOB_SECONDS", 0.2)
+    write_output = main.write_output
+
+    def slow_write(*args):
+        time.sleep(0.8)
+        write_output(*args)
+
+    monkeypatch.setattr(main, "write_output", slow_write)
+    backend_store.create_job("job", status="finalizing")
+    backend_store.save_results("job", [(0, _result("Acme"))])
+
+    async def scenario():
+        finalize = asyncio.create_task(main._complete_job("job", "missing-input.csv", 1))
+        await asyncio.sleep(0.6)
+        # Another process looking for abandoned jobs must not take this one over
+        claimed = backend_store.claim_job("job", "other-process", 0.2)
+        await finalize
+        return claimed
+
+    assert asyncio.run(scenario()) is False
+    assert backend_store.get_job("job")["status"] == "completed"
+
+
+def test_stale_job_running_here_is_not_resumed(backend_store, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "STALE_JOB_SECONDS", 0.1)
+    started = []
+    monkeypatch.setattr(main, "_start_job", lambda job_id, input_path: started.append(job_id))
+    input_path = tmp_path / "input.csv"
+    input_path.write_text("Business_Name\nAcme\n")
+    backend_store.create_job("job", status="finalizing", input_path=str(input_path))
+
+    async def resume_once():
+        task = asyncio.create_task(main._resume_stale_jobs())
+        await asyncio.sleep(0.3)
+        task.cancel()
+
+    main.finalizing_jobs.add("job")
+    try:
+        asyncio.run(resume_once())
+    finally:
+        main.finalizing_jobs.discard("job")
+    assert started == []
+
+    asyncio.run(resume_once())
+    assert "job" in started
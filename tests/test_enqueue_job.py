@@ -0,0 +1,54 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from backend import main
+
+
+@pytest.fixture
+def backend_store(store, monkeypatch):
+    monkeypatch.setattr(main, "job_store", store)
+    return store
+
+
+def _write_input(path, rows: int) -> str:
+    pd.DataFrame({
+        "Business_Name": [f"Business {i}" for i in range(rows)],
+        "Address": [f"{i} Main St, Austin, TX" for i in range(rows)],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_rows", [100, 300, 7000])
+def test_every_row_is_queued(backend_store, monkeypatch, tmp_path, chunk_rows):
+    # 300 does not divide the 5000-row ingest blocks; 7000 is larger than one block
+    monkeypatch.setattr(main, "WORKER_CHUNK_ROWS", chunk_rows)
+    input_path = _write_input(tmp_path / "input.csv", 12000)
+    backend_store.create_job("job", status="queued", execution="workers")
+
+    asyncio.run(main.enqueue_job("job", input_path))
+
+    job = backend_store.get_job("job")
+    assert job["status"] == "processing"
+    assert backend_store.chunk_counts("job")["queued"] == job["total"] == 12000
+
+
+def test_interrupted_enqueue_runs_again(backend_store, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "WORKER_CHUNK_ROWS", 300)
+    input_path = _write_input(tmp_path / "input.csv", 6000)
+    backend_store.create_job("job", status="queued", execution="workers")
+
+    asyncio.run(main.enqueue_job("job", input_path))
+    asyncio.run(main.enqueue_job("job", input_path))
+
+    assert backend_store.get_job("job")["status"] == "processing"
+    assert backend_store.chunk_counts("job")["queued"] == 6000
+
+
+def test_duplicate_chunk_index_raises(store):
+    store.create_job("job", status="processing")
+    store.enqueue_chunk("job", 0, [(0, "Business Name: Acme")])
+    with pytest.raises(ValueError):
+        store.enqueue_chunk("job", 0, [(1, "Business Name: Other")])
+    assert store.chunk_counts("job")["queued"] == 1
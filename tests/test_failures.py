@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+import failures
+from failures import (BAD_JSON, CLIENT, MODEL_FAILURE, OTHER, RATE_LIMIT, SERVER, TIMEOUT, CircuitBreaker,
+                      DeferredQueue, LookupFailure, RetryPolicy, classify_failure)
+
+_REQUEST = httpx.Request("POST", "https://api.openai.com/v1/responses")
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("error, kind", [
+    (LookupFailure(BAD_JSON, "not JSON"), BAD_JSON),
+    (LookupFailure(MODEL_FAILURE, "no output"), MODEL_FAILURE),
+    (openai.APITimeoutError(request=_REQUEST), TIMEOUT),
+    (httpx.ReadTimeout("slow"), TIMEOUT),
+    (asyncio.TimeoutError(), TIMEOUT),
+    (StatusError(429), RATE_LIMIT),
+    (StatusError(500), SERVER),
+    (StatusError(503), SERVER),
+    (StatusError(400), CLIENT),
+    (StatusError(401), CLIENT),
+    (openai.APIConnectionError(request=_REQUEST), SERVER),
+    (httpx.ConnectError("refused"), SERVER),
+    (ConnectionResetError(), SERVER),
+    (ValueError("bug"), OTHER),
+])
+def test_classify_failure(error, kind):
+    assert classify_failure(error) == kind
+
+
+@pytest.mark.parametrize("error, retries, expected", [
+    (StatusError(500), 0, True),
+    (StatusError(429), 2, True),
+    (LookupFailure(BAD_JSON, "not JSON"), 1, True),
+    # Out of attempts
+    (StatusError(500), 3, False),
+    # Fails the same way every time
+    (StatusError(400), 0, False),
+    (ValueError("bug"), 0, False),
+])
+def test_should_retry(error, retries, expected):
+    assert RetryPolicy(max_attempts=3).should_retry(error, retries) is expected
+
+
+def test_delay_backs_off_with_jitter(monkeypatch):
+    policy = RetryPolicy(base_delay=5, max_delay=120)
+    monkeypatch.setattr(failures.random, "random", lambda: 0.0)
+    assert [policy.delay(StatusError(500), retries) for retries in range(7)] == [5, 10, 20, 40, 80, 120, 120]
+    # Up to half the delay again as jitter
+    monkeypatch.setattr(failures.random, "random", lambda: 1.0)
+    assert policy.delay(StatusError(500), 1) == 15
+
+
+def test_delay_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(failures.random, "random", lambda: 0.0)
+    policy = RetryPolicy(base_delay=5)
+    assert policy.delay(LookupFailure(RATE_LIMIT, "slow down", retry_after=30), 0) == 30
+    assert policy.delay(LookupFailure(RATE_LIMIT, "slow down", retry_after=1), 0) == 5
+
+
+def test_deferred_items_come_back_in_due_order():
+    async def scenario():
+        queue = DeferredQueue()
+        queue.defer("late", 0.1)
+        queue.defer("early", 0.02)
+        queue.defer("now", 0)
+        assert len(queue) == 3
+        start = time.monotonic()
+        items = []
+        for _ in range(3):
+            items.append((await queue.get(), time.monotonic() - start))
+        return items
+
+    items = asyncio.run(scenario())
+    assert [item for item, _ in items] == ["now", "early", "late"]
+    assert items[0][1] < 0.01
+    assert 0.1 <= items[2][1] < 0.2
+
+
+def test_deferring_wakes_a_waiting_get():
+    async def scenario():
+        queue = DeferredQueue()
+        queue.defer("later", 10)
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0.01)
+        queue.defer("sooner", 0.01)
+        return await asyncio.wait_for(getter, 1)
+
+    assert asyncio.run(scenario()) == "sooner"
+
+
+def _tripped(cooldown: float = 0.05) -> CircuitBreaker:
+    breaker = CircuitBreaker(window=4, min_failures=2, failure_rate=0.5, cooldown=cooldown)
+    breaker.record_success()
+    breaker.record_failure(SERVER)
+    breaker.record_failure(TIMEOUT)
+    return breaker
+
+
+def test_breaker_opens_on_outage_failures():
+    breaker = _tripped()
+    assert breaker.state == "open"
+    assert breaker.trips == 1
+
+
+def test_client_and_rate_limit_failures_do_not_trip():
+    breaker = CircuitBreaker(window=4, min_failures=2)
+    for kind in (CLIENT, RATE_LIMIT, CLIENT, RATE_LIMIT):
+        breaker.record_failure(kind)
+    assert breaker.state == "closed"
+
+
+def test_one_probe_after_the_cooldown_and_waiters_go_when_it_succeeds():
+    breaker = _tripped(cooldown=0.05)
+    probe_done = None
+
+    async def call(hold: float):
+        async with breaker.guard():
+            await asyncio.sleep(hold)
+        return time.monotonic()
+
+    async def scenario():
+        nonlocal probe_done
+        probe = asyncio.ensure_future(call(0.225))
+        await asyncio.sleep(0.1)
+        # The probe is in flight: everyone else waits for its outcome
+        assert breaker.state == "half_open"
+        others = [asyncio.ensure_future(call(0)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        assert not any(other.done() for other in others)
+        probe_done = await probe
+        return await asyncio.gather(*others)
+
+    finished = asyncio.run(scenario())
+    assert breaker.state == "closed"
+    # Woken by the probe's success, not by a polling interval
+    assert max(finished) - probe_done < 0.02
+    assert breaker.waits == 6
+
+
+def test_failed_probe_doubles_the_cooldown():
+    breaker = _tripped(cooldown=0.05)
+
+    async def scenario():
+        await asyncio.sleep(0.06)
+        with pytest.raises(StatusError):
+            async with breaker.guard():
+                raise StatusError(503)
+        assert breaker.state == "open" and breaker.cooldown == 0.1
+        start = time.monotonic()
+        async with breaker.guard():
+            pass
+        return time.monotonic() - start
+
+    waited = asyncio.run(scenario())
+    assert 0.09 <= waited < 0.2
+    assert breaker.state == "closed"
+    assert breaker.cooldown == 0.05
+
+
+def test_cancelled_probe_lets_a_waiter_probe():
+    breaker = _tripped(cooldown=0.01)
+
+    async def scenario():
+        await asyncio.sleep(0.02)
+        probe = asyncio.ensure_future(_hold(breaker))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(_hold(breaker, 0))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        probe.cancel()
+        await asyncio.wait_for(waiter, 0.02)
+
+    asyncio.run(scenario())
+    assert breaker.state == "closed"
+
+
+async def _hold(breaker: CircuitBreaker, seconds: float = 10):
+    async with breaker.guard():
+        await asyncio.sleep(seconds)
@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import WebSearchLLM
+from hedging import HedgePolicy
+
+
+def test_no_hedge_delay_until_min_samples():
+    policy = HedgePolicy(min_samples=50)
+    for seconds in range(49):
+        policy.record("low", seconds)
+    assert policy.hedge_delay("low") is None
+    policy.record("low", 49)
+    assert policy.hedge_delay("low") == 47
+
+
+def test_hedge_delay_is_the_p95_of_its_own_kind():
+    policy = HedgePolicy(min_samples=10)
+    for i in range(100):
+        policy.record("low", 1 + i / 100)
+        policy.record("high", 10 + i / 10)
+    assert policy.hedge_delay("low") == pytest.approx(1.95)
+    assert policy.hedge_delay("high") == pytest.approx(19.5)
+    assert policy.hedge_delay("medium") is None
+    assert policy.stats()["hedge_after_seconds"] == {"low": 1.95, "high": 19.5}
+
+
+def test_hedge_delay_follows_the_window():
+    policy = HedgePolicy(min_samples=10, window=100)
+    for _ in range(100):
+        policy.record("low", 10.0)
+    for _ in range(100):
+        policy.record("low", 1.0)
+    assert policy.hedge_delay("low") == 1.0
+
+
+def test_quantile_zero_disables_hedging():
+    policy = HedgePolicy(quantile=0, min_samples=1)
+    policy.record("low", 1.0)
+    assert policy.hedge_delay("low") is None
+
+
+def test_hedges_are_capped_at_the_budget():
+    policy = HedgePolicy(budget=0.1)
+    hedged = 0
+    for _ in range(200):
+        policy.start_call()
+        hedged += policy.try_hedge()
+    assert hedged == 20
+    assert policy.stats()["hedge_rate"] == 0.1
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    """Hedge after 0.05s; the first request hangs, the hedge completes after 0.01s."""
+    policy = HedgePolicy(min_samples=1)
+    policy.record(WebSearchLLM.SEARCH_REQUEST_TEMPLATE["tools"][0]["search_context_size"], 0.05)
+    policy.calls = 100
+    monkeypatch.setattr(WebSearchLLM, "hedge_policy", policy)
+    unwound = []
+
+    async def response(name: str, seconds: float):
+        try:
+            await asyncio.sleep(seconds)
+            return SimpleNamespace(id=name, status="completed")
+        finally:
+            unwound.append(name)
+
+    async def primary(prompt, template):
+        return await response("primary", 10)
+
+    async def hedge(prompt, template, estimated_tokens):
+        return await response("hedge", 0.01)
+
+    monkeypatch.setattr(WebSearchLLM, "_background_response", primary)
+    monkeypatch.setattr(WebSearchLLM, "_extra_response", hedge)
+    return policy, unwound
+
+
+def test_losing_request_is_unwound_before_the_result_is_returned(hedging):
+    policy, unwound = hedging
+
+    async def scenario():
+        response = await WebSearchLLM._hedged_response("Acme", WebSearchLLM.SEARCH_REQUEST_TEMPLATE, 100)
+        return response, list(unwound)
+
+    response, unwound_at_return = asyncio.run(scenario())
+    assert response.id == "hedge"
+    assert sorted(unwound_at_return) == ["hedge", "primary"]
+    assert policy.hedge_wins == 1
+
+
+class FakeRawResponse:
+    def __init__(self, response_id: str):
+        self.headers = {}
+        self.response_id = response_id
+
+    def parse(self):
+        return SimpleNamespace(id=self.response_id, status="queued")
+
+
+def test_response_created_after_its_caller_was_cancelled_is_cancelled(monkeypatch):
+    cancelled = []
+
+    async def slow_create(prompt, template):
+        await asyncio.sleep(0.05)
+        return FakeRawResponse("resp_late")
+
+    monkeypatch.setattr(WebSearchLLM, "_create_response", slow_create)
+    monkeypatch.setattr(WebSearchLLM, "cancel_response", cancelled.append)
+
+    async def scenario():
+        call = asyncio.ensure_future(WebSearchLLM._background_response("Acme", WebSearchLLM.SEARCH_REQUEST_TEMPLATE))
+        await asyncio.sleep(0.01)
+        # e.g. lost to a hedge while its create call was still in flight
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert cancelled == []
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert cancelled == ["resp_late"]
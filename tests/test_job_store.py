@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from contact_rows import ERROR_PREFIX, format_result
+
+
+def result(name, numbers=("5125550100",)):
+    """A stored output row, as workers save them."""
+    return format_result({"business_name": name, "contact_numbers": list(numbers), "search_resources": "web"})
+
+
+def test_chunk_lease_and_complete_cycle(store):
+    store.create_job("job", status="processing", total=4)
+    store.enqueue_chunk("job", 0, [(0, "a"), (1, "b")])
+    store.enqueue_chunk("job", 1, [(2, "c"), (3, "d")])
+    assert store.chunk_indices("job") == {0, 1}
+
+    first = store.lease_chunk("worker-1", lease_seconds=60)
+    second = store.lease_chunk("worker-2", lease_seconds=60)
+    assert (first["chunk_index"], second["chunk_index"]) == (0, 1)
+    assert first["rows"] == [(0, "a"), (1, "b")]
+    assert store.lease_chunk("worker-3", lease_seconds=60) is None
+    assert store.chunk_counts("job") == {"queued": 0, "leased": 4, "deferred": 0, "done": 0}
+
+    assert store.renew_lease("job", 0, "worker-1", lease_seconds=60)
+    assert not store.renew_lease("job", 0, "worker-2", lease_seconds=60)
+
+    counters = {"tiers": {"search_low": {"attempts": 2, "hits": 1}}}
+    assert store.complete_chunk("job", 0, [(0, result("a")), (1, result("b"))], completed=2, failed=0,
+                                counters=counters)
+    # A second completion of the same chunk (e.g. after its lease was taken over) stores nothing
+    assert not store.complete_chunk("job", 0, [(0, result("other"))], completed=2, failed=0, counters=counters)
+    assert store.complete_chunk("job", 1, [(2, result("c")), (3, result("d", ()))], completed=1, failed=1)
+
+    job = store.get_job("job")
+    assert (job["progress"], job["completed"], job["failed"]) == (4, 3, 1)
+    assert job["tiers"] == {"search_low": {"attempts": 2, "hits": 1}}
+    assert store.chunk_counts("job") == {"queued": 0, "leased": 0, "deferred": 0, "done": 4}
+    assert [row[1]["business_name"] for row in store.get_results("job")] == ["a", "b", "c", "d"]
+    assert store.count_results("job", missing_contacts=True) == 1
+
+
+def test_expired_lease_is_taken_over(store):
+    store.create_job("job", status="processing")
+    store.enqueue_chunk("job", 0, [(0, "a")])
+    assert store.lease_chunk("dead-worker", lease_seconds=-1)["chunk_index"] == 0
+    assert store.lease_chunk("worker", lease_seconds=60)["chunk_index"] == 0
+    assert not store.renew_lease("job", 0, "dead-worker", lease_seconds=60)
+    assert store.renew_lease("job", 0, "worker", lease_seconds=60)
+
+
+def test_deferred_rows_wait_for_retry_at(store):
+    store.create_job("job", status="processing")
+    store.enqueue_chunk("job", 0, [(0, "a"), (1, "b")])
+    store.lease_chunk("worker", lease_seconds=60)
+    store.complete_chunk("job", 0, [(0, result("a"))], completed=1, failed=0,
+                         deferred=[(1, "b", 1)], retry_at=time.time() + 60)
+    assert store.chunk_counts("job")["deferred"] == 1
+    assert store.lease_chunk("worker", lease_seconds=60) is None
+    # A new regular chunk still gets the index it asked for
+    store.enqueue_chunk("job", 1, [(2, "c")])
+    assert store.chunk_indices("job") == {-1, 0, 1}
+
+    store.complete_chunk("job", 0, [], completed=0, failed=0)  # already done: no-op
+    store.lease_chunk("worker", lease_seconds=60)  # chunk 1
+    store.complete_chunk("job", 1, [], completed=0, failed=0, deferred=[(2, "c", 1)], retry_at=0.0)
+    retry = store.lease_chunk("worker", lease_seconds=60)
+    assert retry["chunk_index"] == -2 and retry["rows"] == [(2, "c", 1)]
+
+
+def test_chunks_of_finished_jobs_are_not_leased(store):
+    store.create_job("done", status="completed")
+    store.enqueue_chunk("done", 0, [(0, "a")])
+    assert store.lease_chunk("worker", lease_seconds=60) is None
+
+
+def test_interactive_jobs_are_leased_first(store):
+    store.create_job("bulk", status="processing", priority="bulk")
+    store.create_job("interactive", status="processing", priority="interactive")
+    store.enqueue_chunk("bulk", 0, [(0, "a")])
+    store.enqueue_chunk("interactive", 5, [(0, "b")])
+    assert store.lease_chunk("worker", lease_seconds=60)["job_id"] == "interactive"
+
+
+def test_fan_out_copies_source_results(store):
+    store.create_job("job", status="finalizing")
+    failure = format_result({"business_name": "b", "search_resources": f"{ERROR_PREFIX} timeout"})
+    store.save_results("job", [(0, result("a")), (1, failure)])
+    store.add_duplicates("job", [(2, 0), (3, 0), (4, 1), (5, 9)])  # row 9 never got a result
+    assert store.fan_out_duplicates("job") == (3, 1)
+    results = dict(store.get_results("job"))
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert results[3] == results[0] and results[4] == failure
+
+
+@pytest.mark.parametrize("status, claimable", [("processing", True), ("finalizing", True), ("completed", False)])
+def test_claim_only_stale_active_jobs(store, status, claimable):
+    store.create_job("job", status=status, owner="old")
+    assert not store.claim_job("job", "new", stale_after=3600)
+    time.sleep(0.01)
+    assert store.claim_job("job", "new", stale_after=0.005) == claimable
+    assert store.get_job("job")["owner"] == ("new" if claimable else "old")
+    # The claim counts as a heartbeat: nobody else can take the job over right away
+    if claimable:
+        assert not store.claim_job("job", "third", stale_after=3600)
+
+
+def test_delete_job_removes_chunks_and_results(store):
+    store.create_job("job", status="processing")
+    store.enqueue_chunk("job", 0, [(0, "a")])
+    store.save_results("job", [(0, result("a"))])
+    store.delete_job("job")
+    assert store.get_job("job") is None
+    assert store.chunk_indices("job") == set()
+    assert store.get_results("job") == []
@@ -0,0 +1,97 @@
+import asyncio
+import sqlite3
+
+import lookup_cache
+from lookup_cache import LookupCache
+
+
+def last_access(cache: LookupCache, prompt: str) -> float:
+    with sqlite3.connect(cache.path) as conn:
+        return conn.execute("SELECT last_access FROM lookup_cache WHERE key = ?",
+                            (lookup_cache.prompt_key(prompt),)).fetchone()[0]
+
+
+def test_hits_do_not_write_until_flushed(tmp_path):
+    cache = LookupCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.set("Acme Plumbing, Austin", {"contact_numbers": ["5125550100"]})
+    stored = last_access(cache, "Acme Plumbing, Austin")
+
+    assert cache.get("acme plumbing,   austin") == {"contact_numbers": ["5125550100"]}
+    assert cache.get("Nobody, Nowhere") is None
+    assert not cache._conn.in_transaction
+    assert last_access(cache, "Acme Plumbing, Austin") == stored
+
+    cache.flush()
+    assert last_access(cache, "Acme Plumbing, Austin") > stored
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_pending_hits_are_written_with_the_next_set(tmp_path):
+    cache = LookupCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.set("a", {"contact_numbers": []})
+    stored = last_access(cache, "a")
+    cache.get("a")
+    cache.set("b", {"contact_numbers": []})
+    assert last_access(cache, "a") > stored
+
+
+def test_many_hits_flush_on_their_own(tmp_path, monkeypatch):
+    monkeypatch.setattr(lookup_cache, "TOUCH_FLUSH_ENTRIES", 3)
+    cache = LookupCache(path=str(tmp_path / "cache.sqlite3"))
+    prompts = ["a", "b", "c"]
+    for prompt in prompts:
+        cache.set(prompt, {"contact_numbers": []})
+    stored = {prompt: last_access(cache, prompt) for prompt in prompts}
+    for prompt in prompts:
+        cache.get(prompt)
+    assert all(last_access(cache, prompt) > stored[prompt] for prompt in prompts)
+
+
+def test_eviction_keeps_recently_hit_entries(tmp_path):
+    cache = LookupCache(path=str(tmp_path / "cache.sqlite3"), max_entries=50)
+    for i in range(50):
+        cache.set(f"prompt {i}", {"contact_numbers": []})
+    for i in range(50, 99):
+        cache.set(f"prompt {i}", {"contact_numbers": []})
+    cache.get("prompt 0")  # only pending in memory until the set that also evicts
+    cache.set("prompt 99", {"contact_numbers": []})
+    assert cache.get("prompt 0") is not None
+    assert cache.get("prompt 1") is None
+
+
+def test_get_many(tmp_path):
+    cache = LookupCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.set("a", {"contact_numbers": ["1"]})
+    assert cache.get_many(["a", "b", "A "]) == [{"contact_numbers": ["1"]}, None, {"contact_numbers": ["1"]}]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_async_calls_do_not_block_the_event_loop(tmp_path):
+    cache = LookupCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.set("a", {"contact_numbers": []})
+    # Another process holding the write lock makes the next write wait for it
+    other = sqlite3.connect(cache.path, timeout=0, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        write = asyncio.create_task(cache.aset("b", {"contact_numbers": []}))
+        await asyncio.sleep(0.3)
+        assert not write.done()
+        other.execute("COMMIT")
+        await write
+        ticking.cancel()
+        return ticks, await cache.aget("b"), await cache.aget_many(["a", "c"])
+
+    ticks, b, many = asyncio.run(scenario())
+    assert ticks >= 15
+    assert b == {"contact_numbers": []}
+    assert many == [{"contact_numbers": []}, None]
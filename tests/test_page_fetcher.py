@@ -0,0 +1,186 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpcore
+import httpx
+import pytest
+
+import lookup_tiers
+from lookup_tiers import PageFetcher, PublicAddressTransport
+
+PUBLIC = "http://93.184.215.14"
+
+
+def fetcher_with(handler, **kwargs) -> PageFetcher:
+    return PageFetcher(transport=httpx.MockTransport(handler), **kwargs)
+
+
+class RecordingBackend(httpcore.AsyncNetworkBackend):
+    """Records where connections would go instead of opening them."""
+
+    def __init__(self):
+        self.connected = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.connected.append((host, port))
+        raise httpcore.ConnectError("not connecting in tests")
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise httpcore.ConnectError("not connecting in tests")
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+@pytest.fixture
+def dns(monkeypatch):
+    """Scripted resolver: each lookup returns the next answer in `dns["answers"]`."""
+    state = {"answers": [], "lookups": []}
+
+    async def resolve(host, port):
+        state["lookups"].append(host)
+        return state["answers"].pop(0)
+
+    monkeypatch.setattr(lookup_tiers, "resolve", resolve)
+    return state
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://93.184.215.14/",
+    "file:///etc/passwd",
+    "http://127.0.0.1:8000/",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/",
+    "http://192.168.1.1/",
+    "http://[::1]/",
+    "http://[::ffff:127.0.0.1]/",
+])
+def test_non_public_urls_are_not_fetched(url):
+    requested = []
+
+    def handler(request):
+        requested.append(request.url)
+        return httpx.Response(200, html="<a href='tel:5551234567'>call</a>")
+
+    assert asyncio.run(fetcher_with(handler).fetch(url)) == ""
+    assert requested == []
+
+
+def test_public_url_is_fetched():
+    fetcher = fetcher_with(lambda request: httpx.Response(200, html="<html>(555) 123-4567</html>"))
+    assert "123-4567" in asyncio.run(fetcher.fetch(PUBLIC + "/"))
+
+
+def test_only_html_is_read():
+    for headers in ({}, {"content-type": "application/json"}):
+        fetcher = fetcher_with(lambda request: httpx.Response(200, headers=headers, content=b'{"tel": "5125550100"}'))
+        assert asyncio.run(fetcher.fetch(PUBLIC + "/")) == ""
+
+
+def test_redirect_to_private_address_is_not_followed():
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        return httpx.Response(302, headers={"location": "http://127.0.0.1/admin"})
+
+    assert asyncio.run(fetcher_with(handler).fetch(PUBLIC + "/")) == ""
+    assert requested == [PUBLIC + "/"]
+
+
+def test_redirects_are_followed_with_a_limit():
+    def handler(request):
+        if request.url.path == "/contact":
+            return httpx.Response(200, html="<html>contact</html>")
+        return httpx.Response(301, headers={"location": "/contact"})
+
+    assert asyncio.run(fetcher_with(handler).fetch(PUBLIC + "/")) == "<html>contact</html>"
+    looping = fetcher_with(lambda request: httpx.Response(302, headers={"location": "/again"}))
+    assert asyncio.run(looping.fetch(PUBLIC + "/")) == ""
+
+
+def test_response_is_capped():
+    fetcher = fetcher_with(lambda request: httpx.Response(200, html="x" * 10_000), max_bytes=1_000)
+    assert len(asyncio.run(fetcher.fetch(PUBLIC + "/"))) == 1_000
+
+
+def test_allow_private_opt_in():
+    fetcher = fetcher_with(lambda request: httpx.Response(200, html="<html>ok</html>"), allow_private=True)
+    assert asyncio.run(fetcher.fetch("http://127.0.0.1:8000/")) == "<html>ok</html>"
+
+
+def test_host_name_resolving_to_private_address_is_not_connected(dns):
+    backend = RecordingBackend()
+    fetcher = PageFetcher(transport=PublicAddressTransport(httpx.Limits(), backend))
+    dns["answers"] = [["93.184.215.14", "10.1.2.3"], ["169.254.169.254"]]
+    assert asyncio.run(fetcher.fetch("http://mixed.example/")) == ""
+    assert asyncio.run(fetcher.fetch("http://metadata.example/")) == ""
+    assert backend.connected == []
+
+
+def test_connection_goes_to_the_checked_address(dns, monkeypatch):
+    # DNS rebinding: a public answer for the check, a private one for whoever resolves next
+    monkeypatch.setenv("HTTP_PROXY", "http://127.0.0.1:3128")
+    monkeypatch.setenv("HTTPS_PROXY", "http://127.0.0.1:3128")
+    backend = RecordingBackend()
+    fetcher = PageFetcher(transport=PublicAddressTransport(httpx.Limits(), backend))
+    dns["answers"] = [["93.184.215.14"], ["127.0.0.1"]]
+    assert asyncio.run(fetcher.fetch("http://rebind.example/")) == ""
+    assert dns["lookups"] == ["rebind.example"]
+    # No proxy from the environment, and the address connected to is the one that was checked
+    assert backend.connected == [("93.184.215.14", 80)]
+
+
+def test_fetches_through_the_checked_address(dns, monkeypatch):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = f"<html>{self.headers['Host']} (512) 555-0100</html>".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Pretend the test server's loopback address is public
+    monkeypatch.setattr(lookup_tiers, "is_public_address", lambda address: address == "127.0.0.1")
+    dns["answers"] = [["127.0.0.1"]]
+    port = server.server_address[1]
+
+    async def fetch():
+        fetcher = PageFetcher()
+        try:
+            return await fetcher.fetch(f"http://shop.example:{port}/")
+        finally:
+            await fetcher.aclose()
+
+    try:
+        assert asyncio.run(fetch()) == f"<html>shop.example:{port} (512) 555-0100</html>"
+    finally:
+        server.shutdown()
+
+
+def test_client_belongs_to_its_event_loop():
+    fetcher = fetcher_with(lambda request: httpx.Response(200, html="<html>ok</html>"))
+
+    async def fetch():
+        assert await fetcher.fetch(PUBLIC + "/") == "<html>ok</html>"
+        return fetcher._client
+
+    first = asyncio.run(fetch())
+    second = asyncio.run(fetch())
+    assert first is not second
+
+    async def close():
+        await fetcher.fetch(PUBLIC + "/")
+        client = fetcher._client
+        await fetcher.aclose()
+        return client
+
+    assert asyncio.run(close()).is_closed
+    assert fetcher._client is None
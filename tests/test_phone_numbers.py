@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from contact_rows import format_result, normalize_contact_numbers
+from phone_numbers import extract_phone_numbers, has_valid_number, normalize_phone_numbers, unverified_phone_numbers
+
+# (text of one row's numbers, valid numbers in E.164 form, entries kept as unverified)
+CASES = [
+    ("(210) 617-7200", "+12106177200", ""),
+    ("210.617.7200", "+12106177200", ""),
+    ("210-617-7200", "+12106177200", ""),
+    ("2106177200", "+12106177200", ""),
+    ("1-210-617-7200", "+12106177200", ""),
+    ("+1 (210) 617-7200", "+12106177200", ""),
+    ("1 210 617 7200", "+12106177200", ""),
+    ("(210) 617-7200, 210.617.7200", "+12106177200", ""),
+    ("210-617-7200, (512) 472-3000", "+12106177200, +15124723000", ""),
+    ("+44 20 7946 0958", "+442079460958", ""),
+    # N11 service exchanges and the 555-01XX range reserved for fiction
+    ("(210) 411-7200", "", "(210) 411-7200"),
+    ("(210) 911-7200", "", "(210) 911-7200"),
+    ("(210) 555-0123", "", "(210) 555-0123"),
+    ("(210) 555-1234", "+12105551234", ""),
+    # Exchange codes start with 2-9
+    ("(210) 117-7200", "", "(210) 117-7200"),
+    # Area codes that are not in service
+    ("(999) 617-7200", "", "(999) 617-7200"),
+    ("(123) 617-7200", "", "(123) 617-7200"),
+    # Extensions: the number is valid, the entry is kept so the extension isn't lost
+    ("(210) 617-7200 x204", "+12106177200", "(210) 617-7200 x204"),
+    ("210-617-7200 ext. 12, (512) 472-3000", "+12106177200, +15124723000", "210-617-7200 ext. 12"),
+    # Vanity and short numbers
+    ("1-800-FLOWERS", "", "1-800-FLOWERS"),
+    ("617-7200", "", "617-7200"),
+    # Text without digits is not a number that was lost
+    ("N/A", "", ""),
+    ("", "", ""),
+]
+
+
+@pytest.mark.parametrize("text, valid, unverified", CASES)
+def test_normalize_phone_numbers(text, valid, unverified):
+    assert normalize_phone_numbers(pd.Series([text])).tolist() == [valid]
+    assert unverified_phone_numbers(pd.Series([text])).tolist() == [unverified]
+
+
+@pytest.mark.parametrize("text, valid, unverified", CASES)
+def test_extract_phone_numbers_matches_the_vectorized_rules(text, valid, unverified):
+    assert ", ".join(extract_phone_numbers(text)) == valid
+    assert has_valid_number([text]) == bool(valid)
+
+
+def test_vectorized_rows_keep_their_index():
+    numbers = pd.Series([text for text, _, _ in CASES] + [None], index=range(100, 100 + len(CASES) + 1))
+    assert normalize_phone_numbers(numbers).tolist() == [valid for _, valid, _ in CASES] + [""]
+    assert unverified_phone_numbers(numbers).tolist() == [unverified for _, _, unverified in CASES] + [""]
+    assert list(unverified_phone_numbers(numbers).index) == list(numbers.index)
+
+
+def test_has_valid_number_over_a_list():
+    assert has_valid_number(["N/A", "(999) 617-7200", "(512) 472-3000"])
+    assert not has_valid_number(["1-800-FLOWERS", "(210) 555-0123"])
+    assert not has_valid_number([])
+
+
+def test_output_rows_keep_unverified_numbers():
+    rows = [(0, format_result({"contact_numbers": ["(210) 617-7200 x204", "1-800-FLOWERS"]})),
+            (1, format_result({"contact_numbers": ["(512) 472-3000"]}))]
+    normalized = [result for _, result in normalize_contact_numbers(rows)]
+    assert [result["contact_numbers"] for result in normalized] == ["+12106177200", "+15124723000"]
+    assert [result["unverified_numbers"] for result in normalized] == ["(210) 617-7200 x204, 1-800-FLOWERS", ""]
@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+
+from preprocess import dedup_keys, normalize_addresses, normalize_business_names, normalize_urls
+
+NAME_CASES = [
+    ("Acme", "acme"),
+    ("  ACME  ", "acme"),
+    ("The Balloons Boutique, LLC.", "balloons boutique"),
+    ("Acme Inc", "acme"),
+    ("ACME, L.L.C.", "acme"),
+    ("Acme Corp.", "acme"),
+    ("Acme Holdings Co. Ltd", "acme holdings"),
+    ("Smith & Sons", "smith and sons"),
+    ("Smith & Co", "smith"),
+    ("O'Brien's Pub", "o brien s pub"),
+    # Only a leading "the" and trailing designators are dropped
+    ("Theater Inc of Austin", "theater inc of austin"),
+    ("Company Store", "company store"),
+    (None, ""),
+]
+
+ADDRESS_CASES = [
+    ("10 Main Street", "10 main st"),
+    ("10 MAIN ST.", "10 main st"),
+    ("10 Main Street,\nSuite B", "10 main st ste b"),
+    ("500 North Lamar Boulevard, Austin, TX 78703-1234", "500 n lamar blvd austin tx 78703"),
+    ("1 Congress Avenue, Austin, TX, USA", "1 congress ave austin tx"),
+    ("2 Elm Lane Apartment 4", "2 elm ln apt 4"),
+    ("3 Oak Parkway   Floor 2", "3 oak pkwy fl 2"),
+    ("4 Pine Road, #12", "4 pine rd 12"),
+    # Whole words only
+    ("7 Eastwood Drive", "7 eastwood dr"),
+    (None, ""),
+]
+
+URL_CASES = [
+    ("https://www.Acme.com/", "acme.com"),
+    ("http://acme.com", "acme.com"),
+    ("acme.com//", "acme.com"),
+    ("www2.acme.com/contact/", "acme.com/contact"),
+    ("https://acme.com/?utm_source=ad", "acme.com"),
+    ("https://acme.com/about#team", "acme.com/about"),
+    (" HTTPS://ACME.COM ", "acme.com"),
+    (None, ""),
+]
+
+
+@pytest.mark.parametrize("name, expected", NAME_CASES)
+def test_normalize_business_names(name, expected):
+    assert normalize_business_names(pd.Series([name])).tolist() == [expected]
+
+
+@pytest.mark.parametrize("address, expected", ADDRESS_CASES)
+def test_normalize_addresses(address, expected):
+    assert normalize_addresses(pd.Series([address])).tolist() == [expected]
+
+
+@pytest.mark.parametrize("url, expected", URL_CASES)
+def test_normalize_urls(url, expected):
+    assert normalize_urls(pd.Series([url])).tolist() == [expected]
+
+
+def _row(name="Acme", address="10 Main Street, Austin, TX", web_page="", other_info=""):
+    return {"Business_Name": name, "Address": address, "web_page": web_page, "other_info": other_info}
+
+
+# Pairs of rows that are one dedup cluster
+SAME = [
+    (_row(), _row(name="ACME, Inc.", address="10 main st.,  austin,\ntx")),
+    (_row(address="10 Main Street Suite 200, Austin, TX 78701"), _row(address="10 Main St Ste 200, Austin, TX 78701-2245")),
+    (_row(web_page="https://www.acme.com/"), _row(web_page="acme.com")),
+    (_row(other_info="Owner:  Jane Doe"), _row(other_info="owner: jane doe")),
+]
+
+# Pairs of rows that must be looked up separately
+DISTINCT = [
+    (_row(address="10 Main St Ste 200, Austin, TX"), _row(address="10 Main St Ste 300, Austin, TX")),
+    (_row(address="10 Main St, Austin, TX"), _row(address="10 Main St, Dallas, TX")),
+    (_row(address="10 Main St, Austin, TX"), _row(address="100 Main St, Austin, TX")),
+    (_row(address="10 North Main St"), _row(address="10 South Main St")),
+    (_row(name="Acme"), _row(name="Acme Plumbing")),
+    (_row(web_page="acme.com"), _row(web_page="acme.com/austin")),
+    (_row(other_info="Owner: Jane Doe"), _row(other_info="Owner: John Doe")),
+]
+
+
+@pytest.mark.parametrize("first, second", SAME)
+def test_equivalent_rows_share_a_key(first, second):
+    keys = dedup_keys(pd.DataFrame([first, second]))
+    assert keys[0] == keys[1]
+
+
+@pytest.mark.parametrize("first, second", DISTINCT)
+def test_different_rows_get_different_keys(first, second):
+    keys = dedup_keys(pd.DataFrame([first, second]))
+    assert keys[0] != keys[1]
+
+
+def test_missing_columns_count_as_empty():
+    keys = dedup_keys(pd.DataFrame([{"Business_Name": "Acme"}, {"Business_Name": "Acme", "Address": ""}]))
+    assert keys[0] == keys[1]
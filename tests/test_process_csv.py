@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from backend import main
+from batch_runner import BatchLookupError, BatchRunner
+from failures import CLIENT
+
+
+@pytest.fixture
+def backend_store(store, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "job_store", store)
+    # Output files go to ./temp
+    monkeypatch.chdir(tmp_path)
+    return store
+
+
+def _write_input(path, rows: int) -> str:
+    pd.DataFrame({
+        "Business_Name": [f"Business {i}" for i in range(rows)],
+        "Address": [f"{i} Main St, Austin, TX" for i in range(rows)],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_store_writes_run_off_the_event_loop(backend_store, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "RESULT_FLUSH_INTERVAL", 0.01)
+    loop_thread = threading.get_ident()
+    writers = set()
+    save_results = backend_store.save_results
+
+    def slow_save(*args, **kwargs):
+        writers.add(threading.get_ident())
+        # A write waiting on another process's lock
+        time.sleep(0.3)
+        save_results(*args, **kwargs)
+
+    async def lookup(prompt, tier_stats=None, foreground=False):
+        await asyncio.sleep(0.001)
+        return {"business_name": prompt, "business_address": "", "contact_numbers": "+15125550100",
+                "search_resources": ""}
+
+    monkeypatch.setattr(backend_store, "save_results", slow_save)
+    monkeypatch.setattr(main, "process_row", lookup)
+    input_path = _write_input(tmp_path / "input.csv", 200)
+    backend_store.create_job("job", status="queued")
+
+    async def scenario():
+        lags = []
+
+        async def probe():
+            while True:
+                start = time.monotonic()
+                await asyncio.sleep(0.005)
+                lags.append(time.monotonic() - start)
+
+        prober = asyncio.create_task(probe())
+        await main.process_csv_data("job", input_path)
+        prober.cancel()
+        return max(lags)
+
+    max_lag = asyncio.run(scenario())
+
+    assert loop_thread not in writers
+    assert max_lag < 0.2
+    job = backend_store.get_job("job")
+    assert job["status"] == "completed"
+    assert job["completed"] == 200
+    assert backend_store.count_results("job") == 200
+
+
+class FakeRunner(BatchRunner):
+    """Answers batches in-process. Batch "resumed" was submitted before the job was interrupted."""
+
+    def __init__(self, resumed_keys=(), extra=()):
+        super().__init__(client=None, max_requests=2)
+        self.batches = {"resumed": list(resumed_keys)}
+        # (custom_id, result) lines every batch returns after its own answers
+        self.extra = list(extra)
+        self.submitted = asyncio.Event()
+
+    async def submit(self, lines, metadata=None):
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = [json.loads(line)["custom_id"] for line in lines]
+        self.submitted.set()
+        return batch_id
+
+    async def wait(self, batch_id, on_update=None):
+        if batch_id == "resumed":
+            # Still running at OpenAI until the resumed job has submitted its new prompts
+            await self.submitted.wait()
+        return batch_id
+
+    async def iter_results(self, batch):
+        for key in self.batches[batch]:
+            yield key, {"business_name": key, "business_address": "", "contact_numbers": "",
+                        "search_resources": ""}
+        for key, result in self.extra:
+            yield key, result
+
+
+def _keys(input_path: str) -> list:
+    return [str(key) for key in main._prepare_chunk(pd.read_csv(input_path, dtype=str))[1]]
+
+
+def test_resumed_batch_job_submits_while_reading(backend_store, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "INGEST_CHUNK_ROWS", 2)
+    input_path = _write_input(tmp_path / "input.csv", 6)
+    keys = _keys(input_path)
+    runner = FakeRunner(resumed_keys=keys[:2])
+    monkeypatch.setattr(main, "batch_runner", runner)
+    backend_store.create_job("job", status="processing", mode="batch", batches={
+        "resumed": {"status": "in_progress", "total": 2, "completed": 0, "failed": 0, "collected": False, "rows": 2},
+    })
+
+    asyncio.run(asyncio.wait_for(main.process_csv_batch("job", input_path), 5))
+
+    # Rows 0-1 were answered by the resumed batch; the rest went out during ingest, without waiting for it
+    assert [runner.batches[batch_id] for batch_id in ("batch-1", "batch-2")] == [keys[2:4], keys[4:6]]
+    job = backend_store.get_job("job")
+    assert job["status"] == "completed"
+    assert job["completed"] == 6
+    assert all(info["collected"] for info in job["batches"].values())
+
+
+def test_answers_for_resolved_prompts_are_ignored(backend_store, monkeypatch, tmp_path):
+    input_path = _write_input(tmp_path / "input.csv", 2)
+    keys = _keys(input_path)
+    # An error line for a prompt the batch already answered
+    runner = FakeRunner(extra=[(keys[0], BatchLookupError("bad request", CLIENT))])
+    runner.submitted.set()
+    monkeypatch.setattr(main, "batch_runner", runner)
+    backend_store.create_job("job", status="queued", mode="batch")
+
+    asyncio.run(main.process_csv_batch("job", input_path))
+
+    job = backend_store.get_job("job")
+    assert job["completed"] == 2 and job["failed"] == 0
+    assert job["failures"]["final"] == {}
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from rate_limiter import AdaptiveRateLimiter, _Bucket, parse_reset_duration
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    # Only the limiter's clock: the event loop keeps real time
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.mark.parametrize("value, seconds", [
+    (None, 0.0), ("0.5", 0.5), ("20ms", 0.02), ("1s", 1.0), ("6m0s", 360.0), ("1h2m3.5s", 3723.5), ("", 0.0),
+])
+def test_parse_reset_duration(value, seconds):
+    assert parse_reset_duration(value) == pytest.approx(seconds)
+
+
+def test_bucket_refills_at_its_per_minute_rate(clock):
+    bucket = _Bucket(600)
+    bucket.level = 0
+    bucket.refill(clock.now + 1)
+    assert bucket.level == pytest.approx(10)
+    # Never past the limit
+    bucket.refill(clock.now + 3600)
+    assert bucket.level == 600
+
+
+def test_bucket_wait_time(clock):
+    bucket = _Bucket(600)
+    bucket.level = 5
+    assert bucket.wait_time(5) == 0
+    assert bucket.wait_time(15) == pytest.approx(1.0)
+    # More than the whole bucket only waits for a full bucket
+    assert bucket.wait_time(6000) == pytest.approx(59.5)
+
+
+def test_headers_sync_both_buckets(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=5000, tokens_per_minute=4_000_000)
+    limiter.update_from_headers({
+        "x-ratelimit-limit-requests": "10000", "x-ratelimit-remaining-requests": "42",
+        "x-ratelimit-limit-tokens": "2000000", "x-ratelimit-remaining-tokens": "150000",
+    })
+    assert limiter.requests.limit == 10000 and limiter.requests.level == 42
+    assert limiter.tokens.limit == 2_000_000 and limiter.tokens.level == 150_000
+
+
+def test_headers_never_raise_the_local_level(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=600)
+    limiter.requests.level = 10
+    # Calls this process started after the server counted these are not in `remaining` yet
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "500"})
+    assert limiter.requests.level == 10
+
+
+def test_empty_bucket_waits_for_the_server_reset(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=600)
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "6s"})
+    assert limiter._delay(1, clock.now) == pytest.approx(6.1)
+    clock.now += 6.1
+    assert limiter._delay(1, clock.now) == 0
+
+
+def test_window_doubles_per_round_trip_until_the_first_rate_limit(clock):
+    limiter = AdaptiveRateLimiter(initial_concurrency=10, max_concurrency=1000)
+    # One success per slot in the window is one round trip
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.concurrency == 20
+    limiter.on_rate_limited()
+    assert limiter.concurrency == 10
+    # Then additive: one slot per round trip
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.concurrency == pytest.approx(11, abs=0.1)
+
+
+def test_window_stays_within_its_bounds(clock):
+    limiter = AdaptiveRateLimiter(initial_concurrency=4, max_concurrency=5, min_concurrency=2)
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.concurrency == 5
+    for _ in range(5):
+        clock.now += 2
+        limiter.on_rate_limited()
+    assert limiter.concurrency == 2
+
+
+def test_a_burst_of_429s_halves_the_window_once(clock):
+    limiter = AdaptiveRateLimiter(initial_concurrency=64)
+    for _ in range(20):
+        limiter.on_rate_limited()
+    assert limiter.concurrency == 32
+    assert limiter.rate_limited == 20
+    clock.now += 1.5
+    limiter.on_rate_limited()
+    assert limiter.concurrency == 16
+
+
+def test_retry_after_pauses_every_caller(clock):
+    limiter = AdaptiveRateLimiter()
+    limiter.on_rate_limited({"retry-after": "3"})
+    assert limiter._delay(1, clock.now) == pytest.approx(3)
+    # A shorter retry-after doesn't cut the pause short
+    limiter.on_rate_limited({"retry-after": "1"})
+    clock.now += 2
+    assert limiter._delay(1, clock.now) == pytest.approx(1)
+    clock.now += 1
+    assert limiter._delay(1, clock.now) == 0
+
+
+def test_acquire_waits_out_the_pause():
+    limiter = AdaptiveRateLimiter()
+    limiter.on_rate_limited({"retry-after": "0.3"})
+
+    async def call():
+        start = time.monotonic()
+        async with limiter.slot(100):
+            return time.monotonic() - start
+
+    waited = asyncio.run(call())
+    assert 0.25 <= waited < 1.0
+    assert limiter.in_flight == 0
+
+
+def test_callers_wait_for_a_free_slot():
+    limiter = AdaptiveRateLimiter(initial_concurrency=2)
+    active, peak = 0, 0
+
+    async def call():
+        nonlocal active, peak
+        async with limiter.slot(1):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def calls():
+        await asyncio.gather(*[call() for _ in range(10)])
+
+    asyncio.run(calls())
+    assert peak == 2
+    assert limiter.in_flight == 0
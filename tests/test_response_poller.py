@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import response_poller
+from response_poller import ResponsePoller
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps to the next timer instead of sleeping until it."""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+        select = self._selector.select
+
+        def _select(timeout=None):
+            if timeout:
+                self.now += timeout
+            return select(0)
+
+        self._selector.select = _select
+
+    def time(self) -> float:
+        return self.now
+
+
+class FakeResponses:
+    """`client.responses`: each response stays in progress for its number of retrieves."""
+
+    def __init__(self, loop: VirtualTimeLoop, pending_polls: dict):
+        self.loop = loop
+        self.pending_polls = dict(pending_polls)
+        self.polls = []
+
+    async def retrieve(self, response_id):
+        self.polls.append((self.loop.time(), response_id))
+        self.pending_polls[response_id] -= 1
+        status = "in_progress" if self.pending_polls[response_id] > 0 else "completed"
+        return SimpleNamespace(id=response_id, status=status)
+
+
+async def _drain() -> None:
+    await asyncio.gather(*(asyncio.all_tasks() - {asyncio.current_task()}), return_exceptions=True)
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    loop = VirtualTimeLoop()
+    # The poller's clock is the loop's virtual clock
+    monkeypatch.setattr(response_poller, "time", SimpleNamespace(monotonic=loop.time))
+    yield loop
+    # Let the poller's scheduler run out its idle wait and exit
+    loop.run_until_complete(_drain())
+    loop.close()
+
+
+def _poller(loop, pending_polls, **kwargs):
+    responses = FakeResponses(loop, pending_polls)
+    return ResponsePoller(SimpleNamespace(responses=responses), **kwargs), responses
+
+
+def _queued(response_id):
+    return SimpleNamespace(id=response_id, status="queued")
+
+
+def test_poll_interval_backs_off(loop):
+    poller, responses = _poller(loop, {"resp": 8}, initial_interval=0.5, max_interval=3.0, backoff=1.5)
+
+    result = loop.run_until_complete(poller.wait(_queued("resp")))
+
+    assert result.status == "completed"
+    times = [at for at, _ in responses.polls]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert times[0] == pytest.approx(0.5, abs=0.01)
+    # 0.75, 1.125, 1.6875, 2.53, then capped at max_interval
+    assert gaps == pytest.approx([0.75, 1.125, 1.6875, 2.53125, 3.0, 3.0, 3.0], abs=0.01)
+    assert poller.stats()["retrieves_per_response"] == 8
+
+
+def test_polls_share_a_global_budget(loop):
+    ids = [f"resp-{i}" for i in range(50)]
+    poller, responses = _poller(loop, dict.fromkeys(ids, 1), max_polls_per_second=10, initial_interval=0.5)
+
+    async def wait_all():
+        return await asyncio.gather(*[poller.wait(_queued(response_id)) for response_id in ids])
+
+    results = loop.run_until_complete(wait_all())
+
+    assert all(result.status == "completed" for result in results)
+    times = sorted(at for at, _ in responses.polls)
+    assert len(times) == 50
+    # A full bucket of 10 polls goes out at once, then no more than 10 per second
+    assert times[9] == pytest.approx(0.5, abs=0.01)
+    for i in range(10, 50):
+        assert times[i] >= 0.5 + (i - 9) * 0.1 - 0.01
+    assert times[-1] == pytest.approx(4.6, abs=0.2)
+
+
+def test_cancelled_waiter_is_not_polled_again(loop):
+    poller, responses = _poller(loop, {"cancelled": 100, "kept": 3}, initial_interval=0.5)
+
+    async def scenario():
+        cancelled = asyncio.ensure_future(poller.wait(_queued("cancelled")))
+        kept = asyncio.ensure_future(poller.wait(_queued("kept")))
+        await asyncio.sleep(0.6)
+        # Polled once and scheduled again, 0.75s later
+        cancelled.cancel()
+        result = await kept
+        # Long enough for the scheduler's idle wait (max_interval) to run out
+        await asyncio.sleep(30)
+        return cancelled, result
+
+    cancelled, result = loop.run_until_complete(scenario())
+
+    assert cancelled.cancelled()
+    assert result.status == "completed"
+    assert [response_id for _, response_id in responses.polls].count("cancelled") == 1
+    assert poller.stats()["pending"] == 0
+    # The scheduler stops once nothing is pending
+    assert poller._task.done()
+
+
+def test_finished_responses_are_not_polled(loop):
+    poller, responses = _poller(loop, {})
+    response = SimpleNamespace(id="resp", status="completed")
+    assert loop.run_until_complete(poller.wait(response)) is response
+    assert responses.polls == []
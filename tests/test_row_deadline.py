@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import WebSearchLLM
+from failures import TIMEOUT, LookupFailure
+
+
+@pytest.fixture
+def slow_calls(monkeypatch):
+    """Every model call takes 0.15s and finds no phone number; returns the calls started/cancelled."""
+    calls = {"started": 0, "cancelled": 0}
+
+    async def completion(prompt, template=None, usage=None):
+        calls["started"] += 1
+        try:
+            await asyncio.sleep(0.15)
+        except asyncio.CancelledError:
+            calls["cancelled"] += 1
+            raise
+        return '{"business_name": "Acme", "business_address": "", "contact_numbers": [], "search_resources": ""}'
+
+    monkeypatch.setattr(WebSearchLLM, "openai_completion_with_backoff", completion)
+    monkeypatch.setattr(WebSearchLLM, "LOOKUP_TIERS", ["search_low", "search_high"])
+    monkeypatch.setattr(WebSearchLLM, "PHONE_RETRY_ATTEMPTS", 1)
+    return calls
+
+
+def test_deadline_spans_tiers_and_retries(slow_calls, monkeypatch):
+    # Each call is well within any per-call limit, but three of them are not within the row's deadline
+    monkeypatch.setattr(WebSearchLLM, "ROW_DEADLINE_SECONDS", 0.35)
+    with pytest.raises(LookupFailure) as error:
+        asyncio.run(WebSearchLLM.llm_contact_search("Acme, Austin"))
+    assert error.value.kind == TIMEOUT
+    assert slow_calls == {"started": 3, "cancelled": 1}
+
+
+def test_lookup_within_deadline(slow_calls, monkeypatch):
+    monkeypatch.setattr(WebSearchLLM, "ROW_DEADLINE_SECONDS", 5)
+    result = asyncio.run(WebSearchLLM.llm_contact_search("Acme, Austin"))
+    assert result["business_name"] == "Acme"
+    assert slow_calls == {"started": 3, "cancelled": 0}
+
+
+def test_zero_disables_the_deadline(slow_calls, monkeypatch):
+    monkeypatch.setattr(WebSearchLLM, "ROW_DEADLINE_SECONDS", 0)
+    assert asyncio.run(WebSearchLLM.llm_contact_search("Acme, Austin"))["business_name"] == "Acme"
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"contact_numbers": ["5125550100"]}
+
+    async def scenario():
+        return await asyncio.gather(*[flights.do("key", lookup) for _ in range(3)])
+
+    results = asyncio.run(scenario())
+    assert results == [{"contact_numbers": ["5125550100"]}] * 3
+    assert calls == [1]
+    assert flights.stats() == {"calls": 1, "coalesced": 2, "in_flight": 0}
+
+
+def test_exception_reaches_every_waiter():
+    flights = SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def scenario():
+        return await asyncio.gather(flights.do("key", lookup), flights.do("key", lookup), return_exceptions=True)
+
+    assert [str(error) for error in asyncio.run(scenario())] == ["provider down"] * 2
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_cancelled_waiter_leaves_the_call_to_the_others():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def lookup():
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "result"
+
+    async def scenario():
+        first = asyncio.create_task(flights.do("key", lookup))
+        second = asyncio.create_task(flights.do("key", lookup))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "result"
+    assert cancelled == []
+
+
+def test_call_is_cancelled_and_forgotten_when_every_waiter_leaves():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def lookup():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def scenario():
+        waiters = [asyncio.create_task(flights.do("key", lookup)) for _ in range(2)]
+        await asyncio.sleep(0.02)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)  # let the shared task's cancellation and done callback run
+        in_flight = flights.stats()["in_flight"]
+        # A new call for the key starts over instead of joining the cancelled one
+        result = await flights.do("key", lambda: asyncio.sleep(0, result="again"))
+        return in_flight, result
+
+    assert asyncio.run(scenario()) == (0, "again")
+    assert cancelled == [1]
+    assert flights.stats()["calls"] == 2
@@ -0,0 +1,197 @@
+"""
+Standalone worker processes for jobs uploaded with JOB_EXECUTION=workers.
+
+The web server only splits uploads into chunks in the job store; these processes lease
+chunks, run the lookups and write the results back, so lookups scale with the number of
+processes while the web tier stays responsive:
+
+    python worker.py --processes 4
+
+Every process must use the same JOB_STORE_PATH (and LOOKUP_CACHE_PATH) as the web server.
+With --metrics-port, process i serves its Prometheus metrics on that port + i.
+"""
+
+import os
+import time
+import socket
+import asyncio
+import argparse
+import logging
+import multiprocessing
+from typing import Dict
+
+from contact_rows import format_result, error_result, normalize_contact_numbers
+from job_store import JobStore
+from lookup_tiers import TierStats
+from failures import FailureReport, RetryPolicy, classify_failure
+from metrics import FAILED_ATTEMPTS, ROWS, TraceWriter, row_trace, serve_metrics, trace_path
+
+logger = logging.getLogger(__name__)
+
+# Seconds a leased chunk stays reserved for its worker; renewed while the worker is busy with it
+LEASE_SECONDS = float(os.getenv("WORKER_LEASE_SECONDS", 120))
+# Chunks each process works on at the same time (each chunk is WORKER_CHUNK_ROWS rows)
+CHUNKS_PER_PROCESS = int(os.getenv("WORKER_CHUNKS_PER_PROCESS", 10))
+# How often a busy worker checks whether the chunk's job was cancelled
+CANCEL_CHECK_SECONDS = 2.0
+# How long an idle worker waits before asking for work again
+IDLE_POLL_SECONDS = 1.0
+# Failed rows are written back as retry chunks that become available after a backoff (ROW_RETRY_*)
+retry_policy = RetryPolicy.from_env()
+
+
+async def _process_chunk(store: JobStore, chunk: Dict, owner: str) -> None:
+    # Imported here so the OpenAI client and rate limiter are created inside the worker process
+    from WebSearchLLM import llm_contact_search, api_scheduler
+
+    job_id, chunk_index = chunk["job_id"], chunk["chunk_index"]
+    tier_stats = TierStats()
+    failures = FailureReport()
+    job = await asyncio.to_thread(store.get_job, job_id)
+    traces = TraceWriter(trace_path(job_id)) if job and job.get("trace") else None
+
+    async def _lookup(index: int, prompt: str, retries: int):
+        with row_trace(row_index=index, retries=retries) as trace:
+            try:
+                result = format_result(await llm_contact_search(prompt, tier_stats))
+                if retries:
+                    failures.recovered()
+                return result, None
+            except Exception as e:
+                failures.failed_attempt(e)
+                FAILED_ATTEMPTS.inc(kind=classify_failure(e))
+                trace["failure"] = classify_failure(e)
+                return None, e
+            finally:
+                if traces is not None:
+                    traces.add(trace)
+
+    job_cancelled = False
+
+    async def _keep_lease() -> None:
+        nonlocal job_cancelled
+        renewed = time.monotonic()
+        while True:
+            await asyncio.sleep(CANCEL_CHECK_SECONDS)
+            job = await asyncio.to_thread(store.get_job, job_id)
+            if job is None or job.get("cancel_requested"):
+                # Cancelling the lookups also cancels their in-flight background responses
+                job_cancelled = True
+                lookups.cancel()
+                return
+            if time.monotonic() - renewed > LEASE_SECONDS / 3:
+                await asyncio.to_thread(store.renew_lease, job_id, chunk_index, owner, LEASE_SECONDS)
+                renewed = time.monotonic()
+
+    # Rows of a retry chunk carry how often they have been retried already
+    chunk_rows = [(row[0], row[1], row[2] if len(row) > 2 else 0) for row in chunk["rows"]]
+    # Chunks of different jobs in this process share its OpenAI capacity by job priority
+    api_scheduler.register(job_id, (job or {}).get("priority", "bulk"))
+    with api_scheduler.running(job_id):
+        lookups = asyncio.gather(*[_lookup(index, prompt, retries) for index, prompt, retries in chunk_rows])
+    renewer = asyncio.create_task(_keep_lease())
+    try:
+        outcomes = await lookups
+    except asyncio.CancelledError:
+        if not job_cancelled:
+            raise
+        # The job was cancelled: drop the chunk. Nobody leases it while the job is inactive; expiring
+        # the lease lets a resumed job pick it up right away
+        await asyncio.to_thread(store.renew_lease, job_id, chunk_index, owner, 0)
+        logger.info(f"Dropped chunk {chunk_index} of cancelled job {job_id}")
+        return
+    finally:
+        renewer.cancel()
+        api_scheduler.unregister(job_id)
+
+    rows, deferred, delays = [], [], []
+    completed = 0
+    for (index, prompt, retries), (result, error) in zip(chunk_rows, outcomes):
+        if error is None:
+            rows.append((index, result))
+            completed += 1
+        elif retry_policy.should_retry(error, retries):
+            # Goes back to the job store as a retry chunk instead of being retried in this process
+            failures.deferred()
+            deferred.append((index, prompt, retries + 1))
+            delays.append(retry_policy.delay(error, retries))
+        else:
+            failures.gave_up(error)
+            rows.append((index, error_result(error)))
+    ROWS.inc(completed, outcome="completed")
+    ROWS.inc(len(rows) - completed, outcome="failed")
+    ROWS.inc(len(deferred), outcome="deferred")
+    if traces is not None:
+        await asyncio.to_thread(traces.flush)
+    rows = normalize_contact_numbers(rows)
+    await asyncio.to_thread(store.complete_chunk, job_id, chunk_index, rows, completed, len(rows) - completed,
+                            {"tiers": tier_stats.counters, "failures": failures.counters},
+                            deferred, time.time() + max(delays, default=0.0))
+
+
+async def run_worker(store: JobStore, owner: str, chunks_per_process: int = CHUNKS_PER_PROCESS) -> None:
+    """Lease and process chunks forever, keeping up to `chunks_per_process` in progress."""
+
+    async def _loop() -> None:
+        while True:
+            chunk = await asyncio.to_thread(store.lease_chunk, owner, LEASE_SECONDS)
+            if chunk is None:
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+                continue
+            try:
+                await _process_chunk(store, chunk, owner)
+            except Exception as e:
+                # The lease expires and another worker retries the chunk
+                logger.error(f"Chunk {chunk['chunk_index']} of job {chunk['job_id']} failed: {e}")
+
+    from WebSearchLLM import page_fetcher
+
+    try:
+        await asyncio.gather(*[_loop() for _ in range(chunks_per_process)])
+    finally:
+        await page_fetcher.aclose()
+
+
+def _worker_main(chunks_per_process: int, metrics_port: int = None) -> None:
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Worker {owner} started")
+    if metrics_port:
+        serve_metrics(metrics_port)
+    try:
+        asyncio.run(run_worker(JobStore.from_env(), owner, chunks_per_process))
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes to start")
+    parser.add_argument("--chunks-per-process", type=int, default=CHUNKS_PER_PROCESS,
+                        help="chunks each process works on concurrently")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics, process i on this port + i")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def _start(i: int) -> multiprocessing.Process:
+        port = args.metrics_port + i if args.metrics_port else None
+        process = multiprocessing.Process(target=_worker_main, args=(args.chunks_per_process, port), daemon=True)
+        process.start()
+        return process
+
+    processes = [_start(i) for i in range(args.processes)]
+    try:
+        while any(process.is_alive() for process in processes):
+            # Restart workers that crashed so the pool keeps its size
+            for i, process in enumerate(processes):
+                if not process.is_alive() and process.exitcode not in (0, None):
+                    logger.warning(f"Worker {process.pid} exited with {process.exitcode}; restarting")
+                    processes[i] = _start(i)
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()